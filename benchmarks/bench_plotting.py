@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+:Module: bench_plotting.py
+
+:Author: Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center, http://www.usgs.gov/
+
+:Synopsis: Benchmark of saving a plot with nwispy_viewer.render_parameter for series of different lengths, with and without decimation of the series, and of saving a preview thumbnail with nwispy_viewer.render_preview.
+"""
+
+__author__   = "Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center."
+__copyright__ = "http://www.usgs.gov/visual-id/credit_usgs.html#copyright"
+__license__   = __copyright__
+__contact__   = __author__
+
+import os, sys
+import argparse
+import shutil
+import tempfile
+import time
+import datetime
+import numpy as np
+
+# plots are saved, never shown
+import matplotlib
+matplotlib.use("Agg")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from nwispy import nwispy_viewer
+
+def create_data(length, minutes = 15):
+    """
+    Return nwis data of a single synthetic discharge series with a value 
+    every number of minutes and a gap of missing values.
+    """
+    dates = np.array([datetime.datetime(2000, 1, 1) + datetime.timedelta(minutes = minutes * i) for i in range(length)])
+    values = 100.0 + 50.0 * np.sin(np.linspace(0, 20 * np.pi, length)) + np.random.RandomState(0).rand(length) * 10.0
+    values[length // 3:length // 3 + length // 100] = np.nan
+
+    data = {
+        "gage_name": "USGS 03290500 KENTUCKY RIVER AT LOCK 2 AT LOCKPORT, KY",
+        "timestep": "instantaneous",
+        "dates": dates,
+        "parameters": [{"code": "01_00060", "description": "Discharge, cubic feet per second", "index": 4, "data": values,
+                        "mean": np.nanmean(values), "max": np.nanmax(values), "min": np.nanmin(values)}]
+    }
+
+    return data
+
+def run_benchmark(length, decimate, repeat, render = nwispy_viewer.render_parameter):
+    """ Return the best time in seconds of saving the plot of a series of a length with a render function of nwispy_viewer """
+
+    data = create_data(length)
+    tempdir = tempfile.mkdtemp()
+    try:
+        times = []
+        for i in range(repeat):
+            start_time = time.time()
+            render(nwis_data = data, parameter = data["parameters"][0], save_path = tempdir, decimate = decimate)
+            times.append(time.time() - start_time)
+    finally:
+        shutil.rmtree(tempdir)
+
+    return min(times)
+
+def main():
+    """ Run the benchmark for each series length """
+
+    parser = argparse.ArgumentParser(description = "Benchmark saving nwispy plots and previews of long series with and without decimation.")
+    parser.add_argument('--lengths', type = int, nargs = '+', default = [1000, 10000, 100000, 350000], 
+                        help = 'Numbers of values of the series to measure; 350000 is about 10 years of 15 minute data (default: %(default)s)')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'Number of times to save each plot; the best time is shown (default: %(default)s)')
+    args = parser.parse_args()
+
+    print("{:>8} {:>12} {:>14} {:>8} {:>12}".format("values", "full (s)", "decimated (s)", "speedup", "preview (s)"))
+
+    for length in args.lengths:
+        full = run_benchmark(length = length, decimate = False, repeat = args.repeat)
+        decimated = run_benchmark(length = length, decimate = True, repeat = args.repeat)
+        preview = run_benchmark(length = length, decimate = True, repeat = args.repeat, render = nwispy_viewer.render_preview)
+        print("{:>8} {:>12.3f} {:>14.3f} {:>8.1f} {:>12.3f}".format(length, full, decimated, full / decimated, preview))
+
+if __name__ == "__main__":
+    main()
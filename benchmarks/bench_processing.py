@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+:Module: bench_processing.py
+
+:Author: Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center, http://www.usgs.gov/
+
+:Synopsis: Benchmark of processing a batch of data files with nwispy.process_files at different numbers of worker processes. Measures files per second and the speedup over a single process.
+"""
+
+__author__   = "Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center."
+__copyright__ = "http://www.usgs.gov/visual-id/credit_usgs.html#copyright"
+__license__   = __copyright__
+__contact__   = __author__
+
+import os, sys
+import argparse
+import shutil
+import tempfile
+import time
+import multiprocessing
+import logging
+
+# plots are saved, never shown
+import matplotlib
+matplotlib.use("Agg")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from nwispy import nwispy
+
+DATAFILES = os.path.join(os.path.dirname(__file__), "..", "data", "datafiles")
+
+def create_batch(directory, copies):
+    """ Copy each data file of the repository a number of times into a directory and return the list of copies """
+
+    file_list = []
+    for i in range(copies):
+        for filename in sorted(os.listdir(DATAFILES)):
+            if filename.endswith(".txt"):
+                filepath = os.path.join(directory, "{0}-{1}".format(i, filename))
+                shutil.copy(os.path.join(DATAFILES, filename), filepath)
+                file_list.append(filepath)
+
+    return file_list
+
+def run_benchmark(file_list, jobs, extra_arguments = ()):
+    """ Return the time in seconds to process a list of files with a number of worker processes """
+
+    arguments = nwispy.create_parser().parse_args(["--jobs", str(jobs), "--replot"] + list(extra_arguments))
+
+    start_time = time.time()
+    results = nwispy.process_files(file_list = file_list, arguments = arguments)
+    duration = time.time() - start_time
+
+    failed = len([result for result in results if result["error"]])
+
+    return duration, failed
+
+def main():
+    """ Run the benchmark at each number of worker processes """
+
+    parser = argparse.ArgumentParser(description = "Benchmark processing a batch of nwispy data files with a pool of worker processes.")
+    parser.add_argument('--copies', type = int, default = 4, help = 'Number of copies of each data file of the repository in the batch (default: %(default)s)')
+    parser.add_argument('--jobs', type = int, nargs = '+', default = sorted(set([1, 2, 4, 8, multiprocessing.cpu_count()])), 
+                        help = 'Numbers of worker processes to measure (default: %(default)s)')
+    parser.add_argument('--nwispy-args', nargs = argparse.REMAINDER, default = [], help = 'Extra nwispy command line arguments, such as --preview')
+    args = parser.parse_args()
+
+    # only show errors of the runs
+    logging.disable(logging.WARNING)
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        file_list = create_batch(directory = tempdir, copies = args.copies)
+
+        print("{} files, {} cpu(s)".format(len(file_list), multiprocessing.cpu_count()))
+        print("{:>5} {:>10} {:>8} {:>8} {:>7}".format("jobs", "time (s)", "files/s", "speedup", "failed"))
+
+        baseline = None
+        for jobs in args.jobs:
+            duration, failed = run_benchmark(file_list = file_list, jobs = jobs, extra_arguments = args.nwispy_args)
+            baseline = baseline or duration
+            print("{:>5} {:>10.2f} {:>8.2f} {:>8.2f} {:>7}".format(jobs, duration, len(file_list) / duration, baseline / duration, failed))
+
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == "__main__":
+    main()
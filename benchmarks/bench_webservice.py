@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+:Module: bench_webservice.py
+
+:Author: Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center, http://www.usgs.gov/
+
+:Synopsis: Benchmark of the web service download pipeline against the local nwispy_mockservice. Measures requests per second, bytes per second, request latency, and end-to-end time of process_webrequest at different numbers of concurrent downloads.
+"""
+
+__author__   = "Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center."
+__copyright__ = "http://www.usgs.gov/visual-id/credit_usgs.html#copyright"
+__license__   = __copyright__
+__contact__   = __author__
+
+import os, sys
+import argparse
+import shutil
+import tempfile
+import time
+import datetime
+import logging
+
+# plots are saved, never shown
+import matplotlib
+matplotlib.use("Agg")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from nwispy import nwispy
+from nwispy import nwispy_webservice
+from nwispy import nwispy_mockservice
+
+def percentile(values, fraction):
+    """
+    Return the value at a fraction (0 to 1) of a list of values, using the
+    nearest rank.
+    """
+    values = sorted(values)
+    if not values:
+        return float("nan")
+
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+
+    return values[index]
+
+def run_benchmark(server, requests, jobs, data_type, days, extra_arguments = ()):
+    """
+    Process a request file of synthetic requests with process_webrequest and
+    return the measurements of the run.
+
+    Parameters
+    ----------
+    server : nwispy_mockservice.MockServiceServer
+        The running stand-in web service.
+    requests : int
+        Number of requests (sites) in the request file.
+    jobs : int
+        Number of concurrent downloads.
+    data_type : str
+        String of intantaneous data (iv) or daily data (dv).
+    days : int
+        Number of days of data in each request.
+    extra_arguments : list of str
+        Extra nwispy command line arguments.
+
+    Returns
+    -------
+    result : dictionary
+        Dictionary of the measurements of the run.
+    """
+    tempdir = tempfile.mkdtemp()
+    try:
+        request_file = os.path.join(tempdir, "requests.txt")
+        data_requests = [{"data type": data_type,
+                          "site number": "{:08d}".format(3000000 + i),
+                          "start date": "2014-01-01",
+                          "end date": (datetime.date(2014, 1, 1) + datetime.timedelta(days - 1)).isoformat(),
+                          "parameters": ["00060", "00065"]} for i in range(requests)]
+        nwispy_webservice.write_webrequest(filepath = request_file, data_requests = data_requests)
+
+        arguments = nwispy.create_parser().parse_args(["-web", request_file, "--base-url", server.base_url,
+                                                       "--download-jobs", str(jobs), "--backoff", "0.01"] + list(extra_arguments))
+
+        bytes_sent = server.stats["bytes sent"]
+
+        start_time = time.time()
+        report = nwispy.process_webrequest(request_file = request_file, arguments = arguments)
+        end_to_end = time.time() - start_time
+
+        bytes_sent = server.stats["bytes sent"] - bytes_sent
+
+    finally:
+        shutil.rmtree(tempdir)
+
+    result = {
+        "jobs": jobs,
+        "requests": requests,
+        "failed": len(report["failed"]),
+        "requests per second": len(report["succeeded"]) / report["duration"],
+        "bytes per second": bytes_sent / report["duration"],
+        "latency p50": percentile(report["latencies"], 0.5),
+        "latency p95": percentile(report["latencies"], 0.95),
+        "download": report["duration"],
+        "end to end": end_to_end
+    }
+
+    return result
+
+def print_results(results):
+    """ Print a table of benchmark results """
+
+    print("{:>5} {:>9} {:>7} {:>10} {:>10} {:>9} {:>9} {:>10} {:>11}".format(
+          "jobs", "requests", "failed", "req/s", "KB/s", "p50 (s)", "p95 (s)", "download", "end to end"))
+
+    for result in results:
+        print("{:>5} {:>9} {:>7} {:>10.1f} {:>10.1f} {:>9.3f} {:>9.3f} {:>10.2f} {:>11.2f}".format(
+              result["jobs"], result["requests"], result["failed"], result["requests per second"],
+              result["bytes per second"] / 1024.0, result["latency p50"], result["latency p95"],
+              result["download"], result["end to end"]))
+
+def main():
+    """ Run the benchmark at each number of concurrent downloads """
+
+    parser = argparse.ArgumentParser(description = "Benchmark nwispy web service downloads against a local stand-in web service.")
+    parser.add_argument('--requests', type = int, default = 16, help = 'Number of requests in the request file (default: %(default)s)')
+    parser.add_argument('--jobs', type = int, nargs = '+', default = [1, 2, 4, 8], help = 'Numbers of concurrent downloads to measure (default: %(default)s)')
+    parser.add_argument('--data-type', default = "iv", choices = ["dv", "iv"], help = 'Data type of the requests (default: %(default)s)')
+    parser.add_argument('--days', type = int, default = 30, help = 'Days of data in each request (default: %(default)s)')
+    parser.add_argument('--latency', type = float, default = 0.1, help = 'Seconds the web service waits before each response (default: %(default)s)')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'Fraction of requests answered with an error (default: %(default)s)')
+    parser.add_argument('--values-per-day', type = int, default = 96, help = 'Values per day of instantaneous data (default: %(default)s)')
+    parser.add_argument('--nwispy-args', nargs = argparse.REMAINDER, default = [], help = 'Extra nwispy command line arguments, such as --stream')
+    args = parser.parse_args()
+
+    server = nwispy_mockservice.start_server(latency = args.latency, error_rate = args.error_rate,
+                                             values_per_day = {"dv": 1, "iv": args.values_per_day})
+
+    # only show warnings and errors of the runs
+    logging.disable(logging.INFO)
+
+    try:
+        results = []
+        for jobs in args.jobs:
+            results.append(run_benchmark(server = server, requests = args.requests, jobs = jobs, data_type = args.data_type,
+                                         days = args.days, extra_arguments = args.nwispy_args))
+    finally:
+        nwispy_mockservice.stop_server(server)
+
+    print_results(results)
+
+if __name__ == "__main__":
+    main()
@@ -15,8 +15,14 @@ __contact__   = __author__
 
 import os, sys
 import argparse
+import multiprocessing
+import threading
+import Queue
+import time
+import _strptime  # the first strptime() call of a thread is not thread safe unless _strptime is imported before threads start
 import Tkinter, tkFileDialog
 from urllib2 import URLError, HTTPError
+from StringIO import StringIO
 import logging
 
 # my modules
@@ -29,6 +35,10 @@ import nwispy_logging
 def process_files(file_list, arguments):
     """    
     Process a list of files according to options contained in arguments parameter.
+    Files are processed in a pool of arguments.jobs worker processes, unless plots
+    are shown; the largest files are started first (see schedule_files()). A 
+    single file is parsed in this process and its plots are rendered in the pool.
+    A file that fails is logged to its error.log and does not stop the other files.
 
     Parameters
     ----------
@@ -36,29 +46,604 @@ def process_files(file_list, arguments):
         List of files to parse, process, and plot.        
     arguments : argparse object
         An argparse object containing user options.                    
+
+    Returns
+    -------
+    results : list of dictionaries
+        The result of each file, in the order of file_list; see process_file().
     """
-    for f in file_list:
-                
-        filedir, filename = nwispy_helpers.get_file_info(f)
-          
-        # create output directory     
-        outputdirpath = nwispy_helpers.make_directory(path = filedir, directory_name = '-'.join([filename.split(".txt")[0], "output"]))      
-        
-        # initialize error logging
-        nwispy_logging.initialize_loggers(output_dir = outputdirpath)        
-        
-        # read data
-        data = nwispy_filereader.read_file(f)  
+    # descriptions of sites that have been downloaded before; no sites are downloaded here
+    sites = nwispy_helpers.read_manifest(path = arguments.site_cache)
 
-        # plot data                            
-        nwispy_viewer.plot_data(data, is_visible = arguments.showplot, save_path = outputdirpath)             
-                
-        # print data
-        if arguments.verbose: 
-            nwispy_viewer.print_info(data)  
+    # one listener writes the log records of all files; see nwispy_logging.start_listener()
+    listener = nwispy_logging.start_listener()
+    try:
+        # process files in worker processes; plots that are shown need the pyplot window of this process
+        pool = None
+        if arguments.jobs > 1 and not arguments.showplot and file_list:
+            pool = multiprocessing.Pool(processes = arguments.jobs if len(file_list) == 1 else min(arguments.jobs, len(file_list)), 
+                                        initializer = nwispy_logging.initialize_worker, initargs = (listener["queue"],))
+        try:
+            if pool and len(file_list) > 1:
+                pending = {}
+                for i in schedule_files(file_list = file_list):
+                    pending[i] = pool.apply_async(process_file, kwds = {"filepath": file_list[i], "arguments": arguments, "sites": sites, "capture_output": True})
+
+                # collect results in order; printed output of each file is shown once it is done
+                results = []
+                for i in range(len(file_list)):
+                    results.append(pending[i].get())
+                    sys.stdout.write(results[-1]["output"])
+            else:
+                # a single file is parsed here and its plots are rendered in the pool
+                results = [process_file(filepath = f, arguments = arguments, sites = sites, pool = pool) for f in file_list]
+
+            if pool:
+                pool.close()
+                pool.join()
+
+        finally:
+            if pool:
+                pool.terminate()
+
+        report_results(results = results, arguments = arguments)
+
+    finally:
+        nwispy_logging.stop_listener(listener)
+
+    return results
+
+def schedule_files(file_list):
+    """    
+    Return the order to process a list of files in a pool of worker processes,
+    largest file first. The time to parse and plot a file grows with its size,
+    so starting the largest files first keeps a large file from being started 
+    last while the other workers sit idle. The files are dispatched one at a 
+    time from the shared task queue of the pool, so a worker that is done takes
+    the next largest file that has not been started yet.
+
+    Parameters
+    ----------
+    file_list : list of str
+        List of files to process.
+
+    Returns
+    -------
+    order : list of int
+        List of the positions of the files in file_list, largest file first;
+        files of the same size keep their order.
+
+    Examples
+    --------
+    >>> import nwispy
+    >>> nwispy.schedule_files(file_list = ["data/datafiles/03298500_dv.txt", "data/datafiles/03287500_uv.txt", "data/datafiles/03401385_uv.txt"])
+    [1, 2, 0]
+    """
+    sizes = [nwispy_helpers.get_data_size(path = f) for f in file_list]
+    order = sorted(range(len(file_list)), key = lambda i: sizes[i], reverse = True)
+
+    return order
+
+def report_results(results, arguments):
+    """    
+    Log the files that could not be processed and save a contact sheet of the
+    previews of the processed files if arguments.contact_sheet is set.
+
+    Parameters
+    ----------
+    results : list of dictionaries
+        The result of each file; see process_file().
+    arguments : argparse object
+        An argparse object containing user options.                    
+    """
+    failed = [result for result in results if result["error"]]
+    for result in failed:
+        # a file whose output directory could not be created has no error.log
+        log_path = "the log above"
+        if result["output directory"]:
+            log_path = os.path.join(result["output directory"], "error.log")
+        logging.error("*Failed* {0}: {1}. *Solution* - See {2}".format(result["file"], result["error"], log_path))
+
+    # one row of preview thumbnails for each file
+    previews = [result["previews"] for result in results]
+    if arguments.contact_sheet and any(previews):
+        nwispy_viewer.create_contact_sheet(filepaths = previews, sheet_path = arguments.contact_sheet)
+
+def process_file(filepath, arguments, sites = None, capture_output = False, pool = None):
+    """    
+    Parse, plot, and print a data file. Plots and the error.log of the file are 
+    saved to its own output directory, so files can be processed in separate 
+    worker processes. An error is logged and returned instead of raised.
+
+    Parameters
+    ----------
+    filepath : str
+        String path of the file to parse, process, and plot.        
+    arguments : argparse object
+        An argparse object containing user options.                    
+    sites : dictionary
+        Dictionary of site descriptions keyed by site number; see nwispy_webservice.get_site_metadata().
+    capture_output : bool
+        Boolean value to return printed output in the result instead of printing it.
+    pool : multiprocessing.Pool
+        A pool of worker processes to render the plots in; see process_data().
+
+    Returns
+    -------
+    result : dictionary
+        Dictionary of the "file", its "output directory", the paths of its 
+        "previews", the printed "output", the "error" message or None, and the
+        "durations" in seconds of its "parse" and "render" stages.
+    """
+    stdout = sys.stdout
+    if capture_output:
+        sys.stdout = StringIO()
+
+    try:
+        item = parse_data_file(filepath = filepath, arguments = arguments, sites = sites)
+        if item["data"] is not None:
+            plots = None
+            if pool:
+                plots = process_data(data = item["data"], outputdirpath = item["result"]["output directory"], arguments = arguments, pool = pool)
+            render_data(item = item, arguments = arguments, plots = plots)
+
+    finally:
+        output = ""
+        if capture_output:
+            output = sys.stdout.getvalue()
+            sys.stdout = stdout
+
+    item["result"]["output"] = output
+
+    return item["result"]
+
+def create_result(filepath, outputdirpath = None):
+    """    
+    Return an empty result of a data file; see process_file().
+
+    Parameters
+    ----------
+    filepath : str
+        String path of the data file.
+    outputdirpath : str
+        String path of the output directory of the file; see get_output_directory().
+
+    Returns
+    -------
+    result : dictionary
+        Dictionary of the "file", its "output directory", the paths of its 
+        "previews", the printed "output", the "error" message or None, and the
+        "durations" in seconds of its "parse" and "render" stages.
+    """
+    result = {"file": filepath, "output directory": outputdirpath, "previews": [], "output": "", "error": None, 
+              "durations": {"parse": 0.0, "render": 0.0}}
+
+    return result
+
+def get_output_directory(filepath):
+    """    
+    Create the output directory of a data file next to the file, named by the
+    file and ending with *-output*, and return its path.
+
+    Parameters
+    ----------
+    filepath : str
+        String path of the data file.
+
+    Returns
+    -------
+    outputdirpath : str
+        String path of the output directory.
+    """
+    filedir, filename = nwispy_helpers.get_file_info(filepath)
+    outputdirpath = nwispy_helpers.make_directory(path = filedir, directory_name = '-'.join([filename.split(".txt")[0], "output"]))
+
+    return outputdirpath
+
+def log_error(result, error):
+    """    
+    Log an error that stops a data file from being processed and save its
+    message to the result of the file.
+
+    Parameters
+    ----------
+    result : dictionary
+        The result of the file; see create_result().
+    error : Exception
+        The error that was raised.
+    """
+    logging.exception("*Error* processing {0}: {1}. *Solution* - Skipping file".format(result["file"], error))
+    result["error"] = str(error) or error.__class__.__name__
+
+def parse_data_file(filepath, arguments, sites = None):
+    """    
+    Create the output directory of a data file and parse the file; the parse 
+    stage of process_file() and process_pipeline(). Messages logged while the 
+    file is parsed go to the error.log of the file, and an error is logged and
+    saved to the result instead of raised.
+
+    Parameters
+    ----------
+    filepath : str
+        String path of the file to parse.
+    arguments : argparse object
+        An argparse object containing user options.                    
+    sites : dictionary
+        Dictionary of site descriptions keyed by site number; see nwispy_webservice.get_site_metadata().
+
+    Returns
+    -------
+    item : dictionary
+        Dictionary of the "result" of the file (see create_result()) and its 
+        parsed "data", or None if the file could not be parsed.
+    """
+    start_time = time.time()
+    item = {"result": create_result(filepath = filepath), "data": None}
+    try:
+        item["result"]["output directory"] = get_output_directory(filepath = filepath)
+
+        # only messages of this thread belong to the file; other threads may be logging at the same time
+        nwispy_logging.set_log_directory(output_dir = item["result"]["output directory"])
+        item["data"] = parse_file(filepath = filepath, arguments = arguments, sites = sites)
+
+    except Exception as error:
+        log_error(result = item["result"], error = error)
+
+    finally:
+        nwispy_logging.set_log_directory(output_dir = None)
+
+    item["result"]["durations"]["parse"] = time.time() - start_time
+
+    return item
+
+def render_data(item, arguments, plots = None):
+    """    
+    Plot and print the parsed data of a file, or wait for its plots rendered 
+    in a pool of worker processes, and save the paths of its previews to the
+    result; the render stage of process_file() and process_pipeline(). An error
+    is logged to the error.log of the file and saved to the result instead of raised.
+
+    Parameters
+    ----------
+    item : dictionary
+        Dictionary of the "result" and the parsed "data" of a file; see parse_data_file().
+    arguments : argparse object
+        An argparse object containing user options.                    
+    plots : list of multiprocessing.pool.AsyncResult
+        The pending plots of the data returned by process_data(); the data is 
+        plotted in this process if None.
+    """
+    start_time = time.time()
+    result = item["result"]
+    nwispy_logging.set_log_directory(output_dir = result["output directory"])
+    try:
+        if plots is None:
+            process_data(data = item["data"], outputdirpath = result["output directory"], arguments = arguments)
+        else:
+            for plot in plots:
+                plot.get()
+
+        result["previews"] = [nwispy_viewer.get_preview_filepath(nwis_data = item["data"], parameter = parameter, save_path = result["output directory"]) 
+                              for parameter in item["data"]["parameters"]]
+
+    except Exception as error:
+        log_error(result = result, error = error)
+
+    finally:
+        nwispy_logging.set_log_directory(output_dir = None)
+
+    result["durations"]["render"] += time.time() - start_time
+
+def parse_file(filepath, arguments, sites = None):
+    """    
+    Read a data file and add the description of its site.
+
+    Parameters
+    ----------
+    filepath : str
+        String path of the file to read.
+    arguments : argparse object
+        An argparse object containing user options.                    
+    sites : dictionary
+        Dictionary of site descriptions keyed by site number; see nwispy_webservice.get_site_metadata().
+
+    Returns
+    -------
+    data : dictionary
+        A dictionary containing data found in data file.
+    """
+    data = nwispy_filereader.read_file(filepath)  
+    nwispy_filereader.add_site_metadata(data = data, sites = sites or {})
+
+    # saved plots of the same file contents and settings are not rendered again; see nwispy_viewer.is_plot_current()
+    if not arguments.replot:
+        data["source_hash"] = nwispy_helpers.get_file_hash(path = filepath)
+
+    return data
+
+def process_data(data, outputdirpath, arguments, pool = None):
+    """    
+    Plot and print parsed data according to options contained in arguments parameter.
+
+    Parameters
+    ----------
+    data : dictionary
+        A dictionary containing data found in data file.
+    outputdirpath : str
+        String path of the directory to save plots to.
+    arguments : argparse object
+        An argparse object containing user options.                    
+    pool : multiprocessing.Pool
+        A pool of worker processes to render the plots in.
+
+    Returns
+    -------
+    results : list of multiprocessing.pool.AsyncResult
+        The pending plots rendered by the pool; empty if no pool is given.
+    """
+    # plot data; previews are rendered instead of plots, or for a contact sheet
+    decimate = not arguments.no_decimate
+    previews = arguments.preview or arguments.contact_sheet
+    results = []
+    if pool:
+        if not arguments.preview:
+            results.extend(nwispy_viewer.submit_plots(pool = pool, nwis_data = data, save_path = outputdirpath, decimate = decimate,
+                                                      dashboard = arguments.dashboard))
+        if previews:
+            results.extend(nwispy_viewer.submit_plots(pool = pool, nwis_data = data, save_path = outputdirpath, decimate = decimate, preview = True))
+    else:
+        if not arguments.preview:
+            nwispy_viewer.plot_data(data, is_visible = arguments.showplot, save_path = outputdirpath, decimate = decimate,
+                                    dashboard = arguments.dashboard)             
+        if previews:
+            nwispy_viewer.plot_data(data, is_visible = False, save_path = outputdirpath, decimate = decimate, preview = True)
+            
+    # print data
+    if arguments.verbose: 
+        nwispy_viewer.print_info(data)  
+
+    return results
+
+def process_stream(user_parameters_url, data_type, filename, file_destination, arguments, rate_limiter = None, base_url = None):
+    """    
+    Download a web service request and parse it while it is being downloaded.
+    The data is not read again from disk; it is only saved to a file when 
+    arguments.tee is set. The parsed data is returned to be plotted and printed
+    by the render stage of process_pipeline().
+
+    Parameters
+    ----------
+    user_parameters_url : str
+        String encoded url based on user request file.
+    data_type : str
+        String of intantaneous data (iv) or daily data (dv).
+    filename : str
+        String name of the file to save the data to and to name the output directory by.
+    file_destination : str
+        String path of the directory holding the file and output directory.
+    arguments : argparse object
+        An argparse object containing user options.
+    rate_limiter : dictionary
+        A rate limiter created by nwispy_webservice.create_rate_limiter().
+    base_url : str
+        String base url of the web service; defaults to nwispy_webservice.BASE_URL.
+
+    Returns
+    -------
+    item : dictionary
+        Dictionary of the "result" of the file (see process_file()) and its parsed "data".
+    """
+    filepath = os.path.join(file_destination, filename)
+
+    # create output directory     
+    outputdirpath = get_output_directory(filepath = filepath)
+
+    tee_filepath = None
+    if arguments.tee:
+        tee_filepath = filepath
+
+    # log errors found in the data to the output directory; a download that is tried again logs them again, so each attempt starts the error.log over
+    nwispy_logging.set_log_directory(output_dir = outputdirpath)
+    nwispy_logging.restart_log_file(output_dir = outputdirpath)
+    try:
+        response = nwispy_webservice.open_response(user_parameters_url = user_parameters_url, data_type = data_type, rate_limiter = rate_limiter, 
+                                                   base_url = base_url)
+        try:
+            is_compressed = response.info().get("Content-Encoding", "").lower() == "gzip"
+            lines = nwispy_webservice.read_lines(stream = response, decompress = is_compressed, tee_filepath = tee_filepath)
+            data = nwispy_filereader.read_file_in(lines)
+            nwispy_filereader.add_site_metadata(data = data, sites = nwispy_helpers.read_manifest(path = arguments.site_cache))
+        finally:
+            response.close()
 
-        # close error logging
-        nwispy_logging.remove_loggers()
+    finally:
+        nwispy_logging.set_log_directory(output_dir = None)
+
+    item = {"result": create_result(filepath = filepath, outputdirpath = outputdirpath), "data": data}
+
+    return item
+
+def process_pipeline(tasks, arguments, jobs = 4, queue_size = 4):
+    """    
+    Download, parse, and render data files in a pipeline of stages that run at
+    the same time. Download threads hand each downloaded file to a parse thread
+    as soon as it is saved, and the parse thread hands the parsed data to the 
+    render stage, which plots and prints it in this process. With a pool of 
+    arguments.jobs worker processes, each file is parsed and rendered in a 
+    worker instead, so parsing is not limited to the one core of the parse 
+    thread, which shares the interpreter lock with the download threads. 
+    Streamed requests (see process_stream()) are parsed by the download threads
+    and go straight to the render stage. Bounded queues between the stages stop
+    a fast stage from running ahead of a slow one, so no more than about 
+    queue_size files wait between two stages; the total time approaches the 
+    time of the slowest stage instead of the sum of the stages.
+
+    Parameters
+    ----------
+    tasks : list of dictionaries
+        List of download tasks; see nwispy_webservice.run_tasks().
+    arguments : argparse object
+        An argparse object containing user options.                    
+    jobs : int
+        Number of concurrent downloads.
+    queue_size : int
+        Number of files that can wait for the parse stage and for the render stage.
+
+    Returns
+    -------
+    report : dictionary
+        The download report returned by nwispy_webservice.run_tasks(), with the
+        "results" of the downloaded files in the order they were processed (see
+        process_file()) and the "stages" timings in seconds.
+
+    Notes
+    -----
+    report["stages"] = {"download": float, "parse": float, "render": float, "duration": float}
+
+    The download timing is the time until the last download finished, including
+    time spent waiting for room in the parse queue; the parse and render timings
+    are the sums of the "durations" of the files, so with a pool they can add up
+    to more than the duration. Streamed data is parsed in the download stage.
+    """
+    start_time = time.time()
+
+    sites = nwispy_helpers.read_manifest(path = arguments.site_cache)
+
+    parse_queue = Queue.Queue(maxsize = queue_size)
+    render_queue = Queue.Queue(maxsize = queue_size)
+    stages = {"download": 0.0, "parse": 0.0, "render": 0.0, "duration": 0.0}
+    report = {}
+
+    def queue_files(task, value):
+        """ Queue the files of a download task that succeeded; blocks while the queue is full """
+
+        if task["function"] == process_stream:
+            render_queue.put(value)
+            return
+
+        for filepath in get_downloaded_files(task = task, value = value):
+            parse_queue.put(filepath)
+
+    def download():
+        """ Download stage; None marks the end of the parse queue """
+
+        try:
+            report.update(nwispy_webservice.run_tasks(tasks = tasks, jobs = jobs, retries = arguments.retries, backoff = arguments.backoff, 
+                                                      callback = queue_files))
+        finally:
+            stages["download"] = time.time() - start_time
+            parse_queue.put(None)
+
+    def parse():
+        """ Parse stage; None marks the end of the render queue """
+
+        try:
+            for filepath in iter(parse_queue.get, None):
+                if pool:
+                    # the file is parsed and rendered in a worker process; the render stage waits for it in order
+                    render_queue.put({"result": create_result(filepath = filepath), 
+                                      "process": pool.apply_async(process_file, kwds = {"filepath": filepath, "arguments": arguments, 
+                                                                                        "sites": sites, "capture_output": True})})
+                else:
+                    render_queue.put(parse_data_file(filepath = filepath, arguments = arguments, sites = sites))
+        finally:
+            render_queue.put(None)
+
+    def finish(item):
+        """ Wait for a file processed in the pool, or for the plots of streamed data rendered in the pool """
+
+        if "process" in item:
+            try:
+                item["result"].update(item["process"].get())
+            except Exception as error:
+                log_error(result = item["result"], error = error)
+            sys.stdout.write(item["result"]["output"])
+        else:
+            render_data(item = item, arguments = arguments, plots = item["plots"])
+
+    # the pool is started before the threads; forking a process while other threads hold locks can deadlock the workers
+    pool = None
+    if arguments.jobs > 1 and not arguments.showplot:
+        pool = multiprocessing.Pool(processes = arguments.jobs, initializer = nwispy_logging.initialize_worker, initargs = (nwispy_logging.get_queue(),))
+
+    threads = [threading.Thread(target = download), threading.Thread(target = parse)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    results = []
+    try:
+        # files in the pool are waited for in order; at most queue_size files are waited for at a time
+        pending = []
+        for item in iter(render_queue.get, None):
+            if "process" in item:
+                pending.append(item)
+            elif item["data"] is not None and pool:
+                item["plots"] = process_data(data = item["data"], outputdirpath = item["result"]["output directory"], arguments = arguments, 
+                                             pool = pool)
+                pending.append(item)
+            elif item["data"] is not None:
+                render_data(item = item, arguments = arguments)
+
+            results.append(item["result"])
+            while len(pending) > queue_size:
+                finish(pending.pop(0))
+
+        while pending:
+            finish(pending.pop(0))
+
+        if pool:
+            pool.close()
+            pool.join()
+
+    finally:
+        if pool:
+            pool.terminate()
+
+    for thread in threads:
+        thread.join()
+
+    stages["parse"] = sum(result["durations"]["parse"] for result in results)
+    stages["render"] = sum(result["durations"]["render"] for result in results)
+    stages["duration"] = time.time() - start_time
+    report["results"] = results
+    report["stages"] = stages
+
+    logging.info("Processed {} file(s) in {:.2f} seconds; download {:.2f} s, parse {:.2f} s, render {:.2f} s".format(
+                 len(results), stages["duration"], stages["download"], stages["parse"], stages["render"]))
+
+    report_results(results = results, arguments = arguments)
+
+    return report
+
+def get_downloaded_files(task, value):
+    """    
+    Return the paths of the data files saved by a download task that succeeded.
+
+    Parameters
+    ----------
+    task : dictionary
+        A download task; see nwispy_webservice.run_tasks().
+    value : dictionary, list, or None
+        The value returned by the function of the task.
+
+    Returns
+    -------
+    filepaths : list of str
+        List of string paths of the files saved; empty if no file was saved or changed.
+    """
+    # a synced file is only changed if new data was downloaded
+    if task["function"] == nwispy_webservice.sync_requests:
+        return [task["kwargs"]["filepath"]] if value else []
+
+    # coalesced downloads return a file path for each request; None if there was no data
+    if isinstance(value, list):
+        return [filepath for filepath in value if filepath]
+
+    if isinstance(value, dict) and value.get("filepath"):
+        return [value["filepath"]]
+
+    return []
 
 def process_webrequest(request_file, arguments):
     """    
@@ -70,48 +655,266 @@ def process_webrequest(request_file, arguments):
         String path to file.
     arguments : argparse object
         An argparse object containing user options.         
+
+    Returns
+    -------
+    report : dictionary
+        The download report returned by nwispy_webservice.run_tasks().
     """            
     request_filedir, request_filename = nwispy_helpers.get_file_info(path = request_file)            
     
     # make a directory to hold download files in the same directory as the request file
     web_filedir = nwispy_helpers.make_directory(path = request_filedir, directory_name = "-".join([request_filename.split(".txt")[0], "datafiles"]))
     
-    # initialize error logging
-    nwispy_logging.initialize_loggers(output_dir = web_filedir)                        
-    
-    # read the request data file
-    request_data = nwispy_webservice.read_webrequest(filepath = request_file)                         
+    # log through a listener; records of the download threads and of the pipeline are routed to the right error.log
+    listener = nwispy_logging.start_listener(output_dir = web_filedir)
+    try:
+        # read the request data file
+        request_data = nwispy_webservice.read_webrequest(filepath = request_file)                         
+
+        logging.info("Read {} request(s) from {}; skipped {} invalid row(s)".format(len(request_data["requests"]), request_file, len(request_data["errors"])))
+
+        # open a response cache in the same directory as the request file
+        cache = None
+        if arguments.cache:
+            cache_dir = os.path.join(request_filedir, "-".join([request_filename.split(".txt")[0], "cache"]))
+            cache = nwispy_webservice.open_cache(directory = cache_dir, ttl = arguments.cache_ttl)
               
-    for request in request_data["requests"]:    
-        # encode a url based on request
-        request_url = nwispy_webservice.encode_url(request) 
-        
-        # name each file by date tagging it to current date and time and its site number
-        date_time_str = nwispy_helpers.now()
-        web_filename = "_".join([request["site number"], request["data type"], date_time_str]) + ".txt"
-        
-        # download the files
-        nwispy_webservice.download_file(user_parameters_url = request_url, 
-                                        data_type = request["data type"], 
-                                        filename = web_filename,
-                                        file_destination = web_filedir)
-
-    # close error logging
-    nwispy_logging.remove_loggers()
-    
+        # rate limit calls to the web service if requested
+        rate_limiter = None
+        if arguments.rate_limit:
+            rate_limiter = nwispy_webservice.create_rate_limiter(rate = arguments.rate_limit)
+
+        # site rows ask for a description of the site instead of data
+        site_requests = [request for request in request_data["requests"] if request["data type"] == "site"]
+        data_requests = [request for request in request_data["requests"] if request["data type"] != "site"]
+        if site_requests:
+            process_site_requests(site_requests = site_requests, web_filedir = web_filedir, arguments = arguments, rate_limiter = rate_limiter)
 
-    # process the downloaded file(s)
-    file_list = nwispy_helpers.get_file_paths(directory = web_filedir, file_ext = ".txt")
+        # group requests into as few web service calls as possible if requested
+        if arguments.coalesce and not arguments.sync:
+            request_groups = nwispy_webservice.plan_coalesced_requests(data_requests = data_requests, 
+                                                                       max_url_length = arguments.max_url_length, 
+                                                                       max_values = arguments.max_values)
+        else:
+            request_groups = [dict(request, requests = [request]) for request in data_requests]
 
-    process_files(file_list = file_list, arguments = arguments)   
+        download_kwargs = {"keep_compressed": arguments.keep_compressed, "cache": cache, "rate_limiter": rate_limiter, "resume": arguments.resume, 
+                           "base_url": arguments.base_url}
 
-def main():  
+        tasks = []
+        used_filenames = set()
+        streamed_filenames = []
+        sync_tasks = {}
+        for request_group in request_groups:
+            # name each file by date tagging it to current date and time and its site number
+            web_filenames = []
+            for request in request_group["requests"]:
+                date_time_str = nwispy_helpers.now()
+                web_filename = "_".join([request["site number"], request["data type"], date_time_str]) + ".txt"
+            
+                # a site and data type can be requested more than once within the same timestamp
+                count = 1
+                while web_filename in used_filenames:
+                    web_filename = "_".join([request["site number"], request["data type"], date_time_str, str(count)]) + ".txt"
+                    count += 1
+                
+                used_filenames.add(web_filename)
+                web_filenames.append(web_filename)
+
+            task = {"name": "{} {} {} {}".format(request_group["data type"], request_group["site number"], request_group["start date"], request_group["end date"]).strip(),
+                    "requests": request_group["requests"]}
+
+            request = request_group["requests"][0]
+
+            # download a coalesced call and split it into a file for each request
+            if len(request_group["requests"]) > 1:
+                task["function"] = nwispy_webservice.download_coalesced
+                task["kwargs"] = dict(download_kwargs, request_group = request_group, filenames = web_filenames, file_destination = web_filedir)
+
+            # only download data newer than a local file named by site number and data type in sync mode
+            elif arguments.sync and request["data type"] in ("dv", "iv"):
+                sync_filename = "_".join([request["site number"], request["data type"]]) + ".txt"
+                if arguments.keep_compressed:
+                    sync_filename = sync_filename + ".gz"
+
+                # requests of the same file are synced one after another by a single task
+                if sync_filename in sync_tasks:
+                    sync_tasks[sync_filename]["requests"].append(request)
+                    continue
+
+                task["requests"] = [request]
+                task["function"] = nwispy_webservice.sync_requests
+                task["kwargs"] = dict(download_kwargs, data_requests = task["requests"], filepath = os.path.join(web_filedir, sync_filename), 
+                                      overlap = arguments.sync_overlap)
+                del task["kwargs"]["keep_compressed"]
+                sync_tasks[sync_filename] = task
+
+            # split long date ranges into windows if requested
+            elif arguments.split and request["data type"] in ("dv", "iv"):
+                if request["data type"] == "iv":
+                    window = arguments.window_iv
+                else:
+                    window = arguments.window_dv
+
+                # each window is retried on its own; retrying the task would download the failed windows (retries + 1) times more
+                task["function"] = nwispy_webservice.download_windows
+                task["kwargs"] = dict(download_kwargs, data_request = request, filename = web_filenames[0], file_destination = web_filedir, 
+                                      window = window, jobs = arguments.download_jobs, retries = arguments.retries, backoff = arguments.backoff)
+                task["retries"] = 0
+
+            # parse the response while it is downloaded instead of reading the saved file again
+            elif arguments.stream:
+                task["function"] = process_stream
+                task["kwargs"] = {"user_parameters_url": nwispy_webservice.encode_url(request), "data_type": request["data type"], 
+                                  "filename": web_filenames[0], "file_destination": web_filedir, "arguments": arguments, "rate_limiter": rate_limiter, 
+                                  "base_url": arguments.base_url}
+                streamed_filenames.extend(web_filenames)
+
+            else:
+                task["function"] = nwispy_webservice.download_file
+                task["kwargs"] = dict(download_kwargs, user_parameters_url = nwispy_webservice.encode_url(request), data_type = request["data type"], 
+                                      filename = web_filenames[0], file_destination = web_filedir)
+
+            tasks.append(task)
+
+        # streamed responses are saved as they are read, if at all
+        if streamed_filenames:
+            ignored = [flag for flag, value in [("--cache", arguments.cache), ("--resume", arguments.resume), ("--keep-compressed", arguments.keep_compressed)] if value]
+            if ignored:
+                logging.warn("*Ignored* {} for streamed requests. *Solution* - Remove --stream to use them".format(", ".join(ignored)))
+
+        # download the files; failed requests are retried and do not stop the other requests
+        # streamed requests are parsed by the download threads and plotted by the render stage of the pipeline
+        pipeline = arguments.pipeline or bool(streamed_filenames)
+        if pipeline:
+            report = process_pipeline(tasks = tasks, arguments = arguments, jobs = arguments.download_jobs, queue_size = arguments.queue_size)
+        else:
+            report = nwispy_webservice.run_tasks(tasks = tasks, jobs = arguments.download_jobs, retries = arguments.retries, backoff = arguments.backoff)
+
+        logging.info("Downloaded {} of {} request(s) in {:.2f} seconds ({} attempt(s))".format(len(report["succeeded"]), len(tasks), report["duration"], report["attempts"]))
+
+        if cache:
+            logging.info("Cache: {} hit(s), {} miss(es)".format(cache["hits"], cache["misses"]))
+
+        # write failed requests to a request file that can be processed again
+        failed_request_file = os.path.join(request_filedir, "-".join([request_filename.split(".txt")[0], "failed"]) + ".txt")
+        if report["failed"]:
+            failed_requests = []
+            for failure in report["failed"]:
+                logging.error("*Failed* {} after {} attempt(s): {}".format(failure["name"], failure["attempts"], failure["error"]))
+                failed_requests.extend(failure["task"]["requests"])
+
+            nwispy_webservice.write_webrequest(filepath = failed_request_file, data_requests = failed_requests)
+            logging.error("Failed requests written to {}".format(failed_request_file))
+
+        elif os.path.exists(failed_request_file):
+            os.remove(failed_request_file)
+
+    finally:
+        nwispy_logging.stop_listener(listener)
+
+    # process the downloaded file(s) that are new or changed since they were last processed
+    file_list = nwispy_helpers.get_file_paths(directory = web_filedir, file_ext = (".txt", ".txt.gz"))
+
+    # files of the pipeline are already processed; files that failed are processed again next time
+    processed_filenames = list(streamed_filenames)
+    if pipeline:
+        processed_filenames.extend(os.path.basename(result["file"]) for result in report["results"] if not result["error"])
+        failed_filenames = [os.path.basename(result["file"]) for result in report["results"] if result["error"]]
+        file_list = [f for f in file_list if os.path.basename(f) not in failed_filenames]
+
+    process_new_files(file_list = file_list, manifest_file = os.path.join(web_filedir, "processed.json"), 
+                      arguments = arguments, processed_filenames = processed_filenames)
+
+    return report
+
+def process_site_requests(site_requests, web_filedir, arguments, rate_limiter = None):
+    """    
+    Download descriptions of the sites of site requests into the site cache
+    and save them to a sites.json file in the download directory. Sites that
+    are already in the site cache are not downloaded again.
+
+    Parameters
+    ----------
+    site_requests : list of dictionaries
+        List of dictionaries containing site requests.
+    web_filedir : str
+        String path of the download directory.
+    arguments : argparse object
+        An argparse object containing user options.
+    rate_limiter : dictionary
+        A rate limiter created by nwispy_webservice.create_rate_limiter().
     """
-    Run program based on user input arguments. Program will automatically process file(s) supplied or downloaded,
-    log any errors found in the data file, and will save plots of every parameter. Error log and plots are saved to 
-    a directory (tagged with 'output') at the same level as the supplied or downloaded data files.
+    site_numbers = [request["site number"] for request in site_requests]
+
+    try:
+        sites = nwispy_webservice.get_site_metadata(site_numbers = site_numbers, cache_file = arguments.site_cache, 
+                                                    rate_limiter = rate_limiter, base_url = arguments.base_url)
+    except IOError as error:
+        # URLError and HTTPError are IOErrors
+        logging.error("*Site descriptions not downloaded*: {}".format(error))
+        return
+
+    for site_number in site_numbers:
+        if site_number not in sites:
+            logging.warn("*Unknown site* {}. *Solution* - No description saved".format(site_number))
+
+    nwispy_helpers.write_manifest(path = os.path.join(web_filedir, "sites.json"), manifest = sites)
+    logging.info("Saved descriptions of {} of {} site(s)".format(len(sites), len(site_numbers)))
+
+def process_new_files(file_list, manifest_file, arguments, processed_filenames = ()):
+    """    
+    Process the files in a list that are not listed in a manifest file with 
+    the same content hash, and record each processed file in the manifest. All
+    files are processed when arguments.reprocess_all is set.
+
+    Parameters
+    ----------
+    file_list : list of str
+        List of files to parse, process, and plot.        
+    manifest_file : str
+        String path of a json file mapping file names to the sha1 hash of their contents when processed.
+    arguments : argparse object
+        An argparse object containing user options.                    
+    processed_filenames : list of str
+        List of file names that have already been processed, such as streamed files.
+    """
+    manifest = nwispy_helpers.read_manifest(path = manifest_file)
+
+    # forget files that no longer exist
+    filenames = [os.path.basename(f) for f in file_list]
+    manifest = dict((filename, file_hash) for filename, file_hash in manifest.items() if filename in filenames)
+
+    new_files = []
+    for f, filename in zip(file_list, filenames):
+        file_hash = nwispy_helpers.get_file_hash(path = f)
+
+        if filename in processed_filenames:
+            manifest[filename] = file_hash
+        elif manifest.get(filename) != file_hash or arguments.reprocess_all:
+            new_files.append((f, filename, file_hash))
+
+    try:
+        # process the files together so they can be processed in parallel; files that failed are processed again next time
+        results = process_files(file_list = [f for f, filename, file_hash in new_files], arguments = arguments)
+
+        for (f, filename, file_hash), result in zip(new_files, results):
+            if not result["error"]:
+                manifest[filename] = file_hash
+
+    finally:
+        nwispy_helpers.write_manifest(path = manifest_file, manifest = manifest)
+
+def create_parser():
+    """
+    Create the command line argument parser.
+
+    Returns
+    -------
+    parser : argparse.ArgumentParser
+        The argument parser for the nwispy command line options.
     """    
-    # parse arguments from command line
     parser = argparse.ArgumentParser(description = "Read, process, log errors, print, and plot information from USGS \
                                                     National Water Information System (NWIS) data files.") 
     group = parser.add_mutually_exclusive_group()
@@ -121,6 +924,46 @@ def main():
     parser.add_argument('-p', '--showplot', action = 'store_true',  help = 'Show plots of parameters contained in data file(s)')
     parser.add_argument('-web', '--webservice', nargs = '+',  help = 'List a web service request file to be processed')
     parser.add_argument('-webfd', '--webservice_dialog', action = 'store_true',  help = 'Open a file dialog window to select a web service request file')
+    parser.add_argument('--keep-compressed', action = 'store_true',  help = 'Save gzip compressed web service downloads as is (*.txt.gz)')
+    parser.add_argument('--cache', action = 'store_true',  help = 'Cache web service responses and only download them again when they change')
+    parser.add_argument('--cache-ttl', type = int, default = nwispy_webservice.CACHE_TTL, help = 'Seconds to reuse a cached response that can not be revalidated (default: %(default)s)')
+    parser.add_argument('--split', action = 'store_true',  help = 'Split long web service requests into date windows that are downloaded concurrently and merged')
+    parser.add_argument('--window-dv', type = nwispy_webservice.parse_window, default = nwispy_webservice.DEFAULT_WINDOWS["dv"], help = 'Window for daily requests; "wy" for water years or a number of days (default: %(default)s)')
+    parser.add_argument('--window-iv', type = nwispy_webservice.parse_window, default = nwispy_webservice.DEFAULT_WINDOWS["iv"], help = 'Window for instantaneous requests; "wy" for water years or a number of days (default: %(default)s)')
+    parser.add_argument('--download-jobs', type = int, default = 4, help = 'Number of concurrent web service downloads (default: %(default)s)')
+    parser.add_argument('--retries', type = int, default = 2, help = 'Number of times a failed web service download is retried (default: %(default)s)')
+    parser.add_argument('--coalesce', action = 'store_true',  help = 'Combine web service requests with the same data type and dates into multi-site calls')
+    parser.add_argument('--max-url-length', type = int, default = nwispy_webservice.MAX_URL_LENGTH, help = 'Maximum url length of a combined web service call (default: %(default)s)')
+    parser.add_argument('--max-values', type = int, default = nwispy_webservice.MAX_VALUES, help = 'Maximum estimated number of data values in a combined web service call (default: %(default)s)')
+    parser.add_argument('--sync', action = 'store_true',  help = 'Only download web service data newer than what is stored locally and merge it into one file per site and data type')
+    parser.add_argument('--sync-overlap', type = int, default = nwispy_webservice.SYNC_OVERLAP, help = 'Days before the last local value to download again in sync mode (default: %(default)s)')
+    parser.add_argument('--rate-limit', type = float, help = 'Maximum number of web service calls per second')
+    parser.add_argument('--resume', action = 'store_true',  help = 'Keep interrupted web service downloads and continue them on the next attempt or run')
+    parser.add_argument('--backoff', type = float, default = nwispy_webservice.BACKOFF, help = 'Seconds to wait before the first retry of a failed web service download; doubled for each retry (default: %(default)s)')
+    parser.add_argument('--stream', action = 'store_true',  help = 'Parse and plot web service responses while they are downloaded instead of reading saved files')
+    parser.add_argument('--tee', action = 'store_true',  help = 'Also save web service responses to files in stream mode')
+    parser.add_argument('--base-url', default = nwispy_webservice.BASE_URL, help = 'Base url of the web service, such as a local nwispy_mockservice (default: %(default)s)')
+    parser.add_argument('--site-cache', default = nwispy_webservice.SITE_CACHE, help = 'File of site descriptions downloaded for site rows of request files (default: %(default)s)')
+    parser.add_argument('--pipeline', action = 'store_true',  help = 'Parse and plot web service downloads while the other requests are downloaded')
+    parser.add_argument('--queue-size', type = int, default = 4, help = 'Number of files that can wait between the download, parse, and render stages of the pipeline (default: %(default)s)')
+    parser.add_argument('--jobs', type = int, default = 1, help = 'Number of processes that process data files; files are processed in this process if 1 or if plots are shown (default: %(default)s)')
+    parser.add_argument('--no-decimate', action = 'store_true', help = 'Plot every value of long series instead of about 2 values per pixel of the saved plot')
+    parser.add_argument('--dashboard', action = 'store_true', help = 'Plot all parameters of a data file in one figure of subplots that share the date axis')
+    parser.add_argument('--preview', action = 'store_true', help = 'Save small preview thumbnails of each parameter instead of full size plots')
+    parser.add_argument('--contact-sheet', help = 'Also save preview thumbnails of each parameter and pack them into this image file, one row for each data file')
+    parser.add_argument('--replot', action = 'store_true', help = 'Render all saved plots again, even if the data file and plot options did not change')
+    parser.add_argument('--reprocess-all', action = 'store_true',  help = 'Process all web service data files again, not only new or changed files')
+
+    return parser
+
+def main():  
+    """
+    Run program based on user input arguments. Program will automatically process file(s) supplied or downloaded,
+    log any errors found in the data file, and will save plots of every parameter. Error log and plots are saved to 
+    a directory (tagged with 'output') at the same level as the supplied or downloaded data files.
+    """    
+    # parse arguments from command line
+    parser = create_parser()
     args = parser.parse_args()  
 
     try:
@@ -13,6 +13,7 @@ __license__   = __copyright__
 __contact__   = __author__
 
 import re
+import gzip
 import numpy as np
 import datetime
 import logging
@@ -26,7 +27,7 @@ def read_file(filepath):
     Open NWIS file, create a file object for read_file_in(filestream) to process.
     This function is responsible to opening the file, removing the file opening  
     responsibility from read_file_in(filestream) so that read_file_in(filestream)  
-    can be unit tested.
+    can be unit tested. Files ending in ".gz" are opened as gzip compressed files.
     
     Parameters
     ----------
@@ -43,7 +44,12 @@ def read_file(filepath):
     --------
     read_file_in : Read data file object           
     """    
-    with open(filepath, "r") as f:
+    if filepath.endswith(".gz"):
+        f = gzip.open(filepath, "rb")
+    else:
+        f = open(filepath, "r")
+
+    with f:
         data = read_file_in(f)
         
     return data
@@ -57,7 +63,8 @@ def read_file_in(filestream):
     Parameters
     ----------
     filestream : file object
-        A python file object that contains an open data file.
+        A python file object that contains an open data file, or any iterable 
+        of lines such as a web service response being downloaded.
         
     Returns
     -------
@@ -72,6 +79,10 @@ def read_file_in(filestream):
         
         "gage_name": None,
         
+        "site_number": None,
+        
+        "site": None,
+        
         "column_names": None,
         
         "parameters": [],
@@ -81,6 +92,8 @@ def read_file_in(filestream):
         "timestep": None   
     }      
             
+    The "site" key holds a site description added by add_site_metadata().
+            
     The "parameters" key in the data dictionary contains a list of dictionaries containing
     the parameters found in the data file. For example:
     
@@ -101,8 +114,6 @@ def read_file_in(filestream):
         "min": min of data values
     }         
     """  
-    data_file = filestream.readlines()
-
     # regular expression patterns in data file 
     # column_names and data_row patterns have 5 groups which is used to 
     # distinguish a daily file from an instanteous file; if 4th group is None, 
@@ -119,14 +130,16 @@ def read_file_in(filestream):
     data = {
         "date_retrieved": None,
         "gage_name": None,
+        "site_number": None,
+        "site": None,
         "column_names": None,
         "parameters": [],
         "dates": [],
         "timestep": None
     }      
     
-    # process file; find matches and add to data dictionary
-    for line in data_file: 
+    # process file one line at a time as it is read; find matches and add to data dictionary
+    for line in filestream: 
         match_date_retrieved = re.search(pattern = patterns["date_retrieved"], string = line)
         match_gage_name = re.search(pattern = patterns["gage_name"], string = line)
         match_parameters = re.search(pattern = patterns["parameters"], string = line)
@@ -160,6 +173,9 @@ def read_file_in(filestream):
         if match_data_row:
             date = get_date(daily = match_data_row.group(3), instantaneous = match_data_row.group(4))
             data["dates"].append(date)
+
+            if data["site_number"] is None:
+                data["site_number"] = match_data_row.group(2)
             
             for parameter in data["parameters"]:
                 value = match_data_row.group(0).split("\t")[parameter["index"]]
@@ -191,6 +207,27 @@ def read_file_in(filestream):
 
     return data
 
+def add_site_metadata(data, sites):
+    """    
+    Add the description of the site of a data file, such as downloaded by 
+    nwispy_webservice.get_site_metadata(), to the data dictionary. The gage 
+    name is taken from the site description if the file has none.
+    
+    Parameters
+    ----------
+    data : dictionary
+        A dictionary returned by read_file_in().
+    sites : dictionary
+        Dictionary of site descriptions keyed by site number.
+    """
+    site = sites.get(data["site_number"])
+    if site is None:
+        return
+
+    data["site"] = site
+    if not data["gage_name"] and site["name"]:
+        data["gage_name"] = "USGS {} {}".format(data["site_number"], site["name"])
+
 def get_parameter_code(match):
     """   
     Get code and description strings from regular expression match object.
@@ -17,6 +17,9 @@ import numpy as np
 import datetime
 import re
 import logging
+import hashlib
+import json
+import struct
 
 def now():
     """    
@@ -45,8 +48,8 @@ def get_file_paths(directory, file_ext = None):
     ----------    
     directory : string
         String path 
-    file_ext : string
-        String file extention; e.g. ".txt" 
+    file_ext : string or tuple of strings
+        String file extention; e.g. ".txt" or (".txt", ".txt.gz")
     Returns
     -------
     file_paths : list 
@@ -105,10 +108,147 @@ def make_directory(path, directory_name):
     """    
     directory_path = os.path.join(path, directory_name)
     if not os.path.exists(directory_path):
-        os.makedirs(directory_path)         
+        try:
+            os.makedirs(directory_path)         
+        except OSError:
+            # another thread or process may have made the directory in the meantime
+            if not os.path.isdir(directory_path):
+                raise
     
     return directory_path
 
+def remove_empty_directory(path):
+    """    
+    Remove a directory if it exists and is empty.
+    
+    Parameters
+    ----------
+    path: string
+        String path 
+
+    Returns
+    -------
+    bool : bool
+        True if the directory was removed.
+    """
+    try:
+        os.rmdir(path)
+        return True
+    except OSError:
+        # directory does not exist or is not empty
+        return False
+
+def replace_file(src, dst):
+    """    
+    Rename a file, replacing the destination file if it already exists.
+    
+    Parameters
+    ----------
+    src : string
+        String path of file to rename.
+    dst : string
+        String path of new file name.
+
+    Notes
+    -----
+    os.rename() can not overwrite an existing file on Windows, so the
+    destination is removed first on that platform.
+    """
+    if os.name == "nt" and os.path.exists(dst):
+        os.remove(dst)
+
+    os.rename(src, dst)
+
+def get_file_hash(path, chunk_size = 64*1024):
+    """    
+    Return the sha1 hex digest of the contents of a file.
+    
+    Parameters
+    ----------
+    path : string
+        String path of file.
+    chunk_size : int
+        Number of bytes to read at a time.
+
+    Returns
+    -------
+    file_hash : string
+        String hex digest of the file contents.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+def get_data_size(path):
+    """    
+    Return the number of bytes of data in a file; the uncompressed size of 
+    files ending in ".gz", taken from the size stored at the end of the gzip
+    file (modulo 4 GB). Returns 0 if the file does not exist.
+    
+    Parameters
+    ----------
+    path : string
+        String path of file.
+
+    Returns
+    -------
+    size : int
+        Number of bytes of data.
+    """
+    if not os.path.isfile(path):
+        return 0
+
+    size = os.path.getsize(path)
+    if path.endswith(".gz") and size >= 4:
+        with open(path, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            size = struct.unpack("<I", f.read(4))[0]
+
+    return size
+
+def read_manifest(path):
+    """    
+    Read a json manifest file. Return an empty dictionary if the file does not
+    exist or can not be read.
+    
+    Parameters
+    ----------
+    path : string
+        String path of manifest file.
+
+    Returns
+    -------
+    manifest : dictionary
+        Dictionary stored in the manifest file.
+    """
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        manifest = {}
+
+    return manifest
+
+def write_manifest(path, manifest):
+    """    
+    Write a dictionary to a json manifest file. The file is written to a 
+    temporary file that replaces the manifest file once it is complete.
+    
+    Parameters
+    ----------
+    path : string
+        String path of manifest file.
+    manifest : dictionary
+        Dictionary to store in the manifest file.
+    """
+    with open(path + ".part", "w") as f:
+        json.dump(manifest, f, indent = 2, sort_keys = True)
+
+    replace_file(src = path + ".part", dst = path)
+
 def isfloat(value):
     """   
     Determine if string value can be converted to a float. Return True if
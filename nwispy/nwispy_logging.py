@@ -13,6 +13,14 @@ __contact__   = __author__
 
 import logging
 import os
+import threading
+import multiprocessing
+
+# error.log directory of the file that each thread is working on; see set_log_directory()
+_context = threading.local()
+
+# queue of the listener that records of this process are put on; see start_listener() and initialize_worker()
+_queue = None
 
 def initialize_loggers(output_dir):
     """    
@@ -35,12 +43,54 @@ def initialize_loggers(output_dir):
     logger.addHandler(handler)
 
     # create file handler and set level to WARN - write to a file only if a message is sent to this handler
-    handler = logging.FileHandler(os.path.join(output_dir, "error.log"), "w", encoding = None, delay = "true")
+    initialize_file_logger(output_dir = output_dir)
+
+def initialize_file_logger(output_dir):
+    """    
+    Add a handler to the main logger that writes warnings and errors to an 
+    error.log file in a directory. The file is only created if a message is
+    sent to the handler.
+    
+    Parameters
+    ----------        
+    output_dir : str
+        String path 
+
+    Returns
+    -------
+    handler : logging.FileHandler
+        The file handler; pass it to remove_file_logger() when done.
+    """ 
+    logger = logging.getLogger()
+
+    handler = _create_file_handler(output_dir = output_dir, mode = "w")
+    logger.addHandler(handler)    
+
+    return handler
+
+def _create_file_handler(output_dir, mode):
+    """ Return a handler that writes warnings and errors to the error.log file in a directory; the file is created by the first message """
+
+    handler = logging.FileHandler(os.path.join(output_dir, "error.log"), mode, encoding = None, delay = "true")
     handler.setLevel(logging.WARN)
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     handler.setFormatter(formatter)
-    logger.addHandler(handler)    
 
+    return handler
+
+def remove_file_logger(handler):
+    """    
+    Remove a handler added by initialize_file_logger().
+    
+    Parameters
+    ----------        
+    handler : logging.FileHandler
+        The file handler to remove.
+    """ 
+    logger = logging.getLogger()
+    logger.removeHandler(handler)
+    handler.flush()
+    handler.close()
       
 def remove_loggers():
     """    
@@ -54,6 +104,250 @@ def remove_loggers():
         i.close()
 
 
+class QueueHandler(logging.Handler):
+    """
+    Logging handler that puts records on a queue instead of writing them, so
+    logging on the hot path of a worker never waits for a file or console.
+    Each record is tagged with the error.log directory of the thread that 
+    logged it; see set_log_directory().
+
+    Parameters
+    ----------
+    queue : multiprocessing.Queue
+        Queue read by a listener; see start_listener().
+    """
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            record.output_dir = getattr(_context, "output_dir", None)
+
+            # format the message and traceback now; arguments and tracebacks can not be pickled to another process
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+
+            self.queue.put_nowait(record)
+
+        except Exception:
+            self.handleError(record)
+
+def start_listener(output_dir = None):
+    """    
+    Start logging through a queue. The main logger puts the records of all 
+    threads of this process, and of worker processes initialized with 
+    initialize_worker(), on a queue. A single listener thread writes info
+    messages to the console, and routes warnings and errors to the error.log 
+    in the directory set by the thread that logged them with 
+    set_log_directory(), or else to the error.log in output_dir. Each 
+    error.log is only created if a message is sent to it.
+    
+    Parameters
+    ----------        
+    output_dir : str
+        String path of the directory of the error.log of records that are not
+        logged for a file; these records are only written to the console if None.
+
+    Returns
+    -------
+    listener : dictionary
+        The running listener; pass it to stop_listener() when done.
+
+    Notes
+    -----
+    listener = {"queue": multiprocessing.Queue, "thread": threading.Thread, "output dir": str, "handler": QueueHandler, 
+                "console": logging.StreamHandler, "files": dictionary, "opened": set, "level": int}
+
+    listener["files"] holds the open file handlers by directory; listener["opened"]
+    holds the directories of every error.log opened, which are appended to if 
+    they are opened again; listener["level"] is the level of the main logger 
+    before the listener was started.
+    """ 
+    global _queue
+
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    console.setFormatter(logging.Formatter("%(name)s - %(levelname)s - %(message)s"))
+
+    listener = {
+        "queue": multiprocessing.Queue(),
+        "thread": None,
+        "output dir": output_dir,
+        "handler": None,
+        "console": console,
+        "files": {},
+        "opened": set(),
+        "level": logging.getLogger().level
+    }
+
+    listener["thread"] = threading.Thread(target = _handle_records, args = (listener,))
+    listener["thread"].daemon = True
+    listener["thread"].start()
+
+    # debug messages are never written; skipping them in the logger makes them nearly free
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    listener["handler"] = QueueHandler(listener["queue"])
+    logger.addHandler(listener["handler"])
+
+    _queue = listener["queue"]
+
+    return listener
+
+def stop_listener(listener):
+    """    
+    Stop a listener started by start_listener() once it has written all records 
+    that are on its queue, and close its error.log files. Worker processes 
+    must be joined before so their records are on the queue.
+    
+    Parameters
+    ----------        
+    listener : dictionary
+        The running listener.
+    """ 
+    global _queue
+
+    logger = logging.getLogger()
+    logger.removeHandler(listener["handler"])
+    logger.setLevel(listener["level"])
+    _queue = None
+
+    # None marks the end of the queue
+    listener["queue"].put(None)
+    listener["thread"].join()
+
+    for handler in [listener["console"]] + listener["files"].values():
+        handler.flush()
+        handler.close()
+
+    listener["files"].clear()
+
+def _handle_records(listener):
+    """
+    Write the records on the queue of a listener until None is read; a directory path on its own closes the error.log in it,
+    and a tuple of "restart" and a directory path also removes the error.log, so the next record starts it over
+    """
+
+    for record in iter(listener["queue"].get, None):
+        if isinstance(record, tuple):
+            output_dir = record[1]
+            handler = listener["files"].pop(output_dir, None)
+            if handler:
+                handler.close()
+            listener["opened"].discard(output_dir)
+            _remove_log_file(output_dir = output_dir)
+            continue
+
+        if isinstance(record, basestring):
+            handler = listener["files"].pop(record, None)
+            if handler:
+                handler.close()
+            continue
+
+        if record.levelno >= listener["console"].level:
+            listener["console"].handle(record)
+
+        # a record that can not be written, e.g. to a removed directory, must not stop the listener
+        output_dir = record.output_dir or listener["output dir"]
+        if output_dir and record.levelno >= logging.WARN:
+            try:
+                if output_dir not in listener["files"]:
+                    mode = "a" if output_dir in listener["opened"] else "w"
+                    listener["files"][output_dir] = _create_file_handler(output_dir = output_dir, mode = mode)
+                    listener["opened"].add(output_dir)
+
+                listener["files"][output_dir].handle(record)
+
+            except Exception:
+                listener["console"].handleError(record)
+
+def initialize_worker(queue):
+    """    
+    Initialize logging of a worker process to put its records on the queue
+    of a listener in the main process; used as the initializer of a 
+    multiprocessing.Pool.
+    
+    Parameters
+    ----------        
+    queue : multiprocessing.Queue
+        The "queue" of a listener returned by start_listener(), or None to keep
+        the logging of the worker as is.
+    """ 
+    global _queue
+
+    # a thread of the main process may have held the lock of the logging module when the worker was forked
+    logging._lock = threading.RLock()
+    _context.output_dir = None
+
+    if queue is None:
+        return
+
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    logger.setLevel(logging.INFO)
+    logger.addHandler(QueueHandler(queue))
+    _queue = queue
+
+def get_queue():
+    """    
+    Return the queue of the listener of this process, or None if there is no
+    listener; pass it to initialize_worker() in worker processes.
+    """ 
+    return _queue
+
+def restart_log_file(output_dir):
+    """    
+    Remove the error.log in a directory so the next warning or error logged
+    for it starts the file over, such as before a failed download that was 
+    logging to it is tried again. Records logged for the directory before 
+    are written first.
+    
+    Parameters
+    ----------        
+    output_dir : str
+        String path of the directory.
+    """ 
+    if _queue is None:
+        _remove_log_file(output_dir = output_dir)
+    else:
+        _queue.put(("restart", output_dir))
+
+def _remove_log_file(output_dir):
+    """ Remove the error.log in a directory if there is one """
+
+    # an error.log that can not be removed, e.g. in a removed directory, is written over by the next record
+    filepath = os.path.join(output_dir, "error.log")
+    try:
+        if os.path.isfile(filepath):
+            os.remove(filepath)
+    except OSError:
+        pass
+
+def set_log_directory(output_dir):
+    """    
+    Route warnings and errors logged by the current thread to the error.log 
+    in a directory, such as the output directory of the file that the thread
+    is working on. The error.log of the previous directory of the thread is
+    closed.
+    
+    Parameters
+    ----------        
+    output_dir : str
+        String path of the directory, or None when the thread is done with it.
+    """ 
+    previous_dir = getattr(_context, "output_dir", None)
+    _context.output_dir = output_dir
+
+    if previous_dir and previous_dir != output_dir and _queue is not None:
+        _queue.put(previous_dir)
+
+
 def test_logging():
     """ Test functionality of logging errors """
     
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+:Module: nwispy_mockservice.py
+
+:Author: Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center, http://www.usgs.gov/
+
+:Synopsis: A local stand-in for the U.S. Geological Survey (USGS) National Water Information System (NWIS) daily (dv), instantaneous (iv), and site web services that serves synthetic rdb data for testing and benchmarking; http://waterservices.usgs.gov/nwis/
+"""
+
+__author__   = "Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center."
+__copyright__ = "http://www.usgs.gov/visual-id/credit_usgs.html#copyright"
+__license__   = __copyright__
+__contact__   = __author__
+
+import argparse
+import BaseHTTPServer
+import SocketServer
+import urlparse
+import datetime
+import hashlib
+import threading
+import random
+import time
+import gzip
+import math
+from StringIO import StringIO
+import nwispy_webservice
+
+PARAMETER_DESCRIPTIONS = {
+    "00010": "Temperature, water, degrees Celsius",
+    "00045": "Precipitation, total, inches",
+    "00060": "Discharge, cubic feet per second",
+    "00065": "Gage height, feet",
+    "00095": "Specific conductance, water, unfiltered, microsiemens per centimeter at 25 degrees Celsius"
+}
+
+DEFAULT_SETTINGS = {
+    "latency": 0.0,
+    "error rate": 0.0,
+    "error code": 503,
+    "values per day": {"dv": 1, "iv": 96},
+    "seed": 0
+}
+
+class MockServiceServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Threaded http server holding the settings and request statistics of the
+    stand-in web service.
+    """
+    daemon_threads = True
+
+class MockServiceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Request handler answering dv, iv, and site web service requests with 
+    synthetic rdb data. Requests are accepted as http GET query strings or POST bodies.
+    """
+    def do_GET(self):
+        query = urlparse.urlparse(self.path).query
+        self.respond(query = query)
+
+    def do_POST(self):
+        query = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.respond(query = query)
+
+    def respond(self, query):
+        """ Send a synthetic rdb response, or an injected error """
+
+        settings = self.server.settings
+        stats = self.server.stats
+
+        with self.server.stats_lock:
+            stats["requests"] += 1
+            inject_error = self.server.random.random() < settings["error rate"]
+
+        if settings["latency"]:
+            time.sleep(settings["latency"])
+
+        data_type = urlparse.urlparse(self.path).path.strip("/").split("/")[-1]
+        if (data_type not in settings["values per day"] and data_type != "site") or inject_error:
+            code = 404 if not inject_error else settings["error code"]
+            with self.server.stats_lock:
+                stats["errors"] += 1
+            self.send_error(code)
+            return
+
+        try:
+            if data_type == "site":
+                body = create_site_rdb(site_numbers = parse_site_query(query = query), seed = settings["seed"])
+            else:
+                data_request = parse_query(query = query)
+                body = create_rdb(data_request = data_request, data_type = data_type,
+                                  values_per_day = settings["values per day"][data_type], seed = settings["seed"])
+        except ValueError as error:
+            with self.server.stats_lock:
+                stats["errors"] += 1
+            self.send_error(400, str(error))
+            return
+
+        # like the web service, there is no data to send when no values fall within the dates
+        if body is None:
+            self.send_error(404, "No sites/data found using the selection criteria specified")
+            return
+
+        etag = get_etag(body = body)
+        if self.headers.get("If-None-Match") == etag:
+            with self.server.stats_lock:
+                stats["not modified"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        content_encoding = None
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            compressed = StringIO()
+            with gzip.GzipFile(fileobj = compressed, mode = "wb") as f:
+                f.write(body)
+            body = compressed.getvalue()
+            content_encoding = "gzip"
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        if content_encoding:
+            self.send_header("Content-Encoding", content_encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+        with self.server.stats_lock:
+            stats["bytes sent"] += len(body)
+
+    def log_message(self, format, *args):
+        """ Do not log every request to standard error """
+        pass
+
+def get_etag(body):
+    """
+    Return the entity tag of an rdb body; the hash of the body without the 
+    comment lines that change with every request, such as the retrieved date
+    (see nwispy_webservice.VOLATILE_COMMENTS), so a repeated request for the 
+    same data has the same tag.
+
+    Parameters
+    ----------
+    body : str
+        String contents of the rdb file.
+
+    Returns
+    -------
+    etag : str
+        String quoted entity tag.
+    """
+    lines = [line for line in body.splitlines(True) if not line.startswith(nwispy_webservice.VOLATILE_COMMENTS)]
+    etag = '"{}"'.format(hashlib.sha1("".join(lines)).hexdigest())
+
+    return etag
+
+def parse_query(query):
+    """
+    Parse the query string of a web service request into a data request
+    dictionary like the ones returned by nwispy_webservice.read_webrequest().
+
+    Parameters
+    ----------
+    query : str
+        String url encoded query, such as returned by nwispy_webservice.encode_url().
+
+    Returns
+    -------
+    data_request : dictionary
+        Dictionary holding the site number(s), parameters, and dates of the request.
+
+    Raises
+    ------
+    ValueError
+        If the site number or the dates are missing or invalid.
+
+    Notes
+    -----
+    Multiple site numbers are separated by commas in data_request["site number"].
+    """
+    # web service parameter names are case insensitive
+    parameters = dict((key.lower(), value) for key, value in urlparse.parse_qsl(query))
+
+    site_numbers = parameters.get("site", parameters.get("sites", ""))
+    if not site_numbers:
+        raise ValueError("A site number is required")
+
+    try:
+        start_date = datetime.datetime.strptime(parameters["startdt"], "%Y-%m-%d")
+        end_date = datetime.datetime.strptime(parameters["enddt"], "%Y-%m-%d")
+    except (KeyError, ValueError):
+        raise ValueError("Valid startDt and endDt dates (yyyy-mm-dd) are required")
+
+    parameter_codes = [code for code in parameters.get("parametercd", "00060").split(",") if code]
+
+    data_request = {
+        "site number": site_numbers,
+        "parameters": parameter_codes,
+        "start date": start_date,
+        "end date": end_date
+    }
+
+    return data_request
+
+def parse_site_query(query):
+    """
+    Parse the query string of a site service request and return its site numbers.
+
+    Parameters
+    ----------
+    query : str
+        String url encoded query.
+
+    Returns
+    -------
+    site_numbers : list of str
+        List of site numbers.
+
+    Raises
+    ------
+    ValueError
+        If no site number is given or a site number is not a number.
+    """
+    parameters = dict((key.lower(), value) for key, value in urlparse.parse_qsl(query))
+
+    site_numbers = [site_number for site_number in parameters.get("sites", parameters.get("site", "")).split(",") if site_number]
+    if not site_numbers or not all(site_number.isdigit() for site_number in site_numbers):
+        raise ValueError("Site numbers are required")
+
+    return site_numbers
+
+def create_site_rdb(site_numbers, seed = 0):
+    """
+    Create a synthetic rdb file in the format of the site service with 
+    siteOutput=expanded; only the columns used by nwispy are included. Site
+    numbers starting with 99 are treated as unknown sites. Return None if 
+    none of the sites are known.
+
+    Parameters
+    ----------
+    site_numbers : list of str
+        List of site numbers.
+    seed : int
+        Seed of the synthetic values.
+
+    Returns
+    -------
+    rdb : str
+        String contents of the rdb file.
+    """
+    site_numbers = [site_number for site_number in site_numbers if not site_number.startswith("99")]
+    if not site_numbers:
+        return None
+
+    lines = [
+        "#",
+        "# Synthetic site descriptions served by nwispy_mockservice; not USGS data.",
+        "#",
+        "\t".join(["agency_cd", "site_no", "station_nm", "site_tp_cd", "dec_lat_va", "dec_long_va", "drain_area_va", "tz_cd"]),
+        "\t".join(["5s", "15s", "50s", "7s", "16s", "16s", "8s", "6s"])
+    ]
+    for site_number in site_numbers:
+        generator = random.Random("{}-{}".format(seed, site_number))
+        lines.append("\t".join(["USGS", site_number, "SYNTHETIC STREAM AT MOCK SITE {}".format(site_number), "ST",
+                                "{:.8f}".format(generator.uniform(25, 49)), "{:.8f}".format(generator.uniform(-124, -67)),
+                                "{:.1f}".format(generator.uniform(1, 5000)), "EST"]))
+
+    return "\n".join(lines) + "\n"
+
+def create_rdb(data_request, data_type, values_per_day = 1, seed = 0):
+    """
+    Create a synthetic rdb file in the format of the web service. The values
+    are deterministic for a given request and seed, so a repeated request
+    returns the same data. Return None if there are no values to send.
+
+    Parameters
+    ----------
+    data_request : dictionary
+        Dictionary returned by parse_query().
+    data_type : str
+        String of intantaneous data (iv) or daily data (dv).
+    values_per_day : int
+        Number of values for each day for each parameter; sets the size of the response.
+    seed : int
+        Seed of the synthetic values.
+
+    Returns
+    -------
+    rdb : str
+        String contents of the rdb file.
+    """
+    days = (data_request["end date"] - data_request["start date"]).days + 1
+    if days <= 0:
+        return None
+
+    site_numbers = data_request["site number"].split(",")
+
+    lines = [
+        "# ---------------------------------- WARNING ----------------------------------------",
+        "# Synthetic data served by nwispy_mockservice; not USGS data.",
+        "#",
+        "# retrieved: {}       (nwispy_mockservice)".format(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        "#",
+        "# Data for the following {} site(s) are contained in this file".format(len(site_numbers))
+    ]
+    for site_number in site_numbers:
+        lines.append("#    USGS {} SYNTHETIC STREAM AT MOCK SITE {}".format(site_number, site_number))
+    lines.append("# -----------------------------------------------------------------------------------")
+
+    for site_number in site_numbers:
+        lines.extend(["#", "# Data provided for site {}".format(site_number)])
+
+        column_names = ["agency_cd", "site_no", "datetime"]
+        column_formats = ["5s", "15s", "20d"]
+        if data_type == "iv":
+            column_names.append("tz_cd")
+            column_formats.append("6s")
+            lines.append("#    DD parameter   Description")
+        else:
+            lines.append("#    DD parameter statistic   Description")
+
+        for i, code in enumerate(data_request["parameters"]):
+            description = PARAMETER_DESCRIPTIONS.get(code, "Parameter {}".format(code))
+            dd = "{:02d}".format(i + 1)
+            if data_type == "iv":
+                lines.append("#    {}   {}     {}".format(dd, code, description))
+                column = "_".join([dd, code])
+            else:
+                lines.append("#    {}   {}     00003     {} (Mean)".format(dd, code, description))
+                column = "_".join([dd, code, "00003"])
+            column_names.extend([column, column + "_cd"])
+            column_formats.extend(["14n", "10s"])
+
+        lines.extend(["#", "\t".join(column_names), "\t".join(column_formats)])
+
+        # seed each site by its number so sites differ but repeated requests match
+        generator = random.Random("{}-{}".format(seed, site_number))
+        step = datetime.timedelta(days = 1) / values_per_day
+        for i in range(days * values_per_day):
+            date = data_request["start date"] + i * step
+            row = ["USGS", site_number]
+            if data_type == "iv":
+                row.extend([date.strftime("%Y-%m-%d %H:%M"), "EST"])
+            else:
+                row.append(date.strftime("%Y-%m-%d"))
+
+            for j, code in enumerate(data_request["parameters"]):
+                seasonal = math.sin(2 * math.pi * date.timetuple().tm_yday / 365.0)
+                value = (j + 1) * 100 * (1.5 + seasonal) + generator.gauss(0, 5)
+                row.extend(["{:.2f}".format(max(value, 0)), "P"])
+
+            lines.append("\t".join(row))
+
+    return "\n".join(lines) + "\n"
+
+def start_server(host = "127.0.0.1", port = 0, **settings):
+    """
+    Start the stand-in web service in a background thread.
+
+    Parameters
+    ----------
+    host : str
+        String host name to listen on.
+    port : int
+        Port number to listen on; 0 picks a free port.
+    **settings
+        Settings overriding DEFAULT_SETTINGS; latency (seconds to wait before
+        each response), error_rate (fraction of requests answered with
+        error_code), error_code, values_per_day (dictionary of values per day
+        by data type), and seed.
+
+    Returns
+    -------
+    server : MockServiceServer
+        The running server; server.base_url is the base url to pass to
+        nwispy_webservice and server.stats counts requests, errors, not 
+        modified (304) responses, and bytes sent.
+
+    Examples
+    --------
+    >>> import nwispy_mockservice
+    >>> server = nwispy_mockservice.start_server(latency = 0.05, error_rate = 0.1)
+    >>> server.base_url
+    'http://127.0.0.1:54321/nwis/'
+    >>> nwispy_mockservice.stop_server(server)
+    """
+    server = MockServiceServer((host, port), MockServiceHandler)
+
+    server.settings = dict(DEFAULT_SETTINGS)
+    for key, value in settings.items():
+        server.settings[key.replace("_", " ")] = value
+
+    server.random = random.Random(server.settings["seed"])
+    server.stats = {"requests": 0, "errors": 0, "not modified": 0, "bytes sent": 0}
+    server.stats_lock = threading.Lock()
+    server.base_url = "http://{}:{}/nwis/".format(host, server.server_address[1])
+
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+def stop_server(server):
+    """
+    Stop a server started by start_server().
+
+    Parameters
+    ----------
+    server : MockServiceServer
+        The running server.
+    """
+    server.shutdown()
+    server.server_close()
+
+def main():
+    """ Run the stand-in web service until interrupted """
+
+    parser = argparse.ArgumentParser(description = "Serve synthetic USGS NWIS dv and iv web service data for testing and benchmarking.")
+    parser.add_argument('--host', default = "127.0.0.1", help = 'Host name to listen on (default: %(default)s)')
+    parser.add_argument('--port', type = int, default = 8080, help = 'Port number to listen on (default: %(default)s)')
+    parser.add_argument('--latency', type = float, default = DEFAULT_SETTINGS["latency"], help = 'Seconds to wait before each response (default: %(default)s)')
+    parser.add_argument('--error-rate', type = float, default = DEFAULT_SETTINGS["error rate"], help = 'Fraction of requests answered with an error (default: %(default)s)')
+    parser.add_argument('--error-code', type = int, default = DEFAULT_SETTINGS["error code"], help = 'Http status code of injected errors (default: %(default)s)')
+    parser.add_argument('--iv-values-per-day', type = int, default = DEFAULT_SETTINGS["values per day"]["iv"], help = 'Values per day of instantaneous data (default: %(default)s)')
+    args = parser.parse_args()
+
+    server = start_server(host = args.host, port = args.port, latency = args.latency, error_rate = args.error_rate,
+                          error_code = args.error_code, values_per_day = {"dv": 1, "iv": args.iv_values_per_day})
+
+    print("Serving synthetic NWIS data at {}; press Ctrl-C to stop".format(server.base_url))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_server(server)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+:Module: nwispy_model.py
+
+:Author: Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center, http://www.usgs.gov/
+
+:Synopsis: Model of a parsed data file for interactive views. Products derived from the data of each parameter, such as range indexes, level of detail pyramids, and decimated series, are built when they are first needed and cached.
+"""
+
+__author__   = "Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center."
+__copyright__ = "http://www.usgs.gov/visual-id/credit_usgs.html#copyright"
+__license__   = __copyright__
+__contact__   = __author__
+
+# my modules
+import nwispy_filereader
+import nwispy_viewer
+import nwispy_series
+
+class NwisDataModel(object):
+    """
+    Model of the data of one parsed data file. Parameters are referred to by
+    their position in nwis_data["parameters"]. Each derived product is built
+    once, when it is first asked for, so views can switch between parameters
+    and files without reading or computing anything again.
+
+    Parameters
+    ----------
+    nwis_data : dictionary
+        A dictionary containing data found in data file.
+    filepath : string
+        String path of the data file, if any.
+
+    Examples
+    --------
+    >>> import nwispy_model
+    >>> model = nwispy_model.NwisDataModel.from_file("03290500_uv.txt")
+    >>> stats = model.get_range_stats(parameter_index = 0, date_min = model.dates[10], date_max = model.dates[100])
+    """
+    def __init__(self, nwis_data, filepath = None):
+        self.data = nwis_data
+        self.filepath = filepath
+        self._cache = {}
+
+    @classmethod
+    def from_file(cls, filepath):
+        """ Return the model of a data file read with nwispy_filereader.read_file() """
+
+        return cls(nwis_data = nwispy_filereader.read_file(filepath), filepath = filepath)
+
+    @property
+    def dates(self):
+        """ Array of dates of the data """
+
+        return self.data["dates"]
+
+    @property
+    def parameters(self):
+        """ List of the parameter dictionaries of the data """
+
+        return self.data["parameters"]
+
+    def _get_cached(self, key, create):
+        """ Return the product cached under a key; create it by calling create() the first time """
+
+        if key not in self._cache:
+            self._cache[key] = create()
+
+        return self._cache[key]
+
+    def clear_cache(self):
+        """ Drop all derived products, such as after the data has changed """
+
+        self._cache.clear()
+
+    def get_timestamps(self):
+        """ Return the int64 timestamps of the dates; shared by all parameters """
+
+        return self._get_cached(("timestamps",), lambda: nwispy_series.get_timestamps(self.dates))
+
+    def get_range_index(self, parameter_index):
+        """ Return the range index of a parameter; see nwispy_series.create_range_index() """
+
+        return self._get_cached(("range index", parameter_index), 
+                                lambda: nwispy_series.create_range_index(dates = self.dates, values = self.parameters[parameter_index]["data"], 
+                                                                         timestamps = self.get_timestamps()))
+
+    def get_lod_pyramid(self, parameter_index):
+        """ Return the level of detail pyramid of a parameter; see nwispy_series.create_lod_pyramid() """
+
+        return self._get_cached(("lod pyramid", parameter_index), 
+                                lambda: nwispy_series.create_lod_pyramid(values = self.parameters[parameter_index]["data"]))
+
+    def get_decimated_series(self, parameter_index, max_points):
+        """ Return the dates and values of a parameter decimated to max_points; see nwispy_viewer.decimate_series() """
+
+        return self._get_cached(("decimated series", parameter_index, max_points), 
+                                lambda: nwispy_viewer.decimate_series(dates = self.dates, values = self.parameters[parameter_index]["data"], 
+                                                                      max_points = max_points))
+
+    def get_range_stats(self, parameter_index, date_min, date_max):
+        """ Return the statistics of a parameter within a date range; see nwispy_series.get_range_stats() """
+
+        return nwispy_series.get_range_stats(index = self.get_range_index(parameter_index), date_min = date_min, date_max = date_max)
+
+    def get_range_indices(self, date_min, date_max):
+        """ Return the start and end (exclusive) positions of the values within a date range; see nwispy_series.search_timestamps() """
+
+        return nwispy_series.search_timestamps(timestamps = self.get_timestamps(), date_min = date_min, date_max = date_max)
+
+    def get_lod_series(self, parameter_index, start, end, max_points):
+        """
+        Return the dates and values to plot for a range of a parameter with 
+        about max_points points, and the bucket size of the level of detail 
+        that was used; see nwispy_series.get_lod_indices().
+        """
+        indices, bucket_size = nwispy_series.get_lod_indices(pyramid = self.get_lod_pyramid(parameter_index), start = start, end = end, 
+                                                             max_points = max_points)
+
+        return self.dates[indices], self.parameters[parameter_index]["data"][indices], bucket_size
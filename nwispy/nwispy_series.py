@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+:Module: nwispy_series.py
+
+:Author: Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center, http://www.usgs.gov/
+
+:Synopsis: Precomputed indexes of data series for interactive plots, such as constant time statistics of a selected date range and level of detail pyramids for drawing zoomed ranges at screen resolution.
+"""
+
+__author__   = "Jeremiah Lant, jlant@usgs.gov, U.S. Geological Survey, Kentucky Water Science Center."
+__copyright__ = "http://www.usgs.gov/visual-id/credit_usgs.html#copyright"
+__license__   = __copyright__
+__contact__   = __author__
+
+import numpy as np
+import datetime
+
+# number of values in each block of the min/max sparse table of a range index
+BLOCK_SIZE = 64
+
+# number of buckets of the coarsest level of a level of detail pyramid
+LOD_MIN_BUCKETS = 256
+
+def get_timestamps(dates):
+    """
+    Return an array of int64 timestamps, in seconds since 1970-01-01, of
+    dates; fractions of seconds are dropped.
+
+    Parameters
+    ----------
+    dates : array or list of datetime.datetime
+        Dates to convert.
+
+    Returns
+    -------
+    timestamps : numpy array
+        Array of int64 timestamps.
+
+    Examples
+    --------
+    >>> import nwispy_series
+    >>> import datetime
+    >>> nwispy_series.get_timestamps([datetime.datetime(2014, 1, 1, 8, 15)])
+    array([1388564100])
+    """
+    # a generator over the datetime fields is about three times faster than converting an object array to datetime64 
+    epoch = datetime.date(1970, 1, 1).toordinal()
+    timestamps = np.fromiter(((date.toordinal() - epoch) * 86400 + date.hour * 3600 + date.minute * 60 + date.second for date in dates), 
+                             dtype = np.int64, count = len(dates))
+
+    return timestamps
+
+def create_range_index(dates, values, block_size = BLOCK_SIZE, timestamps = None):
+    """
+    Create an index of a series for statistics of any date range in constant
+    time. The index holds the int64 timestamps of the dates, prefix sums of
+    the values and of the number of valid (not nan) values, and sparse tables
+    of the minimum and maximum of blocks of block_size values.
+
+    Parameters
+    ----------
+    dates : array of datetime.datetime
+        Array of dates of the series in increasing order.
+    values : array of float
+        Array of values of the series; missing values are nan.
+    block_size : int
+        Number of values in each block of the sparse tables.
+    timestamps : numpy array
+        Array of int64 timestamps of the dates, if already converted with 
+        get_timestamps(); shared by the indexes of series with the same dates.
+
+    Returns
+    -------
+    index : dictionary
+        Dictionary of the range index; see get_range_stats().
+    """
+    values = np.asarray(values, dtype = float)
+    valid = ~np.isnan(values)
+
+    # missing values are never a minimum or maximum
+    low = np.where(valid, values, np.inf)
+    high = np.where(valid, values, -np.inf)
+
+    # pad the last block; padding is never a minimum or maximum
+    blocks = int(np.ceil(len(values) / float(block_size)))
+    padding = blocks * block_size - len(values)
+    block_low = np.concatenate([low, np.repeat(np.inf, padding)]).reshape(blocks, block_size).min(axis = 1)
+    block_high = np.concatenate([high, np.repeat(-np.inf, padding)]).reshape(blocks, block_size).max(axis = 1)
+
+    index = {
+        "timestamps": timestamps if timestamps is not None else get_timestamps(dates),
+        "sums": np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))]),
+        "counts": np.concatenate([[0], np.cumsum(valid)]),
+        "low": low,
+        "high": high,
+        "block size": block_size,
+        "min table": _create_sparse_table(block_low, np.minimum),
+        "max table": _create_sparse_table(block_high, np.maximum)
+    }
+
+    return index
+
+def _create_sparse_table(values, function):
+    """
+    Return a list of arrays where the array at level k holds the function
+    (np.minimum or np.maximum) of the 2**k values starting at each position
+    """
+    table = [values]
+    width = 1
+    while 2 * width <= len(values):
+        previous = table[-1]
+        table.append(function(previous[:-width], previous[width:]))
+        width *= 2
+
+    return table
+
+def _query_sparse_table(table, start, end, function):
+    """ Return the function (np.minimum or np.maximum) of the values from start to end (exclusive) of a sparse table """
+
+    level = int(np.log2(end - start))
+
+    return function(table[level][start], table[level][end - 2**level])
+
+def get_range_indices(index, date_min, date_max):
+    """
+    Return the start and end (exclusive) positions of the values of a range
+    index that are within a date range, found by binary search.
+
+    Parameters
+    ----------
+    index : dictionary
+        Dictionary of a range index; see create_range_index().
+    date_min : datetime.datetime
+        First date of the range.
+    date_max : datetime.datetime
+        Last date of the range; included.
+
+    Returns
+    -------
+    start, end : int
+        Positions of the first value and after the last value in the range.
+    """
+    return search_timestamps(timestamps = index["timestamps"], date_min = date_min, date_max = date_max)
+
+def search_timestamps(timestamps, date_min, date_max):
+    """
+    Return the start and end (exclusive) positions of the timestamps that are
+    within a date range, found by binary search.
+
+    Parameters
+    ----------
+    timestamps : numpy array
+        Array of int64 timestamps in increasing order; see get_timestamps().
+    date_min : datetime.datetime
+        First date of the range.
+    date_max : datetime.datetime
+        Last date of the range; included.
+
+    Returns
+    -------
+    start, end : int
+        Positions of the first timestamp and after the last timestamp in the range.
+
+    Examples
+    --------
+    >>> import nwispy_series
+    >>> import datetime
+    >>> dates = [datetime.datetime(2014, 1, 1) + datetime.timedelta(i) for i in range(5)]
+    >>> nwispy_series.search_timestamps(timestamps = nwispy_series.get_timestamps(dates), date_min = dates[1], date_max = dates[3])
+    (1, 4)
+    """
+    bounds = get_timestamps([date_min, date_max])
+    start = np.searchsorted(timestamps, bounds[0], side = "left")
+    end = np.searchsorted(timestamps, bounds[1], side = "right")
+
+    return int(start), int(end)
+
+def get_range_stats(index, date_min, date_max):
+    """
+    Return the mean, max, and min of the values of a series within a date
+    range, ignoring missing values. Only two binary searches and a constant
+    number of array lookups are needed, no matter how long the series or the
+    range are; at most two partial blocks of values are scanned.
+
+    Parameters
+    ----------
+    index : dictionary
+        Dictionary of a range index; see create_range_index().
+    date_min : datetime.datetime
+        First date of the range.
+    date_max : datetime.datetime
+        Last date of the range; included.
+
+    Returns
+    -------
+    stats : dictionary
+        Dictionary of the "start" and "end" positions of the range, and the
+        "count" of valid values, "mean", "max", and "min" of the range; the
+        statistics are nan if there are no valid values in the range.
+
+    Examples
+    --------
+    >>> import nwispy_series
+    >>> import datetime
+    >>> import numpy as np
+    >>> dates = [datetime.datetime(2014, 1, 1) + datetime.timedelta(i) for i in range(5)]
+    >>> index = nwispy_series.create_range_index(dates = dates, values = np.array([1.0, 4.0, np.nan, 2.0, 8.0]))
+    >>> stats = nwispy_series.get_range_stats(index = index, date_min = dates[1], date_max = dates[3])
+    >>> stats["count"], stats["mean"], stats["max"], stats["min"]
+    (2, 3.0, 4.0, 2.0)
+    """
+    start, end = get_range_indices(index = index, date_min = date_min, date_max = date_max)
+
+    stats = {"start": start, "end": end, "count": 0, "mean": np.nan, "max": np.nan, "min": np.nan}
+
+    count = int(index["counts"][end] - index["counts"][start]) if end > start else 0
+    if count == 0:
+        return stats
+
+    # whole blocks from the sparse tables; the partial blocks at the ends are scanned
+    block_size = index["block size"]
+    first_block = -(-start // block_size)
+    last_block = end // block_size
+    if first_block < last_block:
+        range_min = min(_query_sparse_table(index["min table"], first_block, last_block, np.minimum),
+                        index["low"][start:first_block * block_size].min() if start < first_block * block_size else np.inf,
+                        index["low"][last_block * block_size:end].min() if last_block * block_size < end else np.inf)
+        range_max = max(_query_sparse_table(index["max table"], first_block, last_block, np.maximum),
+                        index["high"][start:first_block * block_size].max() if start < first_block * block_size else -np.inf,
+                        index["high"][last_block * block_size:end].max() if last_block * block_size < end else -np.inf)
+    else:
+        range_min = index["low"][start:end].min()
+        range_max = index["high"][start:end].max()
+
+    stats["count"] = count
+    stats["mean"] = (index["sums"][end] - index["sums"][start]) / count
+    stats["max"] = float(range_max)
+    stats["min"] = float(range_min)
+
+    return stats
+
+def create_lod_pyramid(values, min_buckets = LOD_MIN_BUCKETS):
+    """
+    Create a level of detail pyramid of a series for plotting any range of it
+    at the resolution of the screen. Each level splits the series into 
+    buckets twice the size of the buckets of the level below it and holds the
+    positions of the minimum, maximum, and a missing (nan) value of each 
+    bucket, so peaks and gaps are drawn at every level. Levels are added 
+    as long as the new level has at least min_buckets buckets. The values 
+    are kept to scan the buckets at the edges of a range; see get_lod_indices().
+
+    Parameters
+    ----------
+    values : array of float
+        Array of values of the series; missing values are nan.
+    min_buckets : int
+        Minimum number of buckets of the coarsest level.
+
+    Returns
+    -------
+    pyramid : dictionary
+        Dictionary of the "length" of the series, the "low" and "high" arrays
+        of its values with missing values set to inf and -inf, and a list of 
+        its "levels" from finest to coarsest; each level is a dictionary of 
+        the "bucket size" and the arrays of the "min", "max", and "missing" 
+        positions of each bucket; a missing position is -1 if the bucket has
+        no missing values.
+    """
+    values = np.asarray(values, dtype = float)
+    valid = ~np.isnan(values)
+
+    # missing values are never a minimum or maximum
+    low = np.where(valid, values, np.inf)
+    high = np.where(valid, values, -np.inf)
+
+    positions = np.arange(len(values))
+    level = {"bucket size": 1, "min": positions, "max": positions, "missing": np.where(valid, -1, positions)}
+
+    levels = []
+    while len(level["min"]) >= 2 * min_buckets:
+        level = _merge_lod_level(level = level, low = low, high = high)
+        levels.append(level)
+
+    pyramid = {"length": len(values), "low": low, "high": high, "levels": levels}
+
+    return pyramid
+
+def _merge_lod_level(level, low, high):
+    """ Return the next level of a level of detail pyramid; merge each pair of buckets of a level """
+
+    # pair the last bucket with itself if there is an odd number of buckets
+    if len(level["min"]) % 2:
+        level = dict((key, np.append(value, value[-1]) if key != "bucket size" else value) for key, value in level.items())
+
+    first_min, second_min = level["min"][0::2], level["min"][1::2]
+    first_max, second_max = level["max"][0::2], level["max"][1::2]
+    first_missing, second_missing = level["missing"][0::2], level["missing"][1::2]
+
+    merged = {
+        "bucket size": 2 * level["bucket size"],
+        "min": np.where(low[first_min] <= low[second_min], first_min, second_min),
+        "max": np.where(high[first_max] >= high[second_max], first_max, second_max),
+        "missing": np.where(first_missing >= 0, first_missing, second_missing)
+    }
+
+    return merged
+
+def get_lod_indices(pyramid, start, end, max_points):
+    """
+    Return the positions of the values to plot for a range of a series, 
+    taken from the finest level of a level of detail pyramid that has at 
+    most about max_points points in the range, such as two points for each 
+    pixel of the width of an axes. All values are plotted if the range has 
+    at most max_points values. The first and last values of the range are 
+    always included. The buckets at the edges of the range that are only 
+    partly in it are scanned at full resolution, so the peaks and gaps of 
+    the range are drawn wherever they are.
+
+    Parameters
+    ----------
+    pyramid : dictionary
+        Dictionary of a level of detail pyramid; see create_lod_pyramid().
+    start : int
+        Position of the first value of the range.
+    end : int
+        Position after the last value of the range.
+    max_points : int
+        Number of points to plot the range with.
+
+    Returns
+    -------
+    indices : numpy array
+        Array of positions of the values to plot in increasing order.
+    bucket_size : int
+        Bucket size of the level used; 1 if all values are plotted.
+
+    Examples
+    --------
+    >>> import nwispy_series
+    >>> import numpy as np
+    >>> pyramid = nwispy_series.create_lod_pyramid(values = np.array([1.0, 5.0, 2.0, np.nan, 3.0, 0.0, 4.0, 1.0]), min_buckets = 2)
+    >>> nwispy_series.get_lod_indices(pyramid = pyramid, start = 0, end = 8, max_points = 4)
+    (array([0, 1, 3, 5, 6, 7]), 4)
+    """
+    start = max(0, start)
+    end = min(pyramid["length"], end)
+    if end - start <= max_points or not pyramid["levels"]:
+        return np.arange(start, end), 1
+
+    # finest level with few enough points, or the coarsest level
+    level = pyramid["levels"][-1]
+    for candidate in pyramid["levels"]:
+        if 2 * (end - start) <= max_points * candidate["bucket size"]:
+            level = candidate
+            break
+
+    # buckets that are whole in the range from the level
+    bucket_size = level["bucket size"]
+    first = -(-start // bucket_size)
+    last = end // bucket_size
+    missing = level["missing"][first:last]
+    positions = [level["min"][first:last], level["max"][first:last], missing[missing >= 0], [start, end - 1]]
+
+    # the edge buckets that are partly in the range are scanned, like the partial blocks of get_range_stats()
+    for edge_start, edge_end in [(start, min(end, first * bucket_size)), (max(start, last * bucket_size), end)]:
+        if edge_start < edge_end:
+            low = pyramid["low"][edge_start:edge_end]
+            high = pyramid["high"][edge_start:edge_end]
+            edge_missing = np.flatnonzero((low == np.inf) & (high == -np.inf))[:1]
+            positions.append(edge_start + np.concatenate([[np.argmin(low), np.argmax(high)], edge_missing]))
+
+    indices = np.unique(np.concatenate(positions)).astype(int)
+
+    return indices, bucket_size
@@ -14,12 +14,30 @@ __contact__   = __author__
 
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import matplotlib.image as mimage
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from textwrap import wrap
 
 import datetime
 import numpy as np
 import os
 
+# my modules
+import nwispy_helpers
+
+# resolution of saved plots in dots per inch
+PLOT_DPI = 100
+
+# number of points kept for each horizontal pixel of a plot when series are decimated
+POINTS_PER_PIXEL = 2
+
+# version of the look of saved plots; increase it when the drawing code changes so saved plots are rendered again
+PLOT_STYLE_VERSION = 1
+
+# size in inches of preview thumbnails; saved at PLOT_DPI
+PREVIEW_FIGSIZE = (2.4, 0.8)
+
 def print_info(nwis_data):
     """   
     Print information contained in the data dictionary. 
@@ -61,6 +79,12 @@ def print_info(nwis_data):
     print("Date retrieved: {0}".format(nwis_data["date_retrieved"]))
     print("Gage name: {0}".format(nwis_data["gage_name"]))
     print("Timestep: {0}".format(nwis_data["timestep"]))
+
+    site = nwis_data.get("site")
+    if site:
+        print("Location: {0}, {1}".format(site["latitude"], site["longitude"]))
+        print("Drainage area: {0} square miles".format(site["drainage area"]))
+        print("Time zone: {0}".format(site["time zone"]))
     
     print("Parameters:")
     for parameter in nwis_data["parameters"]:
@@ -69,10 +93,11 @@ def print_info(nwis_data):
         print("      max: {}".format(parameter["max"]))
         print("      min: {}".format(parameter["min"]))
 
-def plot_data(nwis_data, is_visible = True, save_path = None):
+def plot_data(nwis_data, is_visible = True, save_path = None, decimate = True, dashboard = False, preview = False):
     """   
     Plot each parameter contained in the nwis data. Save plots to a particular
-    path.
+    path. Plots that are not shown are rendered without the pyplot state 
+    machine with render_parameter() or render_dashboard().
     
     Parameters
     ----------
@@ -84,78 +109,626 @@ def plot_data(nwis_data, is_visible = True, save_path = None):
         
     save_path : string 
         String path to save plot(s) 
+
+    decimate : bool
+        Boolean value to reduce long series of saved plots to about 
+        POINTS_PER_PIXEL points per pixel with decimate_series()
+
+    dashboard : bool
+        Boolean value to plot all parameters in a single figure of subplots
+        with a shared date axis instead of a figure for each parameter
+
+    preview : bool
+        Boolean value to save a preview thumbnail of each parameter with 
+        render_preview() instead; previews are never shown
     """
+    if preview:
+        if save_path:
+            for parameter in nwis_data["parameters"]:
+                render_preview(nwis_data = nwis_data, parameter = parameter, save_path = save_path, decimate = decimate)
+        return
+
+    if dashboard:
+        if not is_visible:
+            if save_path:
+                render_dashboard(nwis_data = nwis_data, save_path = save_path, decimate = decimate)
+            return
+
+        fig = plt.figure(figsize = get_dashboard_figsize(nwis_data))
+        draw_dashboard(fig = fig, nwis_data = nwis_data, decimate = False)
+
+        # the shown plot is not decimated; its fingerprint says so, so it is rendered again when saved without the window
+        if save_path:
+            save_figure(fig = fig, filepath = get_dashboard_filepath(nwis_data = nwis_data, save_path = save_path), 
+                        fingerprint = get_plot_fingerprint(nwis_data = nwis_data, parameters = nwis_data["parameters"], decimate = False))
+
+        plt.show()
+        return
     
     for parameter in nwis_data["parameters"]:
+
+        # render off screen; no pyplot globals
+        if not is_visible:
+            if save_path:
+                render_parameter(nwis_data = nwis_data, parameter = parameter, save_path = save_path, decimate = decimate)
+            continue
         
+        # keep every value so the plot window can be zoomed in
         fig = plt.figure(figsize=(12,10))
-        ax = fig.add_subplot(111)
-        ax.grid(True)
-        ax.set_title(nwis_data["gage_name"] + " (" + nwis_data["timestep"] + ")")
-        ax.set_xlabel("Date")
-        ylabel = "\n".join(wrap(parameter["description"], 60))
-        ax.set_ylabel(ylabel)
-
-        if "Discharge" in parameter["description"]:
-            color_str = "b"
-        elif "Gage height" in parameter["description"]:
-            color_str = "g"
-        elif "Precipitation" in parameter["description"]:
-            color_str = "DarkBlue"
-        elif "Temperature" in parameter["description"]:
-            color_str = "orange"
-        else:
-            color_str = "k"
-
-        plt.plot(nwis_data["dates"], parameter["data"], color = color_str, label = ylabel) 
-        plt.fill_between(nwis_data["dates"], parameter["min"], parameter["data"], facecolor = color_str, alpha = 0.5)
-            
-        # rotate and align the tick labels so they look better
-        fig.autofmt_xdate()
-        
-        # use a more precise date string for the x axis locations in the
-        # toolbar
-        ax.fmt_xdata = mdates.DateFormatter("%Y-%m-%d")
-     
-        # legend; make it transparent    
-        handles, labels = ax.get_legend_handles_labels()
-        legend = ax.legend(handles, labels, fancybox = True)
-        legend.get_frame().set_alpha(0.5)
-        legend.draggable(state=True)
-        
-        # show text of mean, max, min values on graph; use matplotlib.patch.Patch properies and bbox
-        text = "mean = %.2f\nmax = %.2f\nmin = %.2f" % (parameter["mean"], parameter["max"], parameter["min"])
-        patch_properties = {"boxstyle": "round",
-                            "facecolor": "wheat",
-                            "alpha": 0.5
-                            }
-                       
-        ax.text(0.05, 0.95, text, transform = ax.transAxes, fontsize = 14, 
-                verticalalignment = "top", horizontalalignment = "left", bbox = patch_properties)
+        ax = draw_parameter(fig = fig, nwis_data = nwis_data, parameter = parameter, decimate = False)
+
+        # legend can be dragged in the plot window
+        ax.get_legend().draggable(state=True)
         
-        # save plots
+        # save plots; with the fingerprint of a plot that is not decimated
         if save_path:        
-            # set the size of the figure to be saved
-            curr_fig = plt.gcf()
-            curr_fig.set_size_inches(12, 10)
-            
-            # keep filename string short enough to be saved properly; keep only usgs gage number, description shortened if it exceeds 50 characters 
-            short_gage_name = " ".join(nwis_data["gage_name"].split()[0:2])            
-            if len(parameter["description"]) > 50:
-                short_description = parameter["description"].split(",")[0] 
-                filename = " - ".join([short_gage_name, short_description])  + ".png"           
-                filepath = os.path.join(save_path, filename)
-                plt.savefig(filepath, dpi = 100)
-            else:
-                filename = " - ".join([short_gage_name, parameter["description"]])  + ".png"           
-                filepath = os.path.join(save_path, filename)
-                plt.savefig(filepath, dpi = 100)
+            save_figure(fig = fig, filepath = get_plot_filepath(nwis_data = nwis_data, parameter = parameter, save_path = save_path), 
+                        fingerprint = get_plot_fingerprint(nwis_data = nwis_data, parameters = [parameter], decimate = False))
             
         # show plots
-        if is_visible:
-            plt.show()
-        else:
-            plt.close()
+        plt.show()
+
+def draw_parameter(fig, nwis_data, parameter, decimate = True):
+    """   
+    Draw the plot of a parameter on a figure.
+    
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure to draw on.
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    parameter : dictionary
+        A dictionary of the parameter in nwis_data["parameters"] to plot.
+    decimate : bool
+        Boolean value to reduce the series to about POINTS_PER_PIXEL points 
+        per pixel of the width of the plot when saved at PLOT_DPI.
+
+    Returns
+    -------
+    ax : matplotlib.axes.Axes
+        The axes of the plot.
+    """
+    ax = fig.add_subplot(111)
+    ax.set_title(nwis_data["gage_name"] + " (" + nwis_data["timestep"] + ")")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("\n".join(wrap(parameter["description"], 60)))
+
+    draw_series(fig = fig, ax = ax, nwis_data = nwis_data, parameter = parameter, decimate = decimate)
+        
+    # rotate and align the tick labels so they look better
+    fig.autofmt_xdate()
+
+    return ax
+
+def draw_series(fig, ax, nwis_data, parameter, decimate = True, fontsize = 14, legend = True):
+    """   
+    Draw the values of a parameter, its legend and the text of its mean, max 
+    and min values on an axes.
+    
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure of the axes.
+    ax : matplotlib.axes.Axes
+        The axes to draw on.
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    parameter : dictionary
+        A dictionary of the parameter in nwis_data["parameters"] to plot.
+    decimate : bool
+        Boolean value to reduce the series to about POINTS_PER_PIXEL points 
+        per pixel of the width of the axes when saved at PLOT_DPI.
+    fontsize : int
+        Font size of the text of the mean, max and min values.
+    legend : bool
+        Boolean value to show a legend of the parameter description.
+    """
+    ax.grid(True)
+    label = "\n".join(wrap(parameter["description"], 60))
+    color_str = get_parameter_color(parameter)
+
+    dates = nwis_data["dates"]
+    values = parameter["data"]
+    if decimate:
+        width = ax.get_position().width * fig.get_figwidth() * PLOT_DPI
+        dates, values = decimate_series(dates = dates, values = values, max_points = int(width * POINTS_PER_PIXEL))
+
+    ax.plot(dates, values, color = color_str, label = label) 
+    ax.fill_between(dates, parameter["min"], values, facecolor = color_str, alpha = 0.5)
+    
+    # use a more precise date string for the x axis locations in the
+    # toolbar
+    ax.fmt_xdata = mdates.DateFormatter("%Y-%m-%d")
+ 
+    # legend; make it transparent    
+    if legend:
+        handles, labels = ax.get_legend_handles_labels()
+        ax.legend(handles, labels, fancybox = True).get_frame().set_alpha(0.5)
+    
+    # show text of mean, max, min values on graph; use matplotlib.patch.Patch properies and bbox
+    text = "mean = %.2f\nmax = %.2f\nmin = %.2f" % (parameter["mean"], parameter["max"], parameter["min"])
+    patch_properties = {"boxstyle": "round",
+                        "facecolor": "wheat",
+                        "alpha": 0.5
+                        }
+                   
+    ax.text(0.05, 0.95, text, transform = ax.transAxes, fontsize = fontsize, 
+            verticalalignment = "top", horizontalalignment = "left", bbox = patch_properties)
+
+def get_parameter_color(parameter):
+    """ Return the matplotlib color string of a parameter based on its description """
+
+    if "Discharge" in parameter["description"]:
+        color_str = "b"
+    elif "Gage height" in parameter["description"]:
+        color_str = "g"
+    elif "Precipitation" in parameter["description"]:
+        color_str = "DarkBlue"
+    elif "Temperature" in parameter["description"]:
+        color_str = "orange"
+    else:
+        color_str = "k"
+
+    return color_str
+
+def draw_dashboard(fig, nwis_data, decimate = True):
+    """   
+    Draw all parameters of the nwis data on a figure as a column of subplots 
+    that share the date axis, so zooming or panning one subplot moves all 
+    of them.
+    
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure to draw on.
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    decimate : bool
+        Boolean value to reduce each series to about POINTS_PER_PIXEL points 
+        per pixel of the width of the subplots when saved at PLOT_DPI.
+
+    Returns
+    -------
+    axes : list of matplotlib.axes.Axes
+        The axes of each parameter.
+    """
+    fig.suptitle(nwis_data["gage_name"] + " (" + nwis_data["timestep"] + ")", fontsize = 14)
+
+    # fixed margins in inches; the figure height grows with the number of parameters 
+    height = fig.get_figheight()
+    fig.subplots_adjust(left = 0.1, right = 0.95, top = 1 - 0.6 / height, hspace = 0.15)
+
+    axes = []
+    nrows = len(nwis_data["parameters"])
+    for i, parameter in enumerate(nwis_data["parameters"]):
+        ax = fig.add_subplot(nrows, 1, i + 1, sharex = axes[0] if axes else None)
+        ax.set_ylabel("\n".join(wrap(parameter["description"].split(",")[0], 20)))
+        draw_series(fig = fig, ax = ax, nwis_data = nwis_data, parameter = parameter, decimate = decimate, fontsize = 10, legend = False)
+        axes.append(ax)
+
+    if axes:
+        axes[-1].set_xlabel("Date")
+
+    # rotate the tick labels of the bottom subplot and hide them on the others; keep the bottom margin
+    fig.autofmt_xdate(bottom = 1.0 / height)
+
+    return axes
+
+def get_dashboard_figsize(nwis_data):
+    """ Return the figure size in inches of the dashboard of the nwis data; 2.5 inches of height for each parameter """
+
+    return (12, max(4, 2.5 * len(nwis_data["parameters"]) + 1))
+
+def decimate_series(dates, values, max_points):
+    """   
+    Reduce a series to at most about max_points points for plotting with a 
+    min/max envelope. The series is split into max_points / 2 buckets of 
+    consecutive values and only the minimum and maximum of each bucket are 
+    kept, in time order, so peaks are drawn exactly. A missing (nan) value of
+    a bucket is kept too so gaps in the data stay visible. Series that are 
+    short enough are returned as is.
+    
+    Parameters
+    ----------
+    dates : numpy array
+        Array of dates of the series.
+    values : numpy array
+        Array of float values of the series.
+    max_points : int
+        Number of points to reduce the series to.
+
+    Returns
+    -------
+    dates, values : numpy arrays
+        Arrays of the dates and values of the reduced series.
+
+    Examples
+    --------
+    >>> import nwispy_viewer
+    >>> import numpy as np
+    >>> values = np.array([1.0, 5.0, 2.0, np.nan, 3.0, 0.0, 4.0, 1.0])
+    >>> nwispy_viewer.decimate_series(dates = np.arange(8), values = values, max_points = 4)
+    (array([0, 1, 3, 5, 6]), array([ 1.,  5., nan,  0.,  4.]))
+    """
+    values = np.asarray(values, dtype = float)
+    buckets = max(1, max_points // 2)
+    if len(values) <= 2 * buckets:
+        return dates, values
+
+    # pad the values to equal sized buckets; padding is never a minimum, maximum, or missing value
+    size = int(np.ceil(len(values) / float(buckets)))
+    padding = buckets * size - len(values)
+    missing = np.concatenate([np.isnan(values), np.zeros(padding, dtype = bool)]).reshape(buckets, size)
+    low = np.concatenate([np.where(np.isnan(values), np.inf, values), np.repeat(np.inf, padding)]).reshape(buckets, size)
+    high = np.concatenate([np.where(np.isnan(values), -np.inf, values), np.repeat(-np.inf, padding)]).reshape(buckets, size)
+
+    offsets = np.arange(buckets) * size
+    has_values = np.isfinite(low.min(axis = 1))
+    has_missing = missing.any(axis = 1)
+
+    indices = np.concatenate([(offsets + low.argmin(axis = 1))[has_values], 
+                              (offsets + high.argmax(axis = 1))[has_values], 
+                              (offsets + missing.argmax(axis = 1))[has_missing]])
+    indices = np.unique(indices)
+
+    return np.asarray(dates)[indices], values[indices]
+
+def get_plot_filepath(nwis_data, parameter, save_path):
+    """   
+    Return the path of the saved plot of a parameter.
+    
+    Parameters
+    ----------
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    parameter : dictionary
+        A dictionary of the parameter in nwis_data["parameters"].
+    save_path : string 
+        String path to save plot(s) 
+
+    Returns
+    -------
+    filepath : string
+        String path of the plot file.
+    """
+    # keep filename string short enough to be saved properly; keep only usgs gage number, description shortened if it exceeds 50 characters 
+    short_gage_name = " ".join(nwis_data["gage_name"].split()[0:2])            
+    if len(parameter["description"]) > 50:
+        short_description = parameter["description"].split(",")[0] 
+        filename = " - ".join([short_gage_name, short_description])  + ".png"           
+    else:
+        filename = " - ".join([short_gage_name, parameter["description"]])  + ".png"           
+
+    return os.path.join(save_path, filename)
+
+def get_preview_filepath(nwis_data, parameter, save_path):
+    """   
+    Return the path of the saved preview thumbnail of a parameter; the path 
+    of the plot of the parameter ending with "- preview.png".
+    
+    Parameters
+    ----------
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    parameter : dictionary
+        A dictionary of the parameter in nwis_data["parameters"].
+    save_path : string 
+        String path to save plot(s) 
+
+    Returns
+    -------
+    filepath : string
+        String path of the preview file.
+    """
+    filepath = get_plot_filepath(nwis_data = nwis_data, parameter = parameter, save_path = save_path)
+
+    return os.path.splitext(filepath)[0] + " - preview.png"
+
+def get_dashboard_filepath(nwis_data, save_path):
+    """   
+    Return the path of the saved dashboard of all parameters.
+    
+    Parameters
+    ----------
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    save_path : string 
+        String path to save plot(s) 
+
+    Returns
+    -------
+    filepath : string
+        String path of the plot file.
+    """
+    short_gage_name = " ".join(nwis_data["gage_name"].split()[0:2])            
+    filename = " - ".join([short_gage_name, nwis_data["timestep"], "dashboard"]) + ".png"
+
+    return os.path.join(save_path, filename)
+
+def get_plot_fingerprint(nwis_data, parameters, decimate):
+    """   
+    Return the fingerprint of a saved plot; the hash of the source data file,
+    the parameter codes, and the settings that change the look of the plot. 
+    Return None if the nwis data does not have the hash of its source file in
+    nwis_data["source_hash"], such as data parsed from a web service stream.
+    
+    Parameters
+    ----------
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    parameters : list of dictionaries
+        List of the parameters in nwis_data["parameters"] in the plot.
+    decimate : bool
+        Boolean value to reduce long series with decimate_series().
+
+    Returns
+    -------
+    fingerprint : dictionary
+        Dictionary of the fingerprint of the plot.
+    """
+    if not nwis_data.get("source_hash"):
+        return None
+
+    fingerprint = {
+        "source": nwis_data["source_hash"],
+        "parameters": [parameter["code"] for parameter in parameters],
+        "decimate": decimate,
+        "points per pixel": POINTS_PER_PIXEL,
+        "dpi": PLOT_DPI,
+        "style": PLOT_STYLE_VERSION
+    }
+
+    return fingerprint
+
+def is_plot_current(filepath, fingerprint):
+    """   
+    Return True if a saved plot exists and was rendered with the same 
+    fingerprint, which is stored next to the plot in a file with the 
+    extension .fingerprint.
+    
+    Parameters
+    ----------
+    filepath : string
+        String path of the plot file.
+    fingerprint : dictionary
+        Dictionary of the fingerprint of the plot; see get_plot_fingerprint().
+
+    Returns
+    -------
+    is_current : bool
+        Boolean value of whether the plot does not need to be rendered again.
+    """
+    if not fingerprint or not os.path.isfile(filepath):
+        return False
+
+    return nwispy_helpers.read_manifest(path = filepath + ".fingerprint") == fingerprint
+
+def save_figure(fig, filepath, fingerprint = None):
+    """   
+    Save a figure and the fingerprint of the plot next to it. A fingerprint 
+    of an earlier plot is removed if the figure has no fingerprint, so the 
+    plot is never mistaken for current.
+    
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure to save.
+    filepath : string
+        String path of the plot file.
+    fingerprint : dictionary
+        Dictionary of the fingerprint of the plot; see get_plot_fingerprint().
+    """
+    fig.savefig(filepath, dpi = PLOT_DPI)
+
+    if fingerprint:
+        nwispy_helpers.write_manifest(path = filepath + ".fingerprint", manifest = fingerprint)
+    elif os.path.isfile(filepath + ".fingerprint"):
+        os.remove(filepath + ".fingerprint")
+
+def render_parameter(nwis_data, parameter, save_path, decimate = True):
+    """   
+    Render the plot of a parameter with the Agg backend and save it. A new 
+    Figure is used for each plot and the pyplot state machine is not touched, 
+    so plots can be rendered in worker processes and threads. The plot is not
+    rendered again if it is current; see is_plot_current().
+    
+    Parameters
+    ----------
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    parameter : dictionary
+        A dictionary of the parameter in nwis_data["parameters"] to plot.
+    save_path : string 
+        String path to save the plot to.
+    decimate : bool
+        Boolean value to reduce long series with decimate_series().
+
+    Returns
+    -------
+    filepath : string
+        String path of the plot file.
+    """
+    filepath = get_plot_filepath(nwis_data = nwis_data, parameter = parameter, save_path = save_path)
+    fingerprint = get_plot_fingerprint(nwis_data = nwis_data, parameters = [parameter], decimate = decimate)
+    if is_plot_current(filepath = filepath, fingerprint = fingerprint):
+        return filepath
+
+    fig = Figure(figsize = (12, 10))
+    FigureCanvasAgg(fig)
+
+    draw_parameter(fig = fig, nwis_data = nwis_data, parameter = parameter, decimate = decimate)
+
+    save_figure(fig = fig, filepath = filepath, fingerprint = fingerprint)
+
+    return filepath
+
+def render_dashboard(nwis_data, save_path, decimate = True):
+    """   
+    Render the dashboard of all parameters with the Agg backend and save it
+    in a single pass. The pyplot state machine is not touched, so dashboards
+    can be rendered in worker processes and threads. The dashboard is not 
+    rendered again if it is current; see is_plot_current().
+    
+    Parameters
+    ----------
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    save_path : string 
+        String path to save the plot to.
+    decimate : bool
+        Boolean value to reduce long series with decimate_series().
+
+    Returns
+    -------
+    filepath : string
+        String path of the plot file.
+    """
+    filepath = get_dashboard_filepath(nwis_data = nwis_data, save_path = save_path)
+    fingerprint = get_plot_fingerprint(nwis_data = nwis_data, parameters = nwis_data["parameters"], decimate = decimate)
+    if is_plot_current(filepath = filepath, fingerprint = fingerprint):
+        return filepath
+
+    fig = Figure(figsize = get_dashboard_figsize(nwis_data))
+    FigureCanvasAgg(fig)
+
+    draw_dashboard(fig = fig, nwis_data = nwis_data, decimate = decimate)
+
+    save_figure(fig = fig, filepath = filepath, fingerprint = fingerprint)
+
+    return filepath
+
+def render_preview(nwis_data, parameter, save_path, decimate = True):
+    """   
+    Render a sparkline preview thumbnail of a parameter with the Agg backend
+    and save it. The thumbnail is PREVIEW_FIGSIZE inches at PLOT_DPI, has no 
+    axes, legend or text box, and only a small label of the gage number and 
+    parameter, so it is much faster to render and encode than a plot. The 
+    thumbnail is not rendered again if it is current; see is_plot_current().
+    
+    Parameters
+    ----------
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    parameter : dictionary
+        A dictionary of the parameter in nwis_data["parameters"] to plot.
+    save_path : string 
+        String path to save the thumbnail to.
+    decimate : bool
+        Boolean value to reduce long series with decimate_series().
+
+    Returns
+    -------
+    filepath : string
+        String path of the thumbnail file.
+    """
+    filepath = get_preview_filepath(nwis_data = nwis_data, parameter = parameter, save_path = save_path)
+    fingerprint = get_plot_fingerprint(nwis_data = nwis_data, parameters = [parameter], decimate = decimate)
+    if is_plot_current(filepath = filepath, fingerprint = fingerprint):
+        return filepath
+
+    fig = Figure(figsize = PREVIEW_FIGSIZE)
+    FigureCanvasAgg(fig)
+
+    ax = fig.add_axes([0, 0, 1, 0.8])
+    ax.set_axis_off()
+
+    dates = nwis_data["dates"]
+    values = parameter["data"]
+    if decimate:
+        dates, values = decimate_series(dates = dates, values = values, max_points = int(PREVIEW_FIGSIZE[0] * PLOT_DPI * POINTS_PER_PIXEL))
+
+    ax.plot(dates, values, color = get_parameter_color(parameter), linewidth = 0.8)
+
+    gage_number = nwis_data["gage_name"].split()[1]
+    fig.text(0.01, 0.98, gage_number + " " + parameter["description"].split(",")[0], fontsize = 6, 
+             verticalalignment = "top", horizontalalignment = "left")
+
+    save_figure(fig = fig, filepath = filepath, fingerprint = fingerprint)
+
+    return filepath
+
+def create_contact_sheet(filepaths, sheet_path, padding = 2):
+    """   
+    Pack preview thumbnails into a single contact sheet image. Each list of 
+    thumbnails is a row of the sheet, such as the thumbnails of a data file.
+    The thumbnails are copied as images, so no plot is rendered again.
+    
+    Parameters
+    ----------
+    filepaths : list of lists of strings
+        Lists of string paths of the thumbnails of each row.
+    sheet_path : string 
+        String path to save the contact sheet to.
+    padding : int
+        Number of white pixels around each thumbnail.
+
+    Returns
+    -------
+    shape : tuple
+        Tuple of the height and width of the contact sheet in pixels.
+    """
+    rows = [[mimage.imread(filepath) for filepath in row] for row in filepaths if row]
+    if not rows:
+        raise ValueError("No thumbnails to pack into contact sheet {}".format(sheet_path))
+
+    images = [image for row in rows for image in row]
+    height = max(image.shape[0] for image in images) + 2 * padding
+    width = max(image.shape[1] for image in images) + 2 * padding
+    columns = max(len(row) for row in rows)
+
+    sheet = np.ones((height * len(rows), width * columns, 4), dtype = np.float32)
+    for i, row in enumerate(rows):
+        for j, image in enumerate(row):
+            top = i * height + padding
+            left = j * width + padding
+            sheet[top:top + image.shape[0], left:left + image.shape[1], :image.shape[2]] = image
+
+    mimage.imsave(sheet_path, sheet)
+
+    return sheet.shape[:2]
+
+def submit_plots(pool, nwis_data, save_path, decimate = True, dashboard = False, preview = False):
+    """   
+    Render and save the plot of each parameter, the dashboard of all 
+    parameters, or the preview thumbnail of each parameter in a process pool.
+    
+    Parameters
+    ----------
+    pool : multiprocessing.Pool
+        The pool of worker processes.
+    nwis_data : dictionary 
+        A dictionary containing data found in data file.
+    save_path : string 
+        String path to save plot(s) 
+    decimate : bool
+        Boolean value to reduce long series with decimate_series().
+    dashboard : bool
+        Boolean value to render all parameters in a single dashboard plot.
+    preview : bool
+        Boolean value to render a preview thumbnail of each parameter.
+
+    Returns
+    -------
+    results : list of multiprocessing.pool.AsyncResult
+        The pending result of each plot; get() returns the path of the plot file
+        or raises the error of the plot.
+    """
+    # only send the data a plot needs to the worker processes
+    shared_data = dict((key, nwis_data.get(key)) for key in ("gage_name", "timestep", "dates", "source_hash"))
+
+    if dashboard:
+        shared_data["parameters"] = nwis_data["parameters"]
+        return [pool.apply_async(render_dashboard, kwds = {"nwis_data": shared_data, "save_path": save_path, "decimate": decimate})]
+
+    render = render_preview if preview else render_parameter
+
+    results = []
+    for parameter in nwis_data["parameters"]:
+        results.append(pool.apply_async(render, kwds = {"nwis_data": shared_data, "parameter": parameter, "save_path": save_path, 
+                                                                           "decimate": decimate}))
+
+    return results
 
 
 def _create_testdata():
@@ -14,13 +14,73 @@ __contact__   = __author__
 
 import os
 import re
+import shutil
 import urllib
 import urllib2
 from StringIO import StringIO
 import numpy as np
 import datetime
+import time
+import zlib
+import gzip
+import json
+import hashlib
+import threading
+import collections
+import random
+import socket
+from multiprocessing.pool import ThreadPool
+import logging
 
-def read_webrequest(filepath):
+# my modules
+import nwispy_helpers
+
+# base url for USGS NWIS Webservice
+BASE_URL = "http://waterservices.usgs.gov/nwis/"
+
+# number of bytes read from a web service response at a time
+CHUNK_SIZE = 64 * 1024
+
+# number of seconds a cached response without an ETag or Last-Modified header is reused
+CACHE_TTL = 3600
+
+# default windows used to split long date ranges; "wy" is one water year (October 1 - September 30), integers are days
+DEFAULT_WINDOWS = {"dv": "wy", "iv": 30}
+
+# limits on coalesced requests; url length in characters and estimated number of data values in a response
+MAX_URL_LENGTH = 2000
+MAX_VALUES = 2000000
+
+# estimated number of values per day for each parameter of a site
+VALUES_PER_DAY = {"dv": 1, "iv": 96}
+
+# number of days before the last local value that are downloaded again when syncing, to pick up revised provisional data
+SYNC_OVERLAP = 1
+
+# comment lines of rdb files that change with every download; merged files keep the line of the latest file
+VOLATILE_COMMENTS = ("# retrieved:",)
+
+# seconds to wait before the first retry of a failed download; doubled for every following retry up to MAX_BACKOFF
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# http status codes of responses that are worth retrying; 429 - too many requests, 5xx - server errors
+RETRY_CODES = (429, 500, 502, 503, 504)
+
+# number of sites in each request to the site service, which accepts up to 100 sites per request
+SITE_BATCH_SIZE = 100
+
+# persistent cache of site descriptions shared by all runs
+SITE_CACHE = os.path.join(os.path.expanduser("~"), ".nwispy", "sites.json")
+
+# dates in web request files; yyyy-mm-dd
+DATE_PATTERN = re.compile("^([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})$")
+
+# locks that keep two threads from writing the same partial download
+_partial_locks = {}
+_partial_locks_lock = threading.Lock()
+
+def read_webrequest(filepath, merge = True):
     """    
     Open web request file, create a file object for read_webrequest_in(filestream) 
     to process.    
@@ -29,6 +89,8 @@ def read_webrequest(filepath):
     ----------
     filepath : str
         String file path.
+    merge : bool
+        Boolean value to merge overlapping requests.
     
     Returns
     -------
@@ -40,18 +102,25 @@ def read_webrequest(filepath):
     read_webrequest_in : Read data file object         
     """    
     with open(filepath, "r") as f:
-        data = read_webrequest_in(f)
+        data = read_webrequest_in(f, merge = merge)
         
     return data
 
-def read_webrequest_in(filestream):
+def read_webrequest_in(filestream, merge = True):
     """    
-    Read a webrequest file and put data into a dictionary.
+    Read a webrequest file and put data into a dictionary. The file is read 
+    one line at a time, so very large request files are never held in memory.
+    Each row is validated; a row that is not valid is skipped and reported 
+    with its line number. Exact duplicate requests are dropped and, if merge
+    is True, overlapping date ranges of the same site, data type, and 
+    parameter are merged with merge_requests().
    
     Parameters
     ----------
     filestream : file object
         A file object that contains an open data file.
+    merge : bool
+        Boolean value to merge overlapping requests.
     
     Returns
     -------
@@ -60,55 +129,213 @@ def read_webrequest_in(filestream):
 
     Notes
     -----
-    data = {"column names": [], "requests": []}
+    data = {"column names": [], "requests": [], "errors": []}
                
     The "requests" key in the data dictionary contains a list of dictionaries containing
     the requests information found in the requests file. For example:
     
     requests[0] = {"data type": str, "site number": str, "start date": str, "end date": str, "parameters": list of str}       
-    """
-    data_file = filestream.readlines()
 
-    patterns = {
-        "column_names": "(#)(.+)", 
-        "dv_iv_row": "(dv|iv|)\t([0-9]+)\t([0-9]{4}-[0-9]{1,2}-[0-9]{1,2})\t([0-9]{4}-[0-9]{1,2}-[0-9]{1,2})\t(.+)", # match site only at the beginning of a line
-        "site_row": "(site)\t([0-9]+)" 
-    }  
+    The "errors" key contains a list of dictionaries describing the rows that were skipped:
 
+    errors[0] = {"line number": int, "line": str, "message": str}
+
+    See Also
+    --------
+    parse_webrequest_row : Validate a row of a web request file
+    merge_requests : Merge duplicate and overlapping requests
+    """
     # initialize a dictionary to hold all the data 
     data = {
         "column names": [],
         "requests": [],
+        "errors": []
     } 
 
-    for line in data_file: 
-        match_column_names = re.search(pattern = patterns["column_names"], string = line)
-        match_dv_iv_row = re.search(pattern = patterns["dv_iv_row"], string = line)
-        match_site_row = re.search(pattern = patterns["site_row"], string = line)  
-        
-        if match_column_names:
-            data["column names"] = match_column_names.group(2).strip().split("\t")
-            
-        if match_dv_iv_row:
-            data["requests"].append({
-                "data type": match_dv_iv_row.group(1),
-                "site number": match_dv_iv_row.group(2),
-                "start date": match_dv_iv_row.group(3),
-                "end date": match_dv_iv_row.group(4),
-                "parameters": match_dv_iv_row.group(5).strip().split("\t")                
-            })
+    seen = set()
+    for line_number, line in enumerate(filestream, 1): 
+        line = line.strip()
+        if not line:
+            continue
 
-        if match_site_row:
-            data["requests"].append({
-                "data type": match_site_row.group(1),
-                "site number": match_site_row.group(2),
-                "start date": "",
-                "end date": "",
-                "parameters": ""                
-            })
+        if line.startswith("#"):
+            data["column names"] = line[1:].strip().split("\t")
+            continue
+
+        try:
+            data_request = parse_webrequest_row(fields = line.split("\t"))
+        except ValueError as error:
+            logging.warn("*Bad request* line {}: {} - {}. *Solution* - Skipping request".format(line_number, line, error))
+            data["errors"].append({"line number": line_number, "line": line, "message": str(error)})
+            continue
+
+        # drop exact duplicates
+        key = (data_request["data type"], data_request["site number"], data_request["start date"], data_request["end date"], 
+               tuple(data_request["parameters"]))
+        if key in seen:
+            continue
+        seen.add(key)
+
+        data["requests"].append(data_request)
+
+    if merge:
+        data["requests"] = merge_requests(data_requests = data["requests"])
 
     return data
 
+def parse_webrequest_row(fields):
+    """    
+    Validate the tab separated fields of a row of a web request file and 
+    return the request.
+
+    Parameters
+    ----------
+    fields : list of str
+        List of the fields of a row.
+
+    Returns
+    -------
+    data_request : dictionary
+        Dictionary holding the request; dates are formatted as yyyy-mm-dd.
+
+    Raises
+    ------
+    ValueError
+        If the data type, site number, dates, or parameters are not valid.
+
+    Examples
+    --------
+    >>> import nwispy_webservice
+    >>> nwispy_webservice.parse_webrequest_row(fields = ["dv", "03284000", "2014-1-1", "2014-03-10", "00060", ""])
+    {'data type': 'dv', 'site number': '03284000', 'start date': '2014-01-01', 'end date': '2014-03-10', 'parameters': ['00060']}
+    """
+    fields = [field.strip() for field in fields]
+    data_type = fields[0]
+
+    if data_type not in ("dv", "iv", "site"):
+        raise ValueError("unknown data type '{}'; expected dv, iv, or site".format(data_type))
+
+    if len(fields) < 2 or not fields[1].isdigit():
+        raise ValueError("site number must be a number")
+
+    if data_type == "site":
+        return {"data type": "site", "site number": fields[1], "start date": "", "end date": "", "parameters": ""}
+
+    if len(fields) < 4:
+        raise ValueError("start date and end date are required")
+
+    dates = [_parse_date(date_str) for date_str in fields[2:4]]
+
+    if dates[0] > dates[1]:
+        raise ValueError("start date is after end date")
+
+    parameters = [field for field in fields[4:] if field]
+    if not parameters:
+        raise ValueError("at least one parameter code is required")
+
+    for parameter in parameters:
+        if len(parameter) != 5 or not parameter.isdigit():
+            raise ValueError("parameter code '{}' is not a 5 digit code".format(parameter))
+
+    data_request = {
+        "data type": data_type,
+        "site number": fields[1],
+        "start date": dates[0].isoformat(),
+        "end date": dates[1].isoformat(),
+        "parameters": parameters
+    }
+
+    return data_request
+
+def merge_requests(data_requests):
+    """    
+    Merge requests of the same site, data type, and parameter whose date 
+    ranges overlap or touch, and combine the parameters of a site and data 
+    type that end up with the same date range into one request. Requests are
+    returned in the order their site and data type first appear.
+
+    Parameters
+    ----------
+    data_requests : list of dictionaries
+        List of dictionaries containing data requests.
+
+    Returns
+    -------
+    merged_requests : list of dictionaries
+        List of dictionaries containing the merged data requests.
+
+    Examples
+    --------
+    >>> import nwispy_webservice
+    >>> requests = [{"data type": "dv", "site number": "03284000", "start date": "2014-01-01", "end date": "2014-03-10", "parameters": ["00060", "00065"]},
+    ...             {"data type": "dv", "site number": "03284000", "start date": "2014-03-01", "end date": "2014-04-01", "parameters": ["00060"]}]
+    >>> [(r["start date"], r["end date"], r["parameters"]) for r in nwispy_webservice.merge_requests(requests)]
+    [('2014-01-01', '2014-04-01', ['00060']), ('2014-01-01', '2014-03-10', ['00065'])]
+    """
+    # date ranges of each parameter of each site and data type; in order of appearance
+    sites = collections.OrderedDict()
+    for data_request in data_requests:
+        parameter_ranges = sites.setdefault((data_request["data type"], data_request["site number"]), collections.OrderedDict())
+
+        if data_request["data type"] not in ("dv", "iv"):
+            continue
+
+        for parameter in data_request["parameters"]:
+            parameter_ranges.setdefault(parameter, []).append((data_request["start date"], data_request["end date"]))
+
+    merged_requests = []
+    for (data_type, site_number), parameter_ranges in sites.items():
+        if data_type not in ("dv", "iv"):
+            merged_requests.append({"data type": data_type, "site number": site_number, "start date": "", "end date": "", "parameters": ""})
+            continue
+
+        # merge the date ranges of each parameter; dates are yyyy-mm-dd so they sort as strings
+        groups = collections.OrderedDict()
+        for parameter, date_ranges in parameter_ranges.items():
+            merged = []
+            for start_date, end_date in sorted(date_ranges):
+                if merged:
+                    next_day = _format_date(_parse_date(merged[-1][1]) + datetime.timedelta(days = 1))
+                    if start_date <= next_day:
+                        merged[-1][1] = max(merged[-1][1], end_date)
+                        continue
+
+                merged.append([start_date, end_date])
+
+            for start_date, end_date in merged:
+                groups.setdefault((start_date, end_date), []).append(parameter)
+
+        for (start_date, end_date), parameters in groups.items():
+            merged_requests.append({
+                "data type": data_type,
+                "site number": site_number,
+                "start date": start_date,
+                "end date": end_date,
+                "parameters": parameters
+            })
+
+    return merged_requests
+
+def write_webrequest(filepath, data_requests):
+    """    
+    Write data requests to a web request file that can be read with read_webrequest().
+
+    Parameters
+    ----------
+    filepath : str
+        String file path.
+    data_requests : list of dictionaries
+        List of dictionaries containing data requests.
+    """
+    with open(filepath, "w") as f:
+        f.write("# data_type\tsite_num\tstart_date\tend_date\tparameters\n")
+        for data_request in data_requests:
+            if data_request["data type"] == "site":
+                f.write("\t".join(["site", data_request["site number"]]) + "\n")
+            else:
+                f.write("\t".join([data_request["data type"], data_request["site number"], data_request["start date"], data_request["end date"]] + 
+                                  list(data_request["parameters"])) + "\n")
+
 def encode_url(data_request):
     """    
     Encode the url needed for the USGS NWIS webservice based on users requests.
@@ -143,10 +370,15 @@ def encode_url(data_request):
     
     return user_parameters_url
     
-def download_file(user_parameters_url, data_type, filename, file_destination):
+def download_file(user_parameters_url, data_type, filename, file_destination, chunk_size = CHUNK_SIZE, keep_compressed = False, cache = None, rate_limiter = None, resume = False, base_url = None):
     """    
     Download data from the web and save files to a specified file destination 
-    with a specified filename.
+    with a specified filename. The response is streamed to disk in chunks so 
+    that large requests are never held in memory. A gzip compressed response
+    is requested from the web service and is decompressed while streaming 
+    unless keep_compressed is True. If a cache is supplied, unchanged responses
+    are served from the cache instead of being downloaded again. If resume is
+    True, an interrupted download is kept and continued by a later call.
 
     Parameters
     ----------
@@ -158,18 +390,1874 @@ def download_file(user_parameters_url, data_type, filename, file_destination):
         String filename.
     file_destination : str
         String path to save file to.
+    chunk_size : int
+        Number of bytes to read from the response at a time.
+    keep_compressed : bool
+        Boolean value to save a gzip compressed response as is; ".gz" is appended to filename.
+    cache : dictionary
+        A response cache created by open_cache().
+    rate_limiter : dictionary
+        A rate limiter created by create_rate_limiter(); waits for a token before contacting the web service.
+    resume : bool
+        Boolean value to keep the bytes of an interrupted download and continue it with an http Range request.
+    base_url : str
+        String base url of the web service; defaults to BASE_URL.
+
+    Returns
+    -------
+    download_info : dictionary
+        Dictionary containing the file path, number of bytes, duration, and throughput of the download,
+        and whether it was served from the cache.
     
     Notes
     -----    
     The base url for USGS NWIS Webservice - http://waterservices.usgs.gov/nwis/
+    
+    A local stand-in web service, such as nwispy_mockservice, can be used by 
+    passing its base_url.
+
+    See Also
+    --------
+    stream_to_file : Write a file object to disk in chunks
+    open_cache : Open a response cache
+    download_partial : Download to a partial file that can be resumed
+    """    
+    if resume:
+        partfile = os.path.join(file_destination, "partial", get_cache_key(user_parameters_url = user_parameters_url, data_type = data_type) + ".part")
+
+        with _partial_locks_lock:
+            partial_lock = _partial_locks.setdefault(partfile, threading.Lock())
+
+        with partial_lock:
+            return download_partial(user_parameters_url = user_parameters_url, data_type = data_type, filename = filename, 
+                                    file_destination = file_destination, partfile = partfile, chunk_size = chunk_size, 
+                                    keep_compressed = keep_compressed, cache = cache, rate_limiter = rate_limiter, base_url = base_url)
+
+    service_url = (base_url or BASE_URL) + data_type + "/?" 
+    request = urllib2.Request(service_url, user_parameters_url)
+    request.add_header("Accept-Encoding", "gzip")
+
+    cache_entry = None
+    if cache:
+        cache_key = get_cache_key(user_parameters_url = user_parameters_url, data_type = data_type)
+        cache_entry = read_cache_entry(cache = cache, key = cache_key)
+
+        # reuse responses without validators for the cache time to live; revalidate the rest
+        if cache_entry and is_cache_entry_fresh(cache = cache, cache_entry = cache_entry):
+            return copy_cache_entry(cache = cache, cache_entry = cache_entry, filename = filename, file_destination = file_destination, 
+                                    chunk_size = chunk_size, keep_compressed = keep_compressed)
+
+        add_cache_validators(request = request, cache_entry = cache_entry)
+
+    if rate_limiter:
+        acquire_token(rate_limiter = rate_limiter)
+
+    try:
+        response = urllib2.urlopen(request)
+
+    except urllib2.HTTPError as error:
+        # 304 - not modified; the cached response is still valid
+        if error.code == 304 and cache_entry:
+            cache_entry["time"] = time.time()
+            write_cache_entry(cache = cache, key = cache_key, cache_entry = cache_entry)
+
+            return copy_cache_entry(cache = cache, cache_entry = cache_entry, filename = filename, file_destination = file_destination, 
+                                    chunk_size = chunk_size, keep_compressed = keep_compressed)
+        raise
+
+    is_compressed = response.info().get("Content-Encoding", "").lower() == "gzip"
+    decompress = is_compressed and not keep_compressed
+    if is_compressed and keep_compressed:
+        filename = filename + ".gz"
+
+    content_length = response.info().get("Content-Length", "")
+    if content_length.isdigit():
+        content_length = int(content_length)
+    else:
+        content_length = None
+
+    outputfile = os.path.join(file_destination, filename)
+    try:
+        download_info = stream_to_file(stream = response, filepath = outputfile, chunk_size = chunk_size, decompress = decompress, content_length = content_length)
+    finally:
+        response.close()
+
+    download_info["cached"] = False
+
+    logging.info("Downloaded {} - {} bytes in {:.2f} seconds ({:.1f} KB/s)".format(os.path.basename(download_info["filepath"]), 
+                                                                                   download_info["bytes"], 
+                                                                                   download_info["duration"], 
+                                                                                   download_info["throughput"] / 1024.0))
+
+    if cache:
+        store_cache_entry(cache = cache, key = cache_key, filepath = outputfile, cache_entry = {
+            "url": user_parameters_url,
+            "data type": data_type,
+            "etag": response.info().get("ETag"),
+            "last modified": response.info().get("Last-Modified"),
+            "compressed": is_compressed and keep_compressed
+        })
+
+    return download_info
+
+def download_partial(user_parameters_url, data_type, filename, file_destination, partfile, chunk_size = CHUNK_SIZE, keep_compressed = False, cache = None, rate_limiter = None, base_url = None):
+    """    
+    Download data from the web to a partial file that survives interruptions.
+    The bytes of the response are appended to partfile as they are sent by the
+    web service (still gzip compressed, if it was compressed) and a manifest 
+    (partfile + ".json") records the url and the response validators. If a 
+    partial file from an interrupted download exists, only the missing bytes 
+    are requested with an http Range request; if the web service does not 
+    support ranges or the data changed, the download starts over. Once 
+    complete, the partial file is decompressed or renamed to filename.
+
+    Parameters
+    ----------
+    user_parameters_url : str
+        String encoded url based on user request file.
+    data_type : str
+        String of intantaneous data (iv) or daily data (dv).
+    filename : str
+        String filename.
+    file_destination : str
+        String path to save file to.
+    partfile : str
+        String path of partial file.
+    chunk_size : int
+        Number of bytes to read from the response at a time.
+    keep_compressed : bool
+        Boolean value to save a gzip compressed response as is; ".gz" is appended to filename.
+    cache : dictionary
+        A response cache created by open_cache().
+    rate_limiter : dictionary
+        A rate limiter created by create_rate_limiter().
+    base_url : str
+        String base url of the web service; defaults to BASE_URL.
+
+    Returns
+    -------
+    download_info : dictionary
+        Dictionary containing the file path, number of bytes, duration, and throughput of the download, 
+        whether it was served from the cache, and the number of bytes it was resumed from.
+
+    Notes
+    -----
+    manifest = {"url": str, "data type": str, "etag": str, "last modified": str, "content encoding": str, "content length": int}
+    """
+    start_time = time.time()
+
+    manifest = read_partial_manifest(partfile = partfile)
+    offset = 0
+    if manifest and manifest["url"] == user_parameters_url and manifest["data type"] == data_type:
+        offset = os.path.getsize(partfile)
+
+    service_url = (base_url or BASE_URL) + data_type + "/?" 
+    request = urllib2.Request(service_url, user_parameters_url)
+
+    if offset:
+        # ranges refer to the bytes as sent, so the encoding has to match the partial file
+        request.add_header("Accept-Encoding", manifest["content encoding"] or "identity")
+        request.add_header("Range", "bytes={}-".format(offset))
+        if manifest["etag"] or manifest["last modified"]:
+            request.add_header("If-Range", manifest["etag"] or manifest["last modified"])
+    else:
+        request.add_header("Accept-Encoding", "gzip")
+
+    cache_entry = None
+    if cache:
+        cache_key = get_cache_key(user_parameters_url = user_parameters_url, data_type = data_type)
+        cache_entry = read_cache_entry(cache = cache, key = cache_key)
+
+        # a partial download is continued rather than revalidated
+        if cache_entry and not offset:
+            if is_cache_entry_fresh(cache = cache, cache_entry = cache_entry):
+                return copy_cache_entry(cache = cache, cache_entry = cache_entry, filename = filename, file_destination = file_destination, 
+                                        chunk_size = chunk_size, keep_compressed = keep_compressed)
+
+            add_cache_validators(request = request, cache_entry = cache_entry)
+
+    if rate_limiter:
+        acquire_token(rate_limiter = rate_limiter)
+
+    try:
+        response = urllib2.urlopen(request)
+
+    except urllib2.HTTPError as error:
+        # 304 - not modified; the cached response is still valid
+        if error.code == 304 and cache_entry:
+            cache_entry["time"] = time.time()
+            write_cache_entry(cache = cache, key = cache_key, cache_entry = cache_entry)
+
+            return copy_cache_entry(cache = cache, cache_entry = cache_entry, filename = filename, file_destination = file_destination, 
+                                    chunk_size = chunk_size, keep_compressed = keep_compressed)
+
+        # 416 - range not satisfiable; the partial file does not match the data anymore, start over
+        if error.code == 416 and offset:
+            remove_partial(partfile = partfile)
+            return download_partial(user_parameters_url = user_parameters_url, data_type = data_type, filename = filename, 
+                                    file_destination = file_destination, partfile = partfile, chunk_size = chunk_size, 
+                                    keep_compressed = keep_compressed, cache = cache, rate_limiter = rate_limiter, base_url = base_url)
+        raise
+
+    headers = response.info()
+
+    # 206 - partial content; anything else is the full response
+    if offset and response.getcode() == 206:
+        content_range = headers.get("Content-Range", "")
+        if not content_range.startswith("bytes {}-".format(offset)):
+            response.close()
+            raise IOError("Unexpected Content-Range '{}' resuming {} at byte {}".format(content_range, filename, offset))
+        mode = "ab"
+    else:
+        offset = 0
+        mode = "wb"
+        manifest = {
+            "url": user_parameters_url,
+            "data type": data_type,
+            "etag": headers.get("ETag"),
+            "last modified": headers.get("Last-Modified"),
+            "content encoding": headers.get("Content-Encoding", "").lower() or None,
+            "content length": int(headers.get("Content-Length")) if headers.get("Content-Length", "").isdigit() else None
+        }
+        nwispy_helpers.make_directory(path = file_destination, directory_name = "partial")
+        write_partial_manifest(partfile = partfile, manifest = manifest)
+
+    # append the bytes as they are sent; the partial file is kept if the transfer is interrupted
+    num_bytes = 0
+    try:
+        with open(partfile, mode) as f:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                num_bytes += len(chunk)
+    finally:
+        response.close()
+
+    if manifest["content length"] is not None and offset + num_bytes < manifest["content length"]:
+        raise IOError("Download of {} interrupted after {} of {} bytes".format(filename, num_bytes, manifest["content length"]))
+
+    is_compressed = manifest["content encoding"] == "gzip"
+    if is_compressed and keep_compressed:
+        filename = filename + ".gz"
+
+    outputfile = os.path.join(file_destination, filename)
+    if is_compressed and not keep_compressed:
+        with open(partfile, "rb") as f:
+            stream_to_file(stream = f, filepath = outputfile, chunk_size = chunk_size, decompress = True)
+        os.remove(partfile)
+    else:
+        nwispy_helpers.replace_file(src = partfile, dst = outputfile)
+
+    remove_partial(partfile = partfile)
+
+    duration = time.time() - start_time
+    download_info = {
+        "filepath": outputfile,
+        "bytes": num_bytes,
+        "bytes written": os.path.getsize(outputfile),
+        "duration": duration,
+        "throughput": num_bytes / duration if duration > 0 else float(num_bytes),
+        "cached": False,
+        "resumed from": offset
+    }
+
+    if offset:
+        logging.info("Resumed {} at byte {}".format(os.path.basename(outputfile), offset))
+
+    logging.info("Downloaded {} - {} bytes in {:.2f} seconds ({:.1f} KB/s)".format(os.path.basename(outputfile), num_bytes, duration, download_info["throughput"] / 1024.0))
+
+    if cache:
+        store_cache_entry(cache = cache, key = cache_key, filepath = outputfile, cache_entry = {
+            "url": user_parameters_url,
+            "data type": data_type,
+            "etag": manifest["etag"],
+            "last modified": manifest["last modified"],
+            "compressed": is_compressed and keep_compressed
+        })
+
+    return download_info
+
+def read_partial_manifest(partfile):
+    """    
+    Read the manifest of a partial download.
+
+    Parameters
+    ----------
+    partfile : str
+        String path of partial file.
+
+    Returns
+    -------
+    manifest : dictionary or None
+        Dictionary holding the url, data type, validators, content encoding, and content length 
+        of the partial download or None if there is no partial download.
+    """
+    if not os.path.exists(partfile) or not os.path.exists(partfile + ".json"):
+        return None
+
+    with open(partfile + ".json", "r") as f:
+        manifest = json.load(f)
+
+    return manifest
+
+def write_partial_manifest(partfile, manifest):
+    """    
+    Write the manifest of a partial download.
+
+    Parameters
+    ----------
+    partfile : str
+        String path of partial file.
+    manifest : dictionary
+        Dictionary holding the url, data type, validators, content encoding, and content length of the download.
+    """
+    with open(partfile + ".json.part", "w") as f:
+        json.dump(manifest, f)
+
+    nwispy_helpers.replace_file(src = partfile + ".json.part", dst = partfile + ".json")
+
+def remove_partial(partfile):
+    """    
+    Remove a partial download, its manifest, and the partial directory if it is empty.
+
+    Parameters
+    ----------
+    partfile : str
+        String path of partial file.
+    """
+    for path in [partfile, partfile + ".json"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    nwispy_helpers.remove_empty_directory(path = os.path.dirname(partfile))
+
+def open_response(user_parameters_url, data_type, rate_limiter = None, base_url = None):
+    """    
+    Open a web service response to read data from as it is downloaded. A gzip 
+    compressed response is requested from the web service.
+
+    Parameters
+    ----------
+    user_parameters_url : str
+        String encoded url based on user request file.
+    data_type : str
+        String of intantaneous data (iv) or daily data (dv).
+    rate_limiter : dictionary
+        A rate limiter created by create_rate_limiter().
+    base_url : str
+        String base url of the web service; defaults to BASE_URL.
+
+    Returns
+    -------
+    response : file object
+        The web service response; check response.info()["Content-Encoding"] for gzip compression.
+
+    See Also
+    --------
+    read_lines : Read lines from a response as it is downloaded
+    """
+    service_url = (base_url or BASE_URL) + data_type + "/?" 
+    request = urllib2.Request(service_url, user_parameters_url)
+    request.add_header("Accept-Encoding", "gzip")
+
+    if rate_limiter:
+        acquire_token(rate_limiter = rate_limiter)
+
+    response = urllib2.urlopen(request)
+
+    return response
+
+def read_lines(stream, chunk_size = CHUNK_SIZE, decompress = False, tee_filepath = None):
+    """    
+    Read lines from a file object, such as a web service response, in fixed 
+    size chunks and yield each line as soon as it is complete, so a parser can
+    process data while it is still being downloaded. The data can be written 
+    to a file at the same time; the file is written to a temporary file 
+    (tee_filepath + ".part") that is renamed to tee_filepath once all lines 
+    have been read.
+
+    Parameters
+    ----------
+    stream : file object
+        A file object to read from.
+    chunk_size : int
+        Number of bytes to read from the stream at a time.
+    decompress : bool
+        Boolean value to gzip decompress the stream while reading.
+    tee_filepath : str
+        String path of a file to write the (decompressed) data to.
+
+    Returns
+    -------
+    lines : generator of str
+        Generator yielding each line including its line ending.
+    """
+    # 16 + MAX_WBITS tells zlib to expect a gzip header and trailer
+    if decompress:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    tee_file = None
+    if tee_filepath:
+        tee_file = open(tee_filepath + ".part", "wb")
+
+    try:
+        remainder = ""
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+
+            if decompress:
+                chunk = decompressor.decompress(chunk)
+
+            if tee_file:
+                tee_file.write(chunk)
+
+            lines = (remainder + chunk).split("\n")
+            remainder = lines.pop()
+            for line in lines:
+                yield line + "\n"
+
+        if decompress:
+            chunk = decompressor.flush()
+            if tee_file:
+                tee_file.write(chunk)
+            remainder += chunk
+
+        if remainder:
+            yield remainder
+
+        if tee_file:
+            tee_file.close()
+            nwispy_helpers.replace_file(src = tee_filepath + ".part", dst = tee_filepath)
+
+    finally:
+        # do not leave a truncated file behind if reading stopped early
+        if tee_file and not tee_file.closed:
+            tee_file.close()
+            os.remove(tee_filepath + ".part")
+
+def open_cache(directory, ttl = CACHE_TTL):
+    """    
+    Open a web service response cache located in a directory. The directory is
+    created if it does not exist. Each cached response is stored as a body file
+    (key.rdb) and a metadata file (key.json) holding the ETag and Last-Modified 
+    validators sent by the web service.
+
+    Parameters
+    ----------
+    directory : str
+        String path of cache directory.
+    ttl : int
+        Number of seconds a cached response that has no validators, such as
+        recent provisional data, is reused without contacting the web service.
+
+    Returns
+    -------
+    cache : dictionary
+        Dictionary holding the cache directory, time to live, and hit and miss counts for this run.
+
+    Notes
+    -----
+    cache = {"directory": str, "ttl": int, "hits": int, "misses": int, "lock": threading.Lock}
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    cache = {
+        "directory": directory,
+        "ttl": ttl,
+        "hits": 0,
+        "misses": 0,
+        "lock": threading.Lock()
+    }
+
+    return cache
+
+def get_cache_key(user_parameters_url, data_type):
+    """    
+    Get the cache key of a web service request.
+
+    Parameters
+    ----------
+    user_parameters_url : str
+        String encoded url based on user request file.
+    data_type : str
+        String of intantaneous data (iv) or daily data (dv).
+
+    Returns
+    -------
+    key : str
+        String sha1 hex digest of the data type and encoded url.
+    """
+    key = hashlib.sha1(data_type + "?" + user_parameters_url).hexdigest()
+
+    return key
+
+def get_cache_body_path(cache, key):
+    """    
+    Get the path of the file holding the body of a cached response.
+
+    Parameters
+    ----------
+    cache : dictionary
+        A response cache created by open_cache().
+    key : str
+        String cache key.
+
+    Returns
+    -------
+    path : str
+        String path to body file.
+    """
+    return os.path.join(cache["directory"], key + ".rdb")
+
+def read_cache_entry(cache, key):
     """    
-    base_url = "http://waterservices.usgs.gov/nwis/" + data_type + "/?" 
-    request = urllib2.Request(base_url, user_parameters_url)
-    response = urllib2.urlopen(request)  
+    Read the metadata of a cached response.
+
+    Parameters
+    ----------
+    cache : dictionary
+        A response cache created by open_cache().
+    key : str
+        String cache key.
+
+    Returns
+    -------
+    cache_entry : dictionary or None
+        Dictionary of cached response metadata or None if the response is not cached.
+
+    Notes
+    -----
+    cache_entry = {"url": str, "data type": str, "etag": str, "last modified": str, "time": float, "compressed": bool}
+    """
+    metadata_path = os.path.join(cache["directory"], key + ".json")
+    if not os.path.exists(metadata_path) or not os.path.exists(get_cache_body_path(cache = cache, key = key)):
+        return None
+
+    with open(metadata_path, "r") as f:
+        cache_entry = json.load(f)
+
+    cache_entry["body"] = get_cache_body_path(cache = cache, key = key)
+
+    return cache_entry
+
+def write_cache_entry(cache, key, cache_entry):
+    """    
+    Write the metadata of a cached response.
+
+    Parameters
+    ----------
+    cache : dictionary
+        A response cache created by open_cache().
+    key : str
+        String cache key.
+    cache_entry : dictionary
+        Dictionary of cached response metadata.
+    """
+    metadata = dict((name, value) for name, value in cache_entry.items() if name != "body")
+
+    metadata_path = os.path.join(cache["directory"], key + ".json")
+    with open(metadata_path + ".part", "w") as f:
+        json.dump(metadata, f)
+
+    nwispy_helpers.replace_file(src = metadata_path + ".part", dst = metadata_path)
+
+def is_cache_entry_fresh(cache, cache_entry):
+    """    
+    Determine if a cached response without validators (ETag or Last-Modified)
+    is younger than the cache time to live and can be used without contacting 
+    the web service. Responses with validators are always revalidated.
+
+    Parameters
+    ----------
+    cache : dictionary
+        A response cache created by open_cache().
+    cache_entry : dictionary
+        Dictionary of cached response metadata.
+
+    Returns
+    -------
+    bool : bool
+    """
+    if cache_entry["etag"] or cache_entry["last modified"]:
+        return False
+
+    return time.time() - cache_entry["time"] < cache["ttl"]
+
+def add_cache_validators(request, cache_entry):
+    """    
+    Add conditional headers to a web service request so the web service 
+    answers 304 (not modified) if the cached response is still valid.
+
+    Parameters
+    ----------
+    request : urllib2.Request
+        A web service request.
+    cache_entry : dictionary or None
+        Dictionary of cached response metadata.
+    """
+    if not cache_entry:
+        return
+
+    if cache_entry["etag"]:
+        request.add_header("If-None-Match", cache_entry["etag"])
+    if cache_entry["last modified"]:
+        request.add_header("If-Modified-Since", cache_entry["last modified"])
+
+def store_cache_entry(cache, key, filepath, cache_entry):
+    """    
+    Store a downloaded file in the cache and count a cache miss.
+
+    Parameters
+    ----------
+    cache : dictionary
+        A response cache created by open_cache().
+    key : str
+        String cache key.
+    filepath : str
+        String path of downloaded file.
+    cache_entry : dictionary
+        Dictionary of cached response metadata; the time is set to now.
+    """
+    cache_entry = dict(cache_entry, time = time.time())
+
+    shutil.copyfile(filepath, get_cache_body_path(cache = cache, key = key))
+    write_cache_entry(cache = cache, key = key, cache_entry = cache_entry)
+
+    with cache["lock"]:
+        cache["misses"] += 1
+
+def copy_cache_entry(cache, cache_entry, filename, file_destination, chunk_size = CHUNK_SIZE, keep_compressed = False):
+    """    
+    Serve a cached response by copying its body to a file destination and 
+    counting a cache hit.
+
+    Parameters
+    ----------
+    cache : dictionary
+        A response cache created by open_cache().
+    cache_entry : dictionary
+        Dictionary of cached response metadata.
+    filename : str
+        String filename.
+    file_destination : str
+        String path to save file to.
+    chunk_size : int
+        Number of bytes to read at a time.
+    keep_compressed : bool
+        Boolean value to keep a gzip compressed body as is; ".gz" is appended to filename.
+
+    Returns
+    -------
+    download_info : dictionary
+        Dictionary containing the file path, number of bytes, and duration of the copy.
+    """
+    decompress = cache_entry["compressed"] and not keep_compressed
+    if cache_entry["compressed"] and keep_compressed:
+        filename = filename + ".gz"
+
+    outputfile = os.path.join(file_destination, filename)
+    with open(cache_entry["body"], "rb") as f:
+        download_info = stream_to_file(stream = f, filepath = outputfile, chunk_size = chunk_size, decompress = decompress)
+
+    download_info["cached"] = True
+
+    with cache["lock"]:
+        cache["hits"] += 1
+
+    logging.info("Served {} from cache".format(os.path.basename(outputfile)))
+
+    return download_info
+
+def plan_windows(start_date, end_date, window):
+    """    
+    Split a date range into consecutive, non-overlapping windows.
+
+    Parameters
+    ----------
+    start_date : str
+        String start date in %Y-%m-%d format.
+    end_date : str
+        String end date in %Y-%m-%d format.
+    window : str or int
+        "wy" to split on water years (October 1 - September 30) or the number of days in each window.
+
+    Returns
+    -------
+    windows : list of tuples
+        List of (start date, end date) string tuples in %Y-%m-%d format.
+
+    Examples
+    --------
+    >>> import nwispy_webservice
+    >>> nwispy_webservice.plan_windows(start_date = "2012-01-01", end_date = "2013-03-17", window = "wy")
+    [('2012-01-01', '2012-09-30'), ('2012-10-01', '2013-03-17')]
+    >>> nwispy_webservice.plan_windows(start_date = "2014-01-01", end_date = "2014-02-14", window = 30)
+    [('2014-01-01', '2014-01-30'), ('2014-01-31', '2014-02-14')]
+    """
+    window = parse_window(window)
+    start = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
+    
+    windows = []
+    while start <= end:
+        if window == "wy":
+            # water year ends on September 30th 
+            if start.month >= 10:
+                window_end = datetime.date(start.year + 1, 9, 30)
+            else:
+                window_end = datetime.date(start.year, 9, 30)
+        else:
+            window_end = start + datetime.timedelta(window - 1)
+
+        window_end = min(window_end, end)
+        windows.append((_format_date(start), _format_date(window_end)))
+
+        start = window_end + datetime.timedelta(1)
+
+    return windows
+
+def parse_window(window):
+    """    
+    Return a window of plan_windows(); "wy" for water years or a positive 
+    number of days.
+
+    Parameters
+    ----------
+    window : str or int
+        "wy" (in any case) or a number of days.
+
+    Returns
+    -------
+    window : str or int
+        "wy" or the number of days as an int.
+
+    Raises
+    ------
+    ValueError
+        If window is not "wy" or a positive number of days.
+    """
+    if str(window).lower() == "wy":
+        return "wy"
+
+    try:
+        days = int(window)
+    except ValueError:
+        days = 0
+
+    if days < 1:
+        raise ValueError("window '{}' is not 'wy' or a positive number of days".format(window))
+
+    return days
+
+def _format_date(date):
+    """ Format a date as %Y-%m-%d; strftime() does not support years before 1900 in python 2 """
+
+    return "{:04d}-{:02d}-{:02d}".format(date.year, date.month, date.day)
+
+def _parse_date(date_str):
+    """ Parse a yyyy-mm-dd date; raise ValueError if it is not valid. Much faster than strptime() for large request files """
+
+    match = DATE_PATTERN.match(date_str)
+    try:
+        if not match:
+            raise ValueError
+        return datetime.date(*[int(group) for group in match.groups()])
+    except ValueError:
+        raise ValueError("date '{}' is not a valid yyyy-mm-dd date".format(date_str))
+
+def download_windows(data_request, filename, file_destination, window, jobs = 4, retries = 2, backoff = BACKOFF, max_backoff = MAX_BACKOFF, 
+                     keep_compressed = False, **kwargs):
+    """    
+    Download a request with a long date range by splitting it into windows 
+    that are downloaded concurrently and merged into a single file. Each
+    window is saved to a "windows" subdirectory of file_destination and 
+    retried on its own if it fails; windows that were already downloaded 
+    by an earlier, failed run are reused. The windows are removed once the 
+    merged file is written.
+
+    Parameters
+    ----------
+    data_request : dictionary
+        A dictionary containing a data request.
+    filename : str
+        String filename of the merged file.
+    file_destination : str
+        String path to save file to.
+    window : str or int
+        "wy" to split on water years or the number of days in each window.
+    jobs : int
+        Number of windows downloaded at the same time.
+    retries : int
+        Number of times a failed window is downloaded again.
+    backoff : float
+        Seconds to wait after the first failed attempt of a window; doubled for every following attempt.
+    max_backoff : float
+        Maximum number of seconds to wait between attempts of a window.
+    keep_compressed : bool
+        Boolean value to gzip compress the merged file; ".gz" is appended to filename.
+    kwargs : keyword arguments
+        Additional keyword arguments passed to download_file(), e.g. cache.
+
+    Returns
+    -------
+    download_info : dictionary
+        Dictionary containing the file path, number of bytes, duration, and throughput of the download
+        and the number of windows.
+
+    Raises
+    ------
+    IOError
+        If one or more windows could not be downloaded after all retries.
+
+    See Also
+    --------
+    plan_windows : Split a date range into windows
+    merge_rdb_files : Merge rdb files into a single file
+    """
+    start_time = time.time()
+
+    windows = plan_windows(start_date = data_request["start date"], end_date = data_request["end date"], window = window)
+
+    request_url = encode_url(data_request)
+    windows_dir = nwispy_helpers.make_directory(path = os.path.join(file_destination, "windows"), 
+                                                directory_name = get_cache_key(user_parameters_url = request_url, data_type = data_request["data type"]))
+
+    def fetch_window(window_dates):
+        """ Download a single window; return the window file path, None if it has no data, or the error """
+
+        window_request = dict(data_request, **{"start date": window_dates[0], "end date": window_dates[1]})
+        window_filename = "_".join([window_dates[0], window_dates[1]]) + ".rdb"
+        window_filepath = os.path.join(windows_dir, window_filename)
+        
+        if os.path.exists(window_filepath):
+            return window_filepath
+
+        last_error = None
+        for attempt in range(retries + 1):
+            try:
+                download_file(user_parameters_url = encode_url(window_request), data_type = data_request["data type"],
+                              filename = window_filename, file_destination = windows_dir, **kwargs)
+                return window_filepath
+
+            except (urllib2.URLError, IOError) as error:
+                # 404 - the web service has no data for this window
+                if isinstance(error, urllib2.HTTPError) and error.code == 404:
+                    return None
+
+                last_error = error
+                logging.warn("*Window failed* {} to {} (attempt {} of {}): {}".format(window_dates[0], window_dates[1], attempt + 1, retries + 1, error))
+
+                if attempt < retries and is_retryable(error):
+                    time.sleep(get_retry_delay(attempt = attempt, error = error, backoff = backoff, max_backoff = max_backoff))
+                else:
+                    break
+
+        return last_error
+
+    pool = ThreadPool(processes = max(1, min(jobs, len(windows))))
+    try:
+        results = pool.map(fetch_window, windows)
+    finally:
+        pool.close()
+        pool.join()
+
+    failed = [window_dates for window_dates, result in zip(windows, results) if isinstance(result, Exception)]
+    if failed:
+        raise IOError("{} of {} window(s) failed for site {}: {}".format(len(failed), len(windows), data_request["site number"], failed))
+
+    window_filepaths = [result for result in results if result]
+    if not window_filepaths:
+        raise IOError("No data found for site {} from {} to {}".format(data_request["site number"], data_request["start date"], data_request["end date"]))
+
+    if keep_compressed:
+        filename = filename + ".gz"
+
+    outputfile = os.path.join(file_destination, filename)
+    merge_rdb_files(filepaths = window_filepaths, outputfile = outputfile)
+
+    shutil.rmtree(windows_dir)
+    nwispy_helpers.remove_empty_directory(path = os.path.dirname(windows_dir))
+
+    num_bytes = os.path.getsize(outputfile)
+    duration = time.time() - start_time
+    download_info = {
+        "filepath": outputfile,
+        "bytes": num_bytes,
+        "duration": duration,
+        "throughput": num_bytes / duration if duration > 0 else float(num_bytes),
+        "windows": len(windows),
+    }
+
+    logging.info("Merged {} window(s) into {}".format(len(window_filepaths), os.path.basename(outputfile)))
+
+    return download_info
+
+def merge_rdb_files(filepaths, outputfile):
+    """    
+    Merge NWIS rdb files into a single rdb file. Comment lines are merged in 
+    the order they are found without duplicates, except for lines that change 
+    with every download (see VOLATILE_COMMENTS), of which only the line of the
+    latest file is kept. Columns are merged by name, and data rows of the same
+    agency, site, date and time zone are merged value by value; a value from
+    a later file takes precedence, but an empty value never replaces a value. 
+    Output files ending in ".gz" are gzip compressed.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        List of string paths of rdb files in chronological order.
+    outputfile : str
+        String path of merged file.
+    """
+    comments = collections.OrderedDict()
+    column_names = []
+    column_formats = {}
+    rows = collections.OrderedDict()
+
+    for filepath in filepaths:
+        if filepath.endswith(".gz"):
+            f = gzip.open(filepath, "rb")
+        else:
+            f = open(filepath, "r")
+
+        with f:
+            for block in read_rdb_blocks(f):
+                for line in block["comments"]:
+                    key = next((prefix for prefix in VOLATILE_COMMENTS if line.startswith(prefix)), line)
+                    comments[key] = line
+                    
+                for name, fmt in zip(block["column names"], block["column formats"]):
+                    if name not in column_formats:
+                        column_names.append(name)
+                        column_formats[name] = fmt
+
+                key_names = [name for name in ("agency_cd", "site_no", "datetime", "tz_cd") if name in block["column names"]]
+                for row in block["rows"]:
+                    values = dict(zip(block["column names"], row))
+                    key = tuple(values[name] for name in key_names)
+
+                    # files of other parameters of the same site have empty values in the columns they do not hold
+                    merged = rows.setdefault(key, {})
+                    merged.update((name, value) for name, value in values.items() if value != "" or name not in merged)
+
+    block = {
+        "comments": comments.values(),
+        "column names": column_names,
+        "column formats": [column_formats[name] for name in column_names],
+        "rows": [[values.get(name, "") for name in column_names] for values in rows.itervalues()]
+    }
+
+    write_rdb_file(outputfile = outputfile, blocks = [block])
+
+def write_rdb_file(outputfile, blocks):
+    """    
+    Write blocks of an NWIS rdb file, as returned by read_rdb_blocks(), to 
+    a file. The file is written to a temporary file (outputfile + ".part") 
+    that is renamed to outputfile when complete. Output files ending in ".gz" 
+    are gzip compressed.
+
+    Parameters
+    ----------
+    outputfile : str
+        String path of rdb file.
+    blocks : list of dictionaries
+        List of dictionaries holding the lines of each block.
+    """
+    if outputfile.endswith(".gz"):
+        f = gzip.open(outputfile + ".part", "wb")
+    else:
+        f = open(outputfile + ".part", "w")
+
+    with f:
+        for block in blocks:
+            for line in block["comments"]:
+                f.write(line + "\n")
+            f.write("\t".join(block["column names"]) + "\n")
+            f.write("\t".join(block["column formats"]) + "\n")
+            for row in block["rows"]:
+                f.write("\t".join(row) + "\n")
+
+    nwispy_helpers.replace_file(src = outputfile + ".part", dst = outputfile)
+
+def read_rdb_blocks(filestream):
+    """    
+    Read an NWIS rdb file and split it into blocks. A block is a run of 
+    comment lines followed by a column names line, a column formats line, 
+    and data rows. Multi-site responses contain one block per site.
+
+    Parameters
+    ----------
+    filestream : file object
+        A file object that contains an open rdb file.
+
+    Returns
+    -------
+    blocks : list of dictionaries
+        List of dictionaries holding the lines of each block.
+
+    Notes
+    -----
+    block = {"comments": list of str, "column names": list of str, "column formats": list of str, "rows": list of lists of str}
+    """
+    blocks = []
+    block = None
+    
+    for line in filestream:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+
+        if line.startswith("#"):
+            # comments after data rows start a new block
+            if block is None or block["column names"]:
+                block = {"comments": [], "column names": [], "column formats": [], "rows": []}
+                blocks.append(block)
+            block["comments"].append(line)
+
+        elif block is None or not block["column names"]:
+            if block is None:
+                block = {"comments": [], "column names": [], "column formats": [], "rows": []}
+                blocks.append(block)
+            block["column names"] = line.split("\t")
+
+        elif not block["column formats"]:
+            block["column formats"] = line.split("\t")
+
+        else:
+            block["rows"].append(line.split("\t"))
+
+    return blocks
+
+def plan_coalesced_requests(data_requests, max_url_length = MAX_URL_LENGTH, max_values = MAX_VALUES):
+    """    
+    Group daily (dv) and instantaneous (iv) requests that share a data type,
+    start date, and end date into as few web service calls as possible. Each
+    call requests a comma separated list of sites and parameters; a call is 
+    closed when adding another request would exceed the url length limit or
+    the estimated number of data values in the response. Other requests, such
+    as site requests, are left in calls of their own.
+
+    Parameters
+    ----------
+    data_requests : list of dictionaries
+        List of dictionaries containing data requests.
+    max_url_length : int
+        Maximum number of characters in the url of a call.
+    max_values : int
+        Maximum estimated number of data values (sites x parameters x time steps) in the response of a call.
+
+    Returns
+    -------
+    request_groups : list of dictionaries
+        List of data requests for each web service call. Each has a "requests" key
+        holding the original data requests it covers.
+
+    Notes
+    -----
+    request_groups[0] = {"data type": str, "site number": comma separated str, "start date": str, "end date": str, 
+                         "parameters": list of str, "requests": list of dictionaries}
+    """
+    request_groups = []
+    
+    # index of the call in request_groups that requests are currently added to for each data type, start date, and end date
+    open_groups = {}
+
+    for data_request in data_requests:
+        if data_request["data type"] not in VALUES_PER_DAY:
+            request_groups.append(dict(data_request, requests = [data_request]))
+            continue
+
+        key = (data_request["data type"], data_request["start date"], data_request["end date"])
+
+        if key in open_groups:
+            request_group = request_groups[open_groups[key]]
+
+            sites = request_group["site number"].split(",")
+            if data_request["site number"] not in sites:
+                sites.append(data_request["site number"])
+
+            parameters = list(request_group["parameters"])
+            for parameter in data_request["parameters"]:
+                if parameter not in parameters:
+                    parameters.append(parameter)
+
+            candidate = dict(request_group, **{"site number": ",".join(sites), "parameters": parameters})
+            
+            if len(get_request_url(candidate)) <= max_url_length and estimate_values(candidate) <= max_values:
+                candidate["requests"] = request_group["requests"] + [data_request]
+                request_groups[open_groups[key]] = candidate
+                continue
+
+        # start a new call; it is the one later requests with the same key are added to
+        open_groups[key] = len(request_groups)
+        request_groups.append(dict(data_request, requests = [data_request]))
+
+    return request_groups
+
+def get_request_url(data_request):
+    """    
+    Get the full web service url of a data request.
+
+    Parameters
+    ----------
+    data_request : dictionary
+        A dictionary containing a data request.
+
+    Returns
+    -------
+    url : str
+        String url.
+    """
+    return BASE_URL + data_request["data type"] + "/?" + encode_url(data_request)
+
+def estimate_values(data_request):
+    """    
+    Estimate the number of data values in the response to a data request.
+
+    Parameters
+    ----------
+    data_request : dictionary
+        A dictionary containing a data request; the site number may be a comma separated list of sites.
+
+    Returns
+    -------
+    num_values : int
+        Estimated number of data values; sites x parameters x days x values per day.
+    """
+    start = datetime.datetime.strptime(data_request["start date"], "%Y-%m-%d")
+    end = datetime.datetime.strptime(data_request["end date"], "%Y-%m-%d")
+    num_days = (end - start).days + 1
+    num_sites = len(data_request["site number"].split(","))
+
+    return num_sites * len(data_request["parameters"]) * num_days * VALUES_PER_DAY[data_request["data type"]]
+
+def download_coalesced(request_group, filenames, file_destination, keep_compressed = False, **kwargs):
+    """    
+    Download a coalesced request with one web service call and split the 
+    multi-site response into a file for each of the original requests.
+
+    Parameters
+    ----------
+    request_group : dictionary
+        A coalesced request returned by plan_coalesced_requests().
+    filenames : list of str
+        List of string filenames, one for each of the original requests in request_group["requests"].
+    file_destination : str
+        String path to save files to.
+    keep_compressed : bool
+        Boolean value to gzip compress the files; ".gz" is appended to each filename.
+    kwargs : keyword arguments
+        Additional keyword arguments passed to download_file(), e.g. cache.
+
+    Returns
+    -------
+    filepaths : list of str
+        List of string paths of files written; None for requests without data in the response.
+    """
+    coalesced_dir = nwispy_helpers.make_directory(path = file_destination, directory_name = "coalesced")
+
+    request_url = encode_url(request_group)
+    coalesced_filename = get_cache_key(user_parameters_url = request_url, data_type = request_group["data type"]) + ".rdb"
+    
+    download_info = download_file(user_parameters_url = request_url, data_type = request_group["data type"], 
+                                  filename = coalesced_filename, file_destination = coalesced_dir, **kwargs)
+
+    if keep_compressed:
+        filenames = [filename + ".gz" for filename in filenames]
+
+    filepaths = split_rdb_file(filepath = download_info["filepath"], 
+                               data_requests = request_group["requests"], 
+                               outputfiles = [os.path.join(file_destination, filename) for filename in filenames])
+
+    os.remove(download_info["filepath"])
+    nwispy_helpers.remove_empty_directory(path = coalesced_dir)
+
+    logging.info("Split {} into {} file(s)".format(coalesced_filename, len([filepath for filepath in filepaths if filepath])))
+
+    return filepaths
+
+def split_rdb_file(filepath, data_requests, outputfiles):
+    """    
+    Split a multi-site NWIS rdb file into a file for each data request. Each 
+    file holds the general header, the block of the request's site, and only
+    the parameter columns of the request.
+
+    Parameters
+    ----------
+    filepath : str
+        String path of multi-site rdb file.
+    data_requests : list of dictionaries
+        List of dictionaries containing data requests.
+    outputfiles : list of str
+        List of string paths of files to write, one for each data request.
+
+    Returns
+    -------
+    filepaths : list of str
+        List of string paths of files written; None for requests whose site is not in the file.
+    """
+    with open(filepath, "r") as f:
+        blocks = read_rdb_blocks(f)
+
+    if not blocks:
+        return [None for outputfile in outputfiles]
+
+    # the general header is at the beginning of the first block before the first site section
+    header = []
+    for i, line in enumerate(blocks[0]["comments"]):
+        if re.search("Data provided for site", line):
+            header = blocks[0]["comments"][:i]
+            blocks[0] = dict(blocks[0], comments = blocks[0]["comments"][i:])
+            break
+
+    site_blocks = {}
+    for block in blocks:
+        if block["rows"]:
+            site_blocks[block["rows"][0][block["column names"].index("site_no")]] = block
+
+    filepaths = []
+    for data_request, outputfile in zip(data_requests, outputfiles):
+        block = site_blocks.get(data_request["site number"])
+        if not block:
+            logging.warn("*No data* for site {} in coalesced response".format(data_request["site number"]))
+            filepaths.append(None)
+            continue
+
+        # keep general header lines except site names of other sites
+        comments = []
+        for line in header:
+            match = re.search("#\s+USGS ([0-9]+)\s", line)
+            if match and match.group(1) != data_request["site number"]:
+                continue
+            comments.append(line)
+
+        # keep parameter descriptions and columns of requested parameters only
+        for line in block["comments"]:
+            match = re.search("^#\s+[0-9]{2}\s+([0-9]{5})", line)
+            if match and match.group(1) not in data_request["parameters"]:
+                continue
+            comments.append(line)
+
+        # parameter columns are named dd_parameter(_statistic)(_cd); e.g. 06_00060_00003_cd
+        indices = []
+        for i, name in enumerate(block["column names"]):
+            codes = name.split("_")
+            if name in ("agency_cd", "site_no", "datetime", "tz_cd") or (len(codes) > 1 and codes[1] in data_request["parameters"]):
+                indices.append(i)
+
+        site_block = {
+            "comments": comments,
+            "column names": [block["column names"][i] for i in indices],
+            "column formats": [block["column formats"][i] for i in indices],
+            "rows": [[row[i] if i < len(row) else "" for i in indices] for row in block["rows"]]
+        }
+
+        write_rdb_file(outputfile = outputfile, blocks = [site_block])
+        filepaths.append(outputfile)
+
+    return filepaths
+
+def get_last_dates(filepath):
+    """    
+    Get the date of the last value stored in an NWIS rdb file for each parameter.
+
+    Parameters
+    ----------
+    filepath : str
+        String path of rdb file; files ending in ".gz" are read as gzip compressed files.
+
+    Returns
+    -------
+    last_dates : dictionary
+        Dictionary of parameter code keys (e.g. "00060") and %Y-%m-%d string date values.
+    """
+    if filepath.endswith(".gz"):
+        f = gzip.open(filepath, "rb")
+    else:
+        f = open(filepath, "r")
+
+    last_dates = {}
+    with f:
+        for block in read_rdb_blocks(f):
+            datetime_index = block["column names"].index("datetime")
+            
+            # parameter value columns are named dd_parameter(_statistic); qualification code columns end in _cd
+            value_indices = {}
+            for i, name in enumerate(block["column names"]):
+                codes = name.split("_")
+                if len(codes) > 1 and codes[0].isdigit() and codes[-1] != "cd":
+                    value_indices[i] = codes[1]
+
+            for row in block["rows"]:
+                date = row[datetime_index].split(" ")[0]
+                for i, parameter in value_indices.items():
+                    if i < len(row) and row[i].strip() and date > last_dates.get(parameter, ""):
+                        last_dates[parameter] = date
+
+    return last_dates
+
+def plan_sync_request(data_request, filepath, overlap = SYNC_OVERLAP):
+    """    
+    Plan the request needed to bring a local NWIS rdb file up to date. The 
+    request starts at the earliest of the last dates stored locally for each
+    requested parameter, minus an overlap of a number of days to pick up 
+    revised provisional data, and ends at the request end date or today, 
+    whichever is earlier.
+
+    Parameters
+    ----------
+    data_request : dictionary
+        A dictionary containing a data request.
+    filepath : str
+        String path of local rdb file; if it does not exist the full request is returned.
+    overlap : int
+        Number of days before the last local value to download again.
+
+    Returns
+    -------
+    sync_request : dictionary or None
+        A dictionary containing the data request for the missing data or None if there is nothing to download.
+    """
+    if not os.path.exists(filepath):
+        return data_request
+
+    last_dates = get_last_dates(filepath = filepath)
+
+    # a parameter that is not stored locally yet needs the full date range
+    if not all(parameter in last_dates for parameter in data_request["parameters"]):
+        return data_request
+
+    last_date = min(last_dates[parameter] for parameter in data_request["parameters"])
+
+    start = datetime.datetime.strptime(last_date, "%Y-%m-%d").date() - datetime.timedelta(overlap)
+    start = max(start, datetime.datetime.strptime(data_request["start date"], "%Y-%m-%d").date())
+    end = min(datetime.datetime.strptime(data_request["end date"], "%Y-%m-%d").date(), datetime.date.today())
+
+    if start > end:
+        return None
+
+    sync_request = dict(data_request, **{"start date": _format_date(start), "end date": _format_date(end)})
+
+    return sync_request
+
+def sync_file(data_request, filepath, overlap = SYNC_OVERLAP, **kwargs):
+    """    
+    Bring a local NWIS rdb file up to date by downloading only the data newer 
+    than what is already stored (plus an overlap) and merging it into the 
+    file. Newly downloaded values replace stored values for the same dates.
+
+    Parameters
+    ----------
+    data_request : dictionary
+        A dictionary containing a data request.
+    filepath : str
+        String path of local rdb file; it is created if it does not exist.
+    overlap : int
+        Number of days before the last local value to download again.
+    kwargs : keyword arguments
+        Additional keyword arguments passed to download_file(), e.g. cache.
+
+    Returns
+    -------
+    sync_request : dictionary or None
+        A dictionary containing the data request that was downloaded or None if the file was up to date.
+
+    See Also
+    --------
+    plan_sync_request : Plan the request needed to bring a file up to date
+    """
+    sync_request = plan_sync_request(data_request = data_request, filepath = filepath, overlap = overlap)
+    
+    if sync_request is None:
+        logging.info("{} is up to date".format(os.path.basename(filepath)))
+        return None
+
+    file_destination, filename = os.path.split(filepath)
+    tail_filename = filename + ".tail"
+
+    try:
+        download_info = download_file(user_parameters_url = encode_url(sync_request), data_type = sync_request["data type"],
+                                      filename = tail_filename, file_destination = file_destination, **kwargs)
+
+    except urllib2.HTTPError as error:
+        # 404 - the web service has no new data
+        if error.code == 404 and os.path.exists(filepath):
+            logging.info("No new data for {}".format(os.path.basename(filepath)))
+            return None
+        raise
+
+    if os.path.exists(filepath):
+        merge_rdb_files(filepaths = [filepath, download_info["filepath"]], outputfile = filepath)
+        os.remove(download_info["filepath"])
+    elif filepath.endswith(".gz"):
+        merge_rdb_files(filepaths = [download_info["filepath"]], outputfile = filepath)
+        os.remove(download_info["filepath"])
+    else:
+        nwispy_helpers.replace_file(src = download_info["filepath"], dst = filepath)
+
+    logging.info("Synced {} from {} to {}".format(os.path.basename(filepath), sync_request["start date"], sync_request["end date"]))
+
+    return sync_request
+
+def sync_requests(data_requests, filepath, overlap = SYNC_OVERLAP, **kwargs):
+    """    
+    Bring a local NWIS rdb file up to date for several data requests of the 
+    same site and data type, such as request rows of different parameters. 
+    The requests are synced one after another with sync_file(), so the file 
+    is never read and replaced by two downloads at the same time.
+
+    Parameters
+    ----------
+    data_requests : list of dictionaries
+        List of dictionaries containing data requests.
+    filepath : str
+        String path of local rdb file; it is created if it does not exist.
+    overlap : int
+        Number of days before the last local value to download again.
+    kwargs : keyword arguments
+        Additional keyword arguments passed to download_file(), e.g. cache.
+
+    Returns
+    -------
+    sync_requests : list of dictionaries
+        List of the data requests that were downloaded; empty if the file was up to date.
+    """
+    synced = []
+    for data_request in data_requests:
+        sync_request = sync_file(data_request = data_request, filepath = filepath, overlap = overlap, **kwargs)
+        if sync_request:
+            synced.append(sync_request)
+
+    return synced
+
+def create_rate_limiter(rate, burst = None):
+    """    
+    Create a token bucket rate limiter. Tokens are added to the bucket at a 
+    steady rate up to the burst size; each web service call takes one token.
+
+    Parameters
+    ----------
+    rate : float
+        Number of calls allowed per second.
+    burst : int
+        Maximum number of tokens in the bucket, i.e. the number of calls that can 
+        be made at once after an idle period; defaults to max(1, rate).
+
+    Returns
+    -------
+    rate_limiter : dictionary
+        Dictionary holding the state of the token bucket.
+
+    Notes
+    -----
+    rate_limiter = {"rate": float, "burst": float, "tokens": float, "time": float, "lock": threading.Lock}
+    """
+    if burst is None:
+        burst = max(1.0, rate)
+
+    rate_limiter = {
+        "rate": float(rate),
+        "burst": float(burst),
+        "tokens": float(burst),
+        "time": time.time(),
+        "lock": threading.Lock()
+    }
+
+    return rate_limiter
+
+def acquire_token(rate_limiter):
+    """    
+    Take a token from a rate limiter, waiting until one is available. Safe to
+    call from multiple threads.
+
+    Parameters
+    ----------
+    rate_limiter : dictionary
+        A rate limiter created by create_rate_limiter().
+
+    Returns
+    -------
+    wait : float
+        Number of seconds waited.
+    """
+    with rate_limiter["lock"]:
+        now = time.time()
+        rate_limiter["tokens"] = min(rate_limiter["burst"], rate_limiter["tokens"] + (now - rate_limiter["time"]) * rate_limiter["rate"])
+        rate_limiter["time"] = now
+
+        # reserve the token now; callers that have to wait are served in order
+        rate_limiter["tokens"] -= 1
+        if rate_limiter["tokens"] >= 0:
+            wait = 0.0
+        else:
+            wait = -rate_limiter["tokens"] / rate_limiter["rate"]
+
+    if wait > 0:
+        time.sleep(wait)
+
+    return wait
+
+def is_retryable(error):
+    """    
+    Determine if a failed download is worth retrying; server throttling (429), 
+    server errors (5xx), and connection problems are, other http errors such 
+    as 400 or 404 are not.
+
+    Parameters
+    ----------
+    error : exception
+        The exception raised by the download.
+
+    Returns
+    -------
+    bool : bool
+    """
+    if isinstance(error, urllib2.HTTPError):
+        return error.code in RETRY_CODES
+
+    return isinstance(error, (urllib2.URLError, socket.error, IOError))
+
+def get_retry_delay(attempt, error = None, backoff = BACKOFF, max_backoff = MAX_BACKOFF):
+    """    
+    Get the number of seconds to wait before retrying a failed download using
+    exponential backoff with full jitter. A Retry-After header sent by the web
+    service takes precedence.
+
+    Parameters
+    ----------
+    attempt : int
+        Number of the attempt that failed, starting at 0.
+    error : exception
+        The exception raised by the download.
+    backoff : float
+        Seconds to wait after the first attempt; doubled for every following attempt.
+    max_backoff : float
+        Maximum number of seconds to wait.
+
+    Returns
+    -------
+    delay : float
+        Number of seconds to wait.
+    """
+    if isinstance(error, urllib2.HTTPError) and error.hdrs:
+        retry_after = error.hdrs.get("Retry-After")
+        if retry_after and retry_after.strip().isdigit():
+            return min(float(retry_after), max_backoff)
+
+    delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+    return delay
+
+def run_tasks(tasks, jobs = 4, retries = 2, backoff = BACKOFF, max_backoff = MAX_BACKOFF, callback = None):
+    """    
+    Run download tasks concurrently. A task that fails with a retryable error
+    is retried with exponential backoff and jitter until its retry budget is
+    used up; a task that still fails is recorded in the report and the other
+    tasks carry on. Calls to the web service are rate limited by passing a 
+    rate limiter to download_file() through the task keyword arguments.
+    A callback is called in the worker thread as soon as a task succeeds, so
+    the downloaded files can be handed on while other tasks are running.
+
+    Parameters
+    ----------
+    tasks : list of dictionaries
+        List of dictionaries holding a task name, a function, and its keyword arguments.
+    jobs : int
+        Number of tasks run at the same time.
+    retries : int
+        Number of times each task is retried, unless the task holds its own number of "retries".
+    backoff : float
+        Seconds to wait after the first failed attempt; doubled for every following attempt.
+    max_backoff : float
+        Maximum number of seconds to wait between attempts.
+    callback : callable
+        Function called with a task and the value returned by its function when the task succeeds.
+
+    Returns
+    -------
+    report : dictionary
+        Dictionary holding the names of tasks that succeeded, the tasks that failed, 
+        the total number of attempts, the duration of the run, and the latency of 
+        each task (in seconds, including retries, in the order of tasks).
+
+    Notes
+    -----
+    tasks[0] = {"name": str, "function": callable, "kwargs": dictionary}
+
+    A task that retries its own parts, such as download_windows(), holds "retries": 0.
+
+    report = {"succeeded": list of str, "failed": list of dictionaries, "attempts": int, "duration": float, "latencies": list of float}
+
+    report["failed"][0] = {"name": str, "task": dictionary, "error": exception, "attempts": int}
+    """
+    start_time = time.time()
+
+    def run_task(task):
+        """ Run a single task; return the number of attempts, the error or None, and the latency """
+
+        task_start_time = time.time()
+        task_retries = task.get("retries", retries)
+        for attempt in range(task_retries + 1):
+            try:
+                value = task["function"](**task["kwargs"])
+
+            except Exception as error:
+                if attempt < task_retries and is_retryable(error):
+                    delay = get_retry_delay(attempt = attempt, error = error, backoff = backoff, max_backoff = max_backoff)
+                    logging.warn("*Request failed* {} (attempt {} of {}): {}. *Solution* - Retrying in {:.1f} seconds".format(task["name"], attempt + 1, task_retries + 1, error, delay))
+                    time.sleep(delay)
+                else:
+                    logging.error("*Request failed* {} (attempt {} of {}): {}".format(task["name"], attempt + 1, task_retries + 1, error))
+                    return attempt + 1, error, time.time() - task_start_time
+
+            else:
+                latency = time.time() - task_start_time
+                if callback:
+                    callback(task, value)
+                return attempt + 1, None, latency
+
+    pool = ThreadPool(processes = max(1, min(jobs, len(tasks))))
+    try:
+        results = pool.map(run_task, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    report = {
+        "succeeded": [],
+        "failed": [],
+        "attempts": 0,
+        "duration": time.time() - start_time,
+        "latencies": []
+    }
+
+    for task, (attempts, error, latency) in zip(tasks, results):
+        report["attempts"] += attempts
+        report["latencies"].append(latency)
+        if error is None:
+            report["succeeded"].append(task["name"])
+        else:
+            report["failed"].append({"name": task["name"], "task": task, "error": error, "attempts": attempts})
+
+    return report
+
+def stream_to_file(stream, filepath, chunk_size = CHUNK_SIZE, decompress = False, content_length = None):
+    """    
+    Write the contents of a file object to disk in fixed size chunks. Data is
+    written to a temporary file (filepath + ".part") that is renamed to filepath 
+    once the stream is exhausted, so a file at filepath is always complete.
+    Gzip compressed streams are decompressed chunk by chunk when decompress is True.
+
+    Parameters
+    ----------
+    stream : file object
+        A file object, such as a web service response, to read from.
+    filepath : str
+        String path of the file to write.
+    chunk_size : int
+        Number of bytes to read from the stream at a time.
+    decompress : bool
+        Boolean value to gzip decompress the stream while writing.
+    content_length : int
+        Expected number of bytes in the stream; an IOError is raised if the stream ends early.
+
+    Returns
+    -------
+    download_info : dictionary
+        Dictionary containing the file path, number of bytes read, number of bytes written,
+        duration (seconds), and throughput (bytes read per second) of the transfer.
+
+    Notes
+    -----
+    download_info = {"filepath": str, "bytes": int, "bytes written": int, "duration": float, "throughput": float}
+    """
+    partfile = filepath + ".part"
+    num_bytes = 0
+    num_bytes_written = 0
+    start_time = time.time()
+
+    # 16 + MAX_WBITS tells zlib to expect a gzip header and trailer
+    if decompress:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    try:
+        with open(partfile, "wb") as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                num_bytes += len(chunk)
+
+                if decompress:
+                    chunk = decompressor.decompress(chunk)
+                    
+                f.write(chunk)
+                num_bytes_written += len(chunk)
+
+            if decompress:
+                chunk = decompressor.flush()
+                f.write(chunk)
+                num_bytes_written += len(chunk)
+
+        if content_length is not None and num_bytes < content_length:
+            raise IOError("Transfer of {} interrupted after {} of {} bytes".format(os.path.basename(filepath), num_bytes, content_length))
+
+        nwispy_helpers.replace_file(src = partfile, dst = filepath)
+
+    except:
+        # do not leave a truncated file behind
+        if os.path.exists(partfile):
+            os.remove(partfile)
+        raise
+
+    duration = time.time() - start_time
+    if duration > 0:
+        throughput = num_bytes / duration
+    else:
+        throughput = float(num_bytes)
+
+    download_info = {
+        "filepath": filepath,
+        "bytes": num_bytes,
+        "bytes written": num_bytes_written,
+        "duration": duration,
+        "throughput": throughput
+    }
+
+    return download_info
+
+def read_site_rdb(filestream):
+    """    
+    Read an rdb file from the NWIS site service (siteOutput=expanded) and 
+    return a description of each site.
+
+    Parameters
+    ----------
+    filestream : file object
+        A file object, or any iterable of lines, that contains an rdb site file.
+
+    Returns
+    -------
+    sites : dictionary
+        Dictionary of site descriptions keyed by site number.
+
+    Notes
+    -----
+    sites["03290500"] = {"site number": str, "name": str, "latitude": float, "longitude": float, 
+                         "drainage area": float, "time zone": str}
+
+    Values that are missing from the file are None; drainage area is in square miles.
+    """
+    columns = {
+        "name": "station_nm", 
+        "latitude": "dec_lat_va", 
+        "longitude": "dec_long_va", 
+        "drainage area": "drain_area_va", 
+        "time zone": "tz_cd"
+    }
+
+    sites = {}
+    for block in read_rdb_blocks(filestream):
+        if "site_no" not in block["column names"]:
+            continue
+
+        for row in block["rows"]:
+            values = dict(zip(block["column names"], row))
+
+            site = {"site number": values["site_no"]}
+            for key, column in columns.items():
+                value = values.get(column, "").strip() or None
+                if value is not None and key in ("latitude", "longitude", "drainage area"):
+                    value = float(value) if nwispy_helpers.isfloat(value) else None
+                site[key] = value
+
+            sites[site["site number"]] = site
+
+    return sites
+
+def fetch_site_metadata(site_numbers, batch_size = SITE_BATCH_SIZE, rate_limiter = None, base_url = None):
+    """    
+    Download descriptions of sites from the NWIS site service in batches of 
+    batch_size sites per request.
+
+    Parameters
+    ----------
+    site_numbers : list of str
+        List of site numbers.
+    batch_size : int
+        Number of sites in each request.
+    rate_limiter : dictionary
+        A rate limiter created by create_rate_limiter().
+    base_url : str
+        String base url of the web service; defaults to BASE_URL.
+
+    Returns
+    -------
+    sites : dictionary
+        Dictionary of site descriptions keyed by site number; see read_site_rdb(). 
+        Sites that are not known to the site service are left out.
+    """
+    sites = {}
+    for i in range(0, len(site_numbers), batch_size):
+        user_parameters_url = urllib.urlencode({"format": "rdb", "siteOutput": "expanded", "sites": ",".join(site_numbers[i:i + batch_size])})
+
+        try:
+            response = open_response(user_parameters_url = user_parameters_url, data_type = "site", rate_limiter = rate_limiter, base_url = base_url)
+        except urllib2.HTTPError as error:
+            # 404 - none of the sites in the batch were found
+            if error.code == 404:
+                continue
+            raise
+
+        try:
+            is_compressed = response.info().get("Content-Encoding", "").lower() == "gzip"
+            sites.update(read_site_rdb(read_lines(stream = response, decompress = is_compressed)))
+        finally:
+            response.close()
+
+    return sites
+
+def get_site_metadata(site_numbers, cache_file = SITE_CACHE, refresh = False, **kwargs):
+    """    
+    Return descriptions of sites from a persistent cache file, downloading 
+    the sites that are not in the cache with fetch_site_metadata() and adding
+    them to the cache.
+
+    Parameters
+    ----------
+    site_numbers : list of str
+        List of site numbers.
+    cache_file : str
+        String path of the json cache file.
+    refresh : bool
+        Boolean value to download all sites again.
+    **kwargs
+        Keyword arguments passed to fetch_site_metadata().
+
+    Returns
+    -------
+    sites : dictionary
+        Dictionary of site descriptions keyed by site number; see read_site_rdb().
+    """
+    cache = nwispy_helpers.read_manifest(path = cache_file)
+
+    missing = sorted(set(site_number for site_number in site_numbers if refresh or site_number not in cache))
+    if missing:
+        cache.update(fetch_site_metadata(site_numbers = missing, **kwargs))
+
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        nwispy_helpers.write_manifest(path = cache_file, manifest = cache)
+
+    sites = dict((site_number, cache[site_number]) for site_number in site_numbers if site_number in cache)
 
-    outputfile = os.path.join(file_destination, filename)        
-    with open(outputfile, "wb") as f:
-        f.write(response.read())        
+    return sites
 
 def _create_test_data():
     """ Create test data for tests """
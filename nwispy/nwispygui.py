@@ -3,15 +3,17 @@
 :Module: nwispygui.py
 
 :Author: Jeremiah Lant
- 
+
 :Email: jlant@usgs.gov
 
-:Purpose: 
-Script that creates an interactive plot of an NWIS data file. User can 
-interact with the plot via a SpanSelector mouse widget. A toggle key event handler 
-exists for the matplotlib SpanSelector widget. A keypress of 'A' or 'a' actives the 
-slider and a keypress of 'Q' or 'q' de-activates the slider.
-         
+:Purpose:
+Script that creates an interactive plot of NWIS data files. User can
+interact with the plot via a SpanSelector mouse widget. A toggle key event handler
+exists for the matplotlib SpanSelector widget. A keypress of 'A' or 'a' actives the
+slider and a keypress of 'Q' or 'q' de-activates the slider. The 'up' and 'down'
+keys switch between the parameters of a file and the 'pageup' and 'pagedown' keys
+switch between the selected files.
+
 """
 
 #!/usr/bin/env python
@@ -22,165 +24,239 @@ from matplotlib.widgets import SpanSelector
 import Tkinter, tkFileDialog
 import matplotlib.dates as mdates
 import datetime
-from scipy.stats import nanmean 
-
-# my module
-import nwispy
-
-def onselect(xmin, xmax):
-    """ 
-    A select event handler for the matplotlib SpanSelector widget.
-    Selects a min/max range of the x or y axes for a matplotlib Axes.
-    """ 
-    # convert matplotlib float dates to a datetime format
-    date_min = mdates.num2date(xmin)
-    date_max = mdates.num2date(xmax) 
-    
-    # put the xmin and xmax in datetime format to compare
-    date_min = datetime.datetime(date_min.year, date_min.month, date_min.day, date_min.hour, date_min.minute)    
-    date_max = datetime.datetime(date_max.year, date_max.month, date_max.day, date_max.hour, date_max.minute)
-    
-    # find the indices that were selected    
-    indices = np.where((dates >= date_min) & (dates <= date_max))
-    indices = indices[0]
-    
-    # set the data in second plot
-    plot2.set_data(dates[indices], parameter['data'][indices])
-    
-    # calculate new mean, max, min
-    param_mean = nanmean(parameter['data'][indices])    
-    param_max = np.nanmax(parameter['data'][indices])  
-    param_min = np.nanmin(parameter['data'][indices])  
-    
-    ax2.set_xlim(dates[indices][0], dates[indices][-1])
-    ax2.set_ylim(param_min, param_max)
-        
-    # show text of mean, max, min values on graph; use matplotlib.patch.Patch properies and bbox
-    text3 = 'mean = %.2f\nmax = %.2f\nmin = %.2f' % (param_mean, param_max, param_min)
-                   
-    ax2_text.set_text(text3)
-    
-    fig.canvas.draw()
-
-def toggle_selector(event):
-    """ 
-    A toggle key event handler for the matplotlib SpanSelector widget. Keypress
-    of 'A' or 'a' actives the slider; 'Q' or 'q' de-activates the slider
-    """ 
-    if event.key in ['Q', 'q'] and span.visible:
-        print '**SpanSelector deactivated.**'
-        span.visible = False
-    if event.key in ['A', 'a'] and not span.visible:
-        print '**SpanSelector activated.**'
-        span.visible = True
-    
-
- # create root window     
-root = Tkinter.Tk() 
-file_format = [('Text file','*.txt')]  
-nwis_file = tkFileDialog.askopenfilename(title = 'Select USGS NWIS File', filetypes = file_format)
-root.destroy()
-
-if nwis_file:
-    
-    try:
-        # process file    
-        nwis_data = nwispy.read_file(nwis_file)
-        
-        # print relevant information
-        print '** USGS NWIS File Information **'
-        nwispy.print_info(nwis_data = nwis_data)
-    
-        dates = nwis_data['dates']
-        parameter = nwis_data['parameters'][0]
-        
-         # plot parameter
-        fig = plt.figure(figsize=(12,10))
-
-        ax1 = fig.add_subplot(211)
-        ax1.grid(True)
-        ax1.set_title(nwis_data['gage_name'] + ' (' + nwis_data['timestep'] +')')
-        ax1.set_xlabel('Date')
-        ax1.set_ylabel(parameter['description'])
-
-        plot1, = ax1.plot(dates, parameter['data'], color = 'b', marker = 'o', label = parameter['description'])
-        
-        # rotate and align the tick labels so they look better      
-        plt.setp(ax1.xaxis.get_majorticklabels(), rotation = 30)
-        
-        # use a more precise date string for the x axis locations in the
-        # toolbar
-        ax1.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
-         
-        # legend; make it transparent    
-        handles, labels = ax1.get_legend_handles_labels()
-        legend = ax1.legend(handles, labels, fancybox = True)
-        legend.get_frame().set_alpha(0.5)
-        legend.draggable(state=True)
-        
-        # show text of mean, max, min values on graph; use matplotlib.patch.Patch properies and bbox
-        text1 = 'mean = %.2f\nmax = %.2f\nmin = %.2f' % (parameter['mean'], parameter['max'], parameter['min'])
+
+# my modules
+import nwispy_viewer
+import nwispy_model
+
+class NwisDataView(object):
+    """
+    Interactive view of the parameters of NWIS data models. The first axes
+    shows a whole parameter and the second axes shows the range selected with
+    the SpanSelector widget. Data is drawn from the level of detail of the
+    model that matches the pixel width of each axes, and statistics of
+    selections are looked up in the range index of the model.
+
+    Parameters
+    ----------
+    models : list of nwispy_model.NwisDataModel
+        Models of the data files to view.
+    """
+    def __init__(self, models):
+        self.models = models
+        self.model_index = 0
+        self.parameter_index = 0
+
+        self.fig = plt.figure(figsize=(12,10))
+        self.ax1 = self.fig.add_subplot(211)
+        self.ax2 = self.fig.add_subplot(212)
+
         patch_properties = {'boxstyle': 'round',
                             'facecolor': 'wheat',
                             'alpha': 0.5
                             }
-                       
-        ax1.text(0.05, 0.95, text1, transform = ax1.transAxes, fontsize = 14, 
-                verticalalignment = 'top', horizontalalignment = 'left', bbox = patch_properties)
-        
-        # add another plot
-        ax2 = fig.add_subplot(212)
-        ax2.grid(True)
-        ax2.set_title('USGS NWIS: ' + nwis_data['gage_name'])
-        ax2.set_xlabel('Date')
-        ax2.set_ylabel(parameter['description'])
-        plot2, = ax2.plot(dates, parameter['data'], color = 'b',  marker = 'o', label = parameter['description'])
-        
-        # rotate and align the tick labels so they look better  
-        plt.xticks(rotation = 30)
-        
-        ax2.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
-        
-        # legend; make it transparent    
-        handles2, labels2 = ax2.get_legend_handles_labels()
-        legend2 = ax2.legend(handles2, labels2, fancybox = True)
-        legend2.get_frame().set_alpha(0.5)
-        legend2.draggable(state=True)
-        
+        for ax in [self.ax1, self.ax2]:
+            ax.grid(True)
+            ax.set_xlabel('Date')
+            ax.xaxis_date()
+
+            # use a more precise date string for the x axis locations in the
+            # toolbar
+            ax.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
+
+        self.plot1, = self.ax1.plot([], [], color = 'b', marker = 'o')
+        self.plot2, = self.ax2.plot([], [], color = 'b', marker = 'o')
+
         # show text of mean, max, min values on graph; use matplotlib.patch.Patch properies and bbox
-        text2 = 'mean = %.2f\nmax = %.2f\nmin = %.2f' % (parameter['mean'], parameter['max'], parameter['min'])
-        patch_properties = {'boxstyle': 'round',
-                            'facecolor': 'wheat',
-                            'alpha': 0.5
-                            }
-                       
-        ax2_text = ax2.text(0.05, 0.95, text2, transform = ax2.transAxes, fontsize = 14, 
-                             verticalalignment = 'top', horizontalalignment = 'left', bbox = patch_properties)
-                
-        # make a splan selector and have it turned off initially until user 
+        self.ax1_text = self.ax1.text(0.05, 0.95, '', transform = self.ax1.transAxes, fontsize = 14,
+                                      verticalalignment = 'top', horizontalalignment = 'left', bbox = patch_properties)
+        self.ax2_text = self.ax2.text(0.05, 0.95, '', transform = self.ax2.transAxes, fontsize = 14,
+                                      verticalalignment = 'top', horizontalalignment = 'left', bbox = patch_properties)
+
+        # rotate and align the tick labels so they look better
+        for ax in [self.ax1, self.ax2]:
+            plt.setp(ax.xaxis.get_majorticklabels(), rotation = 30)
+
+        self.show_parameter()
+
+        self.ax2.callbacks.connect('xlim_changed', self.update_zoomed_plot)
+
+        # make a splan selector and have it turned off initially until user
         # presses 'q' or 'a' on the key board via toggle_selector
-        span = SpanSelector(ax1, onselect, 'horizontal', useblit=True,
-                            rectprops=dict(alpha=0.5, facecolor='red'))
-        span.visible = False
-                
+        self.span = SpanSelector(self.ax1, self.onselect, 'horizontal', useblit=True,
+                                 rectprops=dict(alpha=0.5, facecolor='red'))
+        self.span.visible = False
+
         # connect span with the toggle selector in order to toggle span selector on and off
-        span.connect_event('key_press_event', toggle_selector)        
-        
+        self.span.connect_event('key_press_event', self.toggle_selector)
+        self.fig.canvas.mpl_connect('key_press_event', self.switch_parameter)
+
         # make sure that the layout of the subplots do not overlap
         plt.tight_layout()
+
+    @property
+    def model(self):
+        """ Model of the file that is shown """
+
+        return self.models[self.model_index]
+
+    @property
+    def parameter(self):
+        """ Dictionary of the parameter that is shown """
+
+        return self.model.parameters[self.parameter_index]
+
+    def show_parameter(self):
+        """
+        Show the whole range of the current parameter of the current model in
+        both axes. The derived data of the model is cached, so switching back
+        to a parameter that was shown before is instant.
+        """
+        nwis_data = self.model.data
+        parameter = self.parameter
+
+        self.ax1.set_title(nwis_data['gage_name'] + ' (' + nwis_data['timestep'] +')')
+        self.ax2.set_title('USGS NWIS: ' + nwis_data['gage_name'])
+
+        for ax, plot, text in [(self.ax1, self.plot1, self.ax1_text), (self.ax2, self.plot2, self.ax2_text)]:
+            ax.set_ylabel(parameter['description'])
+            plot.set_label(parameter['description'])
+            self.set_lod_data(plot = plot, ax = ax, start = 0, end = len(self.model.dates))
+            text.set_text('mean = %.2f\nmax = %.2f\nmin = %.2f' % (parameter['mean'], parameter['max'], parameter['min']))
+
+            ax.relim()
+            ax.autoscale_view()
+
+            # legend; make it transparent
+            handles, labels = ax.get_legend_handles_labels()
+            legend = ax.legend(handles, labels, fancybox = True)
+            legend.get_frame().set_alpha(0.5)
+            legend.draggable(state=True)
+
+    def onselect(self, xmin, xmax):
+        """
+        A select event handler for the matplotlib SpanSelector widget.
+        Selects a min/max range of the x or y axes for a matplotlib Axes.
+        """
+        # convert matplotlib float dates to a datetime format
+        date_min = mdates.num2date(xmin)
+        date_max = mdates.num2date(xmax)
+
+        # put the xmin and xmax in datetime format to compare
+        date_min = datetime.datetime(date_min.year, date_min.month, date_min.day, date_min.hour, date_min.minute)
+        date_max = datetime.datetime(date_max.year, date_max.month, date_max.day, date_max.hour, date_max.minute)
+
+        # find the range that was selected and its mean, max, min from the range index of the model
+        stats = self.model.get_range_stats(parameter_index = self.parameter_index, date_min = date_min, date_max = date_max)
+        if stats['count'] == 0:
+            return
+        start, end = stats['start'], stats['end']
+
+        # the data of the second plot is set by update_zoomed_plot
+        self.ax2.set_xlim(self.model.dates[start], self.model.dates[end - 1])
+        self.ax2.set_ylim(stats['min'], stats['max'])
+
+        # show text of mean, max, min values on graph
+        self.ax2_text.set_text('mean = %.2f\nmax = %.2f\nmin = %.2f' % (stats['mean'], stats['max'], stats['min']))
+
+        self.fig.canvas.draw()
+
+    def update_zoomed_plot(self, ax):
+        """
+        A xlim_changed event handler for the second (zoomed) matplotlib Axes.
+        Plots the visible date range at the level of detail that matches the
+        pixel width of the axes.
+        """
+        xmin, xmax = ax.get_xlim()
+        start, end = self.model.get_range_indices(date_min = mdates.num2date(xmin), date_max = mdates.num2date(xmax))
+
+        # one more value on each side so the line reaches the edges of the axes
+        self.set_lod_data(plot = self.plot2, ax = ax, start = start - 1, end = end + 1)
+
+    def set_lod_data(self, plot, ax, start, end):
+        """
+        Set the data of a plot to a range of the parameter taken from the level
+        of detail pyramid, with about two points for each pixel of the axes;
+        markers are only shown when every value is plotted.
+        """
+        max_points = nwispy_viewer.POINTS_PER_PIXEL * int(ax.get_window_extent().width)
+        dates, values, bucket_size = self.model.get_lod_series(parameter_index = self.parameter_index, start = start, end = end,
+                                                               max_points = max_points)
+
+        plot.set_data(dates, values)
+        plot.set_marker('o' if bucket_size == 1 else 'None')
+
+    def toggle_selector(self, event):
+        """
+        A toggle key event handler for the matplotlib SpanSelector widget. Keypress
+        of 'A' or 'a' actives the slider; 'Q' or 'q' de-activates the slider
+        """
+        if event.key in ['Q', 'q'] and self.span.visible:
+            print '**SpanSelector deactivated.**'
+            self.span.visible = False
+        if event.key in ['A', 'a'] and not self.span.visible:
+            print '**SpanSelector activated.**'
+            self.span.visible = True
+
+    def switch_parameter(self, event):
+        """
+        A key event handler to switch the parameter or file that is shown.
+        Keypress of 'up' or 'down' shows the next or previous parameter;
+        'pageup' or 'pagedown' shows the next or previous file.
+        """
+        if event.key in ['up', 'down']:
+            step = 1 if event.key == 'up' else -1
+            self.parameter_index = (self.parameter_index + step) % len(self.model.parameters)
+        elif event.key in ['pageup', 'pagedown']:
+            step = 1 if event.key == 'pageup' else -1
+            self.model_index = (self.model_index + step) % len(self.models)
+            self.parameter_index = 0
+        else:
+            return
+
+        self.show_parameter()
+        self.fig.canvas.draw()
+
+def main():
+    """ Select data files with a file dialog and show them """
+
+     # create root window
+    root = Tkinter.Tk()
+    file_format = [('Text file','*.txt')]
+    nwis_files = tkFileDialog.askopenfilenames(title = 'Select USGS NWIS File(s)', filetypes = file_format)
+
+    # tk may return the selected files as a single string
+    if isinstance(nwis_files, basestring):
+        nwis_files = root.tk.splitlist(nwis_files)
+    root.destroy()
+
+    if not nwis_files:
+        print '** Canceled **'
+        return
+
+    try:
+        # process files
+        models = [nwispy_model.NwisDataModel.from_file(nwis_file) for nwis_file in nwis_files]
+
+        # print relevant information
+        for model in models:
+            print '** USGS NWIS File Information **'
+            nwispy_viewer.print_info(nwis_data = model.data)
+
+        # keep a reference to the view; matplotlib only holds weak references to its event handlers
+        view = NwisDataView(models = models)
         plt.show()
-                
+
     except IOError as error:
         print 'cannot read file' + error.filename
         print error.message
-        
+
     except IndexError as error:
         print 'Cannot read file! Bad file!'
         print error.message
-            
+
     except ValueError as error:
         print error.message
-        
-else:
-    print '** Canceled **'
 
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import nose.tools
 
 import sys
+import os
+import gzip
+import shutil
+import tempfile
 import numpy as np
 import datetime
 import re
@@ -664,7 +668,45 @@ def test_bad_data_instantaneous_single_parameter2():
     
     nose.tools.assert_almost_equals(actual["parameters"][0]["mean"], expected["parameters"][0]["mean"])
     nose.tools.assert_almost_equals(actual["parameters"][0]["max"], expected["parameters"][0]["max"])
-    nose.tools.assert_almost_equals(actual["parameters"][0]["min"], expected["parameters"][0]["min"]) 
+    nose.tools.assert_almost_equals(actual["parameters"][0]["min"], expected["parameters"][0]["min"])
+
+def test_read_file_gzip():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03290500_dv.txt.gz")
+        with gzip.open(filepath, "wb") as f:
+            f.write(fixture["data_daily_single_parameter"])
+
+        expected = nwispy_filereader.read_file_in(filestream = StringIO(fixture["data_daily_single_parameter"]))
+        actual = nwispy_filereader.read_file(filepath)
+
+        nose.tools.assert_equals(actual["gage_name"], expected["gage_name"])
+        nose.tools.assert_equals(actual["parameters"][0]["code"], expected["parameters"][0]["code"])
+        nose.tools.assert_equals(list(actual["parameters"][0]["data"]), list(expected["parameters"][0]["data"]))
+        nose.tools.assert_equals(list(actual["dates"]), list(expected["dates"]))
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_read_file_in_lines():
+
+    lines = (line for line in StringIO(fixture["data_daily_single_parameter"]))
+
+    expected = nwispy_filereader.read_file_in(filestream = StringIO(fixture["data_daily_single_parameter"]))
+    actual = nwispy_filereader.read_file_in(filestream = lines)
+
+    nose.tools.assert_equals(actual["gage_name"], expected["gage_name"])
+    nose.tools.assert_equals(list(actual["parameters"][0]["data"]), list(expected["parameters"][0]["data"]))
+    nose.tools.assert_equals(list(actual["dates"]), list(expected["dates"]))
+
+def test_add_site_metadata():
+
+    data = nwispy_filereader.read_file_in(filestream = StringIO(fixture["data_daily_single_parameter"]))
+    site = {"site number": "03290500", "name": "KENTUCKY RIVER AT LOCK 2 AT LOCKPORT, KY", "latitude": 38.43, "longitude": -84.96, 
+            "drainage area": 6180.0, "time zone": "EST"}
 
+    nwispy_filereader.add_site_metadata(data = data, sites = {"03290500": site})
 
-    
\ No newline at end of file
+    nose.tools.assert_equals(data["site_number"], "03290500")
+    nose.tools.assert_equals(data["site"], site)
@@ -2,6 +2,10 @@ import nose.tools
 from nose import with_setup
 
 import sys
+import os
+import shutil
+import tempfile
+import gzip
 import numpy as np
 import datetime
 
@@ -128,3 +132,60 @@ def test_find_start_end_dates_longer_range():
 
     nose.tools.assert_equals(actual_start_date, expected_start_date)
     nose.tools.assert_equals(actual_end_date, expected_end_date)
+
+def test_get_file_hash():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03284000_dv.txt")
+        with open(filepath, "wb") as f:
+            f.write("USGS\t03284000\t2014-01-01\t171\tP\n")
+
+        first_hash = helpers.get_file_hash(path = filepath)
+
+        with open(filepath, "ab") as f:
+            f.write("USGS\t03284000\t2014-01-02\t172\tP\n")
+
+        nose.tools.assert_equals(len(first_hash), 40)
+        nose.tools.assert_not_equals(helpers.get_file_hash(path = filepath), first_hash)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_get_data_size():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        contents = "USGS\t03284000\t2014-01-01\t171\tP\n" * 100
+
+        filepath = os.path.join(tempdir, "03284000_dv.txt")
+        with open(filepath, "wb") as f:
+            f.write(contents)
+
+        gz_filepath = filepath + ".gz"
+        f = gzip.open(gz_filepath, "wb")
+        f.write(contents)
+        f.close()
+
+        nose.tools.assert_equals(helpers.get_data_size(path = filepath), len(contents))
+        nose.tools.assert_equals(helpers.get_data_size(path = gz_filepath), len(contents))
+        nose.tools.assert_equals(helpers.get_data_size(path = os.path.join(tempdir, "missing_dv.txt")), 0)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_read_write_manifest():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "processed.json")
+
+        nose.tools.assert_equals(helpers.read_manifest(path = filepath), {})
+
+        helpers.write_manifest(path = filepath, manifest = {"03284000_dv.txt": "abc"})
+
+        nose.tools.assert_equals(helpers.read_manifest(path = filepath), {"03284000_dv.txt": "abc"})
+        nose.tools.assert_false(os.path.exists(filepath + ".part"))
+
+    finally:
+        shutil.rmtree(tempdir)
@@ -0,0 +1,170 @@
+import nose.tools
+from nose import with_setup
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import logging
+
+# my module
+from nwispy import nwispy_logging
+
+# define the global fixture to hold the data that goes into the functions you test
+fixture = {}
+
+def setup():
+    """ Setup fixture for testing """
+
+    print >> sys.stderr, "SETUP: nwispy_logging tests"
+
+    fixture["directories"] = ["03298500_dv-output", "03401385_uv-output"]
+
+def teardown():
+    """ Print to standard error when all tests are finished """
+    
+    print >> sys.stderr, "TEARDOWN: nwispy_logging tests" 
+
+def _log_file_messages(output_dir, name):
+    """ Log a message of each level for a file; run in threads and worker processes """
+
+    nwispy_logging.set_log_directory(output_dir = output_dir)
+    try:
+        logging.info("info of " + name)
+        logging.warn("warning of " + name)
+        logging.error("error of " + name)
+    finally:
+        nwispy_logging.set_log_directory(output_dir = None)
+
+def _read_log(output_dir):
+    """ Return the contents of the error.log in a directory """
+
+    with open(os.path.join(output_dir, "error.log"), "r") as f:
+        return f.read()
+
+def test_listener_threads():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        output_dirs = [os.path.join(tempdir, directory) for directory in fixture["directories"]]
+        for output_dir in output_dirs:
+            os.mkdir(output_dir)
+
+        listener = nwispy_logging.start_listener(output_dir = tempdir)
+        try:
+            threads = [threading.Thread(target = _log_file_messages, args = (output_dir, os.path.basename(output_dir))) for output_dir in output_dirs]
+            for thread in threads:
+                thread.start()
+
+            # messages that are not logged for a file go to the error.log of the listener
+            logging.warn("warning of the request file")
+
+            for thread in threads:
+                thread.join()
+
+        finally:
+            nwispy_logging.stop_listener(listener)
+
+        for output_dir, other_dir in zip(output_dirs, reversed(output_dirs)):
+            actual = _read_log(output_dir)
+            nose.tools.assert_true("warning of " + os.path.basename(output_dir) in actual)
+            nose.tools.assert_true("error of " + os.path.basename(output_dir) in actual)
+            nose.tools.assert_false("info of" in actual)
+            nose.tools.assert_false(os.path.basename(other_dir) in actual)
+            nose.tools.assert_false("request file" in actual)
+
+        nose.tools.assert_equals(_read_log(tempdir).count(" - WARNING - "), 1)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_listener_append():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        listener = nwispy_logging.start_listener()
+        try:
+            # an error.log that is closed and opened again in the same run is appended to
+            for name in ["parse", "render"]:
+                _log_file_messages(output_dir = tempdir, name = name)
+
+            logging.exception("traceback")
+
+        finally:
+            nwispy_logging.stop_listener(listener)
+
+        actual = _read_log(tempdir)
+
+        nose.tools.assert_equals(actual.count(" - WARNING - "), 2)
+        nose.tools.assert_equals(actual.count(" - ERROR - "), 2)
+        nose.tools.assert_equals(nwispy_logging.get_queue(), None)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_restart_log_file():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        other_dir = os.path.join(tempdir, "other")
+        os.mkdir(other_dir)
+
+        listener = nwispy_logging.start_listener()
+        try:
+            # a download that is tried again starts its error.log over, while the error.log is open or closed
+            _log_file_messages(output_dir = tempdir, name = "first attempt")
+            nwispy_logging.set_log_directory(output_dir = tempdir)
+            logging.warn("warning of second attempt")
+            nwispy_logging.restart_log_file(output_dir = tempdir)
+            logging.warn("warning of third attempt")
+            nwispy_logging.set_log_directory(output_dir = None)
+
+            # nothing logged after a restart; no error.log is left
+            _log_file_messages(output_dir = other_dir, name = "other")
+            nwispy_logging.restart_log_file(output_dir = other_dir)
+
+        finally:
+            nwispy_logging.stop_listener(listener)
+
+        actual = _read_log(tempdir)
+
+        nose.tools.assert_equals(actual.count(" - WARNING - "), 1)
+        nose.tools.assert_true("warning of third attempt" in actual)
+        nose.tools.assert_false(os.path.isfile(os.path.join(other_dir, "error.log")))
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_listener_processes():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        output_dirs = [os.path.join(tempdir, directory) for directory in fixture["directories"]]
+        for output_dir in output_dirs:
+            os.mkdir(output_dir)
+
+        listener = nwispy_logging.start_listener()
+        try:
+            pool = multiprocessing.Pool(processes = 2, initializer = nwispy_logging.initialize_worker, initargs = (listener["queue"],))
+            try:
+                results = [pool.apply_async(_log_file_messages, (output_dir, os.path.basename(output_dir))) for output_dir in output_dirs]
+                for result in results:
+                    result.get()
+
+                pool.close()
+                pool.join()
+
+            finally:
+                pool.terminate()
+
+        finally:
+            nwispy_logging.stop_listener(listener)
+
+        for output_dir in output_dirs:
+            actual = _read_log(output_dir)
+            nose.tools.assert_equals(actual.count(os.path.basename(output_dir)), 2)
+
+    finally:
+        shutil.rmtree(tempdir)
@@ -0,0 +1,83 @@
+import nose.tools
+from nose import with_setup
+
+import sys
+import numpy as np
+import datetime
+
+# my module
+from nwispy import nwispy_model
+
+# define the global fixture to hold the data that goes into the functions you test
+fixture = {}
+
+def setup():
+    """ Setup fixture for testing """
+
+    print >> sys.stderr, "SETUP: nwispy_model tests"
+
+    dates = np.array([datetime.datetime(2014, 03, 01, 8, 0) + datetime.timedelta(hours = i) for i in range(2000)])
+    discharge_data = np.array([100.0 + i % 50 for i in range(2000)])
+    stage_data = np.array([2.0 + (i % 10) / 10.0 for i in range(2000)])
+    stage_data[500:600] = np.nan
+
+    fixture["data"] = {
+        "gage_name": "USGS 03401385 DAVIS BRANCH AT HIGHWAY 988 NEAR MIDDLESBORO, KY",
+        "timestep": "instantaneous",
+        "dates": dates,
+        "parameters": [
+            {"code": "06_00060", "description": "Discharge, cubic feet per second", "index": 3, "data": discharge_data,
+             "mean": np.mean(discharge_data), "max": np.max(discharge_data), "min": np.min(discharge_data)},
+            {"code": "02_00065", "description": "Gage height, feet", "index": 5, "data": stage_data, 
+             "mean": np.nanmean(stage_data), "max": np.nanmax(stage_data), "min": np.nanmin(stage_data)}
+        ]
+    }
+
+def teardown():
+    """ Print to standard error when all tests are finished """
+    
+    print >> sys.stderr, "TEARDOWN: nwispy_model tests" 
+
+def test_model_cache():
+
+    model = nwispy_model.NwisDataModel(nwis_data = fixture["data"])
+
+    # nothing is built until it is asked for, then it is built once
+    nose.tools.assert_equals(model._cache, {})
+
+    range_index = model.get_range_index(parameter_index = 1)
+    nose.tools.assert_true(model.get_range_index(parameter_index = 1) is range_index)
+    nose.tools.assert_true(model.get_range_index(parameter_index = 0) is not range_index)
+    nose.tools.assert_true(model.get_range_index(parameter_index = 0)["timestamps"] is range_index["timestamps"])
+
+    decimated = model.get_decimated_series(parameter_index = 0, max_points = 100)
+    nose.tools.assert_true(model.get_decimated_series(parameter_index = 0, max_points = 100) is decimated)
+    nose.tools.assert_true(model.get_lod_pyramid(parameter_index = 0) is model.get_lod_pyramid(parameter_index = 0))
+
+    model.clear_cache()
+    nose.tools.assert_equals(model._cache, {})
+
+def test_model_get_range_stats():
+
+    model = nwispy_model.NwisDataModel(nwis_data = fixture["data"])
+    dates = fixture["data"]["dates"]
+
+    for parameter_index, parameter in enumerate(fixture["data"]["parameters"]):
+        actual = model.get_range_stats(parameter_index = parameter_index, date_min = dates[450], date_max = dates[1299])
+
+        selected = parameter["data"][450:1300]
+        nose.tools.assert_equals(model.get_range_indices(date_min = dates[450], date_max = dates[1299]), (450, 1300))
+        nose.tools.assert_almost_equals(actual["mean"], np.nanmean(selected))
+        nose.tools.assert_equals(actual["max"], np.nanmax(selected))
+        nose.tools.assert_equals(actual["min"], np.nanmin(selected))
+
+def test_model_get_lod_series():
+
+    model = nwispy_model.NwisDataModel(nwis_data = fixture["data"])
+
+    dates, values, bucket_size = model.get_lod_series(parameter_index = 1, start = 0, end = 2000, max_points = 200)
+
+    nose.tools.assert_true(bucket_size > 1)
+    nose.tools.assert_equals(len(dates), len(values))
+    nose.tools.assert_true(np.isnan(values).any())
+    nose.tools.assert_equals(np.nanmax(values), fixture["data"]["parameters"][1]["max"])
@@ -0,0 +1,118 @@
+import nose.tools
+from nose import with_setup
+
+import sys
+import numpy as np
+import datetime
+
+# my module
+from nwispy import nwispy_series
+
+# define the global fixture to hold the data that goes into the functions you test
+fixture = {}
+
+def setup():
+    """ Setup fixture for testing """
+
+    print >> sys.stderr, "SETUP: nwispy_series tests"
+
+    random = np.random.RandomState(0)
+    values = random.randn(1000)
+    values[random.rand(1000) < 0.1] = np.nan
+    values[300:400] = np.nan
+
+    fixture["dates"] = np.array([datetime.datetime(2014, 01, 01, 0, 0) + datetime.timedelta(minutes = 15 * i) for i in range(1000)])
+    fixture["values"] = values
+
+def teardown():
+    """ Print to standard error when all tests are finished """
+    
+    print >> sys.stderr, "TEARDOWN: nwispy_series tests" 
+
+def test_get_timestamps():
+
+    actual = nwispy_series.get_timestamps([datetime.datetime(1970, 1, 1), datetime.datetime(2014, 1, 1, 8, 15, 30)])
+
+    expected = np.array([0, 1388564130])
+
+    nose.tools.assert_equals(actual.dtype, np.int64)
+    np.testing.assert_equal(actual, expected)
+
+def test_get_range_stats():
+
+    dates = fixture["dates"]
+    values = fixture["values"]
+    index = nwispy_series.create_range_index(dates = dates, values = values, block_size = 16)
+
+    # ranges within a block, across blocks, the whole series, and ending on a block boundary
+    for start, end in [(5, 9), (0, 1000), (10, 500), (17, 64), (32, 64), (250, 999)]:
+        actual = nwispy_series.get_range_stats(index = index, date_min = dates[start], date_max = dates[end - 1])
+
+        selected = values[start:end]
+        nose.tools.assert_equals((actual["start"], actual["end"]), (start, end))
+        nose.tools.assert_equals(actual["count"], np.sum(~np.isnan(selected)))
+        nose.tools.assert_almost_equals(actual["mean"], np.nanmean(selected))
+        nose.tools.assert_equals(actual["max"], np.nanmax(selected))
+        nose.tools.assert_equals(actual["min"], np.nanmin(selected))
+
+def test_get_range_stats_missing():
+
+    dates = fixture["dates"]
+    index = nwispy_series.create_range_index(dates = dates, values = fixture["values"], block_size = 16)
+
+    # only missing values, and a range between dates of the series
+    for date_min, date_max in [(dates[300], dates[399]), (dates[0] + datetime.timedelta(minutes = 1), dates[0] + datetime.timedelta(minutes = 2))]:
+        actual = nwispy_series.get_range_stats(index = index, date_min = date_min, date_max = date_max)
+
+        nose.tools.assert_equals(actual["count"], 0)
+        nose.tools.assert_true(np.isnan(actual["mean"]) and np.isnan(actual["max"]) and np.isnan(actual["min"]))
+
+def test_get_lod_indices():
+
+    values = fixture["values"]
+    pyramid = nwispy_series.create_lod_pyramid(values = values, min_buckets = 8)
+
+    nose.tools.assert_equals([level["bucket size"] for level in pyramid["levels"]], [2, 4, 8, 16, 32, 64, 128])
+
+    # ranges with more values than points; peaks, gaps, and the ends of the range are kept
+    for start, end, max_points in [(0, 1000, 100), (10, 990, 300), (123, 877, 64)]:
+        actual, bucket_size = nwispy_series.get_lod_indices(pyramid = pyramid, start = start, end = end, max_points = max_points)
+
+        selected = values[start:end]
+        nose.tools.assert_true(bucket_size > 1)
+        nose.tools.assert_true(len(actual) <= 1.5 * max_points + 2)
+        nose.tools.assert_true(np.all(np.diff(actual) > 0))
+        nose.tools.assert_equals((actual[0], actual[-1]), (start, end - 1))
+        nose.tools.assert_equals(np.nanmax(values[actual]), np.nanmax(selected))
+        nose.tools.assert_equals(np.nanmin(values[actual]), np.nanmin(selected))
+        nose.tools.assert_true(np.isnan(values[actual]).any())
+
+def test_get_lod_indices_edges():
+
+    values = fixture["values"]
+    pyramid = nwispy_series.create_lod_pyramid(values = values, min_buckets = 8)
+
+    # peaks and gaps in the edge buckets that are only partly in a range are kept
+    random = np.random.RandomState(1)
+    for i in range(500):
+        start, end = sorted(random.randint(0, len(values) + 1, size = 2))
+        max_points = random.randint(2, 64)
+        actual, bucket_size = nwispy_series.get_lod_indices(pyramid = pyramid, start = start, end = end, max_points = max_points)
+
+        selected = values[start:end]
+        nose.tools.assert_true(np.all((actual >= start) & (actual < end)))
+        # a min, max, and missing position for each whole bucket and each of the two edges, and the ends of the range
+        nose.tools.assert_true(len(actual) <= 3 * ((end - start) // bucket_size + 2) + 2)
+        nose.tools.assert_equals(np.isnan(values[actual]).any(), np.isnan(selected).any())
+        if not np.isnan(selected).all():
+            nose.tools.assert_equals(np.nanmax(values[actual]), np.nanmax(selected))
+            nose.tools.assert_equals(np.nanmin(values[actual]), np.nanmin(selected))
+
+def test_get_lod_indices_all_values():
+
+    pyramid = nwispy_series.create_lod_pyramid(values = fixture["values"], min_buckets = 8)
+
+    actual, bucket_size = nwispy_series.get_lod_indices(pyramid = pyramid, start = -5, end = 100, max_points = 200)
+
+    np.testing.assert_equal(actual, np.arange(100))
+    nose.tools.assert_equals(bucket_size, 1)
@@ -0,0 +1,226 @@
+import nose.tools
+from nose import with_setup
+
+import sys
+import os
+import shutil
+import tempfile
+
+# my module
+from nwispy import nwispy
+from nwispy import nwispy_helpers
+from nwispy import nwispy_mockservice
+from nwispy import nwispy_filereader
+
+# define the global fixture to hold the data that goes into the functions you test
+fixture = {}
+
+def setup():
+    """ Setup fixture for testing """
+
+    print >> sys.stderr, "SETUP: nwispy tests"
+
+    fixture["datafiles"] = os.path.join(os.path.dirname(__file__), "..", "data", "datafiles")
+    fixture["filenames"] = ["03298500_dv.txt", "03401385_uv.txt"]
+
+def teardown():
+    """ Print to standard error when all tests are finished """
+    
+    print >> sys.stderr, "TEARDOWN: nwispy tests" 
+
+def test_process_files_jobs():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        file_list = []
+        for filename in fixture["filenames"]:
+            shutil.copy(os.path.join(fixture["datafiles"], filename), tempdir)
+            file_list.append(os.path.join(tempdir, filename))
+
+        # a file that can not be read, between files that can
+        file_list.insert(1, os.path.join(tempdir, "missing_dv.txt"))
+
+        arguments = nwispy.create_parser().parse_args(["--jobs", "2", "--preview"])
+        actual = nwispy.process_files(file_list = file_list, arguments = arguments)
+
+        # results in order of the files; the failed file does not stop the others
+        nose.tools.assert_equals([result["file"] for result in actual], file_list)
+        nose.tools.assert_equals([result["error"] is None for result in actual], [True, False, True])
+
+        for result in actual:
+            nose.tools.assert_equals(os.path.dirname(result["output directory"]), tempdir)
+            for filepath in result["previews"]:
+                nose.tools.assert_true(os.path.isfile(filepath))
+
+        # errors are logged to the error.log of the failed file only
+        nose.tools.assert_true(os.path.isfile(os.path.join(actual[1]["output directory"], "error.log")))
+        nose.tools.assert_equals(len(actual[0]["previews"]), 3)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_process_files_jobs_single_file():
+
+    submit_plots = nwispy.nwispy_viewer.submit_plots
+    submitted = []
+
+    def record_plots(**kwargs):
+        results = submit_plots(**kwargs)
+        submitted.extend(results)
+        return results
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filename = fixture["filenames"][0]
+        shutil.copy(os.path.join(fixture["datafiles"], filename), tempdir)
+
+        # the plots of a single file are rendered in the pool
+        nwispy.nwispy_viewer.submit_plots = record_plots
+        arguments = nwispy.create_parser().parse_args(["--jobs", "2", "--preview"])
+        actual = nwispy.process_files(file_list = [os.path.join(tempdir, filename)], arguments = arguments)
+
+        nose.tools.assert_equals(actual[0]["error"], None)
+        nose.tools.assert_equals(len(submitted), len(actual[0]["previews"]))
+        for filepath in actual[0]["previews"]:
+            nose.tools.assert_true(os.path.isfile(filepath))
+
+    finally:
+        nwispy.nwispy_viewer.submit_plots = submit_plots
+        shutil.rmtree(tempdir)
+
+def test_schedule_files():
+
+    file_list = [os.path.join(fixture["datafiles"], filename) for filename in ["03298500_dv.txt", "03287500_uv.txt", "missing_dv.txt", "03401385_uv.txt"]]
+
+    # largest first; a file that does not exist is last
+    actual = nwispy.schedule_files(file_list = file_list)
+
+    nose.tools.assert_equals(actual, [1, 3, 0, 2])
+
+def test_process_webrequest_pipeline():
+
+    server = nwispy_mockservice.start_server(values_per_day = {"dv": 1, "iv": 4})
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        request_file = os.path.join(tempdir, "requests.txt")
+        with open(request_file, "w") as f:
+            f.write("# data_type\tsite_num\tstart_date\tend_date\tparameters\n")
+            f.write("dv\t03284000\t2014-01-01\t2014-03-01\t00060\n")
+            f.write("iv\t03284000\t2014-02-14\t2014-02-21\t00060\t00065\n")
+            f.write("dv\t03290500\t2014-01-01\t2014-03-01\t00060\t00010\n")
+
+        arguments = nwispy.create_parser().parse_args(["--pipeline", "--queue-size", "1", "--preview", "--base-url", server.base_url, 
+                                                       "--site-cache", os.path.join(tempdir, "sites.json")])
+        actual = nwispy.process_webrequest(request_file = request_file, arguments = arguments)
+
+        nose.tools.assert_equals(len(actual["succeeded"]), 3)
+        nose.tools.assert_equals(len(actual["results"]), 3)
+        nose.tools.assert_equals(sorted(actual["stages"].keys()), ["download", "duration", "parse", "render"])
+
+        for result in actual["results"]:
+            nose.tools.assert_equals(result["error"], None)
+            nose.tools.assert_true(len(result["previews"]) > 0)
+            for filepath in result["previews"]:
+                nose.tools.assert_true(os.path.isfile(filepath))
+
+        # files processed in the pipeline are recorded and not processed again
+        web_filedir = os.path.join(tempdir, "requests-datafiles")
+        processed = nwispy_helpers.read_manifest(path = os.path.join(web_filedir, "processed.json"))
+        nose.tools.assert_equals(sorted(processed.keys()), sorted(os.path.basename(result["file"]) for result in actual["results"]))
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+def test_process_webrequest_pipeline_jobs():
+
+    server = nwispy_mockservice.start_server(values_per_day = {"dv": 1, "iv": 4})
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        request_file = os.path.join(tempdir, "requests.txt")
+        with open(request_file, "w") as f:
+            f.write("# data_type\tsite_num\tstart_date\tend_date\tparameters\n")
+            f.write("dv\t03284000\t2014-01-01\t2014-03-01\t00060\n")
+            f.write("iv\t03284000\t2014-02-14\t2014-02-21\t00060\t00065\n")
+            f.write("dv\t03290500\t2014-01-01\t2014-03-01\t00060\t00010\n")
+
+        # files are parsed and rendered in the pool of worker processes
+        arguments = nwispy.create_parser().parse_args(["--pipeline", "--jobs", "2", "--queue-size", "1", "--preview", "--verbose", 
+                                                       "--base-url", server.base_url, "--site-cache", os.path.join(tempdir, "sites.json")])
+        actual = nwispy.process_webrequest(request_file = request_file, arguments = arguments)
+
+        nose.tools.assert_equals(len(actual["succeeded"]), 3)
+        nose.tools.assert_equals(len(actual["results"]), 3)
+
+        for result in actual["results"]:
+            nose.tools.assert_equals(result["error"], None)
+            nose.tools.assert_true(result["durations"]["parse"] > 0)
+            nose.tools.assert_true(result["output"] != "")
+            nose.tools.assert_true(len(result["previews"]) > 0)
+            for filepath in result["previews"]:
+                nose.tools.assert_true(os.path.isfile(filepath))
+
+        nose.tools.assert_almost_equals(actual["stages"]["parse"], sum(result["durations"]["parse"] for result in actual["results"]))
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+def test_process_webrequest_sync():
+
+    server = nwispy_mockservice.start_server()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        request_file = os.path.join(tempdir, "requests.txt")
+        with open(request_file, "w") as f:
+            f.write("# data_type\tsite_num\tstart_date\tend_date\tparameters\n")
+            f.write("dv\t03287500\t2014-01-01\t2014-03-01\t00060\n")
+            f.write("dv\t03287500\t2014-01-01\t2014-02-01\t00010\n")
+            f.write("dv\t03290500\t2014-01-01\t2014-03-01\t00060\n")
+
+        arguments = nwispy.create_parser().parse_args(["--sync", "--download-jobs", "4", "--preview", "--base-url", server.base_url, 
+                                                       "--site-cache", os.path.join(tempdir, "sites.json")])
+        actual = nwispy.process_webrequest(request_file = request_file, arguments = arguments)
+
+        # the rows of the same site and data type are synced by one task, one after another
+        nose.tools.assert_equals(len(actual["succeeded"]), 2)
+        nose.tools.assert_equals(actual["failed"], [])
+
+        data = nwispy_filereader.read_file(os.path.join(tempdir, "requests-datafiles", "03287500_dv.txt"))
+        nose.tools.assert_equals(sorted(parameter["code"].split("_")[1] for parameter in data["parameters"]), ["00010", "00060"])
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+def test_process_webrequest_stream():
+
+    server = nwispy_mockservice.start_server(latency = 0.5)
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        request_file = os.path.join(tempdir, "requests.txt")
+        with open(request_file, "w") as f:
+            f.write("# data_type\tsite_num\tstart_date\tend_date\tparameters\n")
+            for site_number in ["03284000", "03287500", "03290500"]:
+                f.write("dv\t{}\t2014-01-01\t2014-03-01\t00060\n".format(site_number))
+
+        arguments = nwispy.create_parser().parse_args(["--stream", "--tee", "--download-jobs", "3", "--preview", "--base-url", server.base_url, 
+                                                       "--site-cache", os.path.join(tempdir, "sites.json")])
+        actual = nwispy.process_webrequest(request_file = request_file, arguments = arguments)
+
+        # responses are downloaded at the same time and plotted by the render stage
+        nose.tools.assert_true(actual["duration"] < 3 * 0.5)
+        nose.tools.assert_equals(len(actual["results"]), 3)
+        for result in actual["results"]:
+            nose.tools.assert_equals(result["error"], None)
+            nose.tools.assert_true(os.path.isfile(result["file"]))
+            for filepath in result["previews"]:
+                nose.tools.assert_true(os.path.isfile(filepath))
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
@@ -0,0 +1,217 @@
+import nose.tools
+from nose import with_setup
+
+import sys
+import os
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+import datetime
+
+# my module
+from nwispy import nwispy_viewer
+
+# define the global fixture to hold the data that goes into the functions you test
+fixture = {}
+
+def setup():
+    """ Setup fixture for testing """
+
+    print >> sys.stderr, "SETUP: nwispy_viewer tests"
+
+    dates = np.array([datetime.datetime(2014, 03, 01, 8, 0) + datetime.timedelta(i) for i in range(10)])
+    discharge_data = np.array([100.0 + i for i in range(10)])
+    conductance_data = np.array([250.0 + i for i in range(10)])
+
+    fixture["data"] = {
+        "gage_name": "USGS 03401385 DAVIS BRANCH AT HIGHWAY 988 NEAR MIDDLESBORO, KY",
+        "timestep": "daily",
+        "dates": dates,
+        "parameters": [
+            {"code": "06_00060_00003", "description": "Discharge, cubic feet per second (Mean)", "index": 3, "data": discharge_data,
+             "mean": np.mean(discharge_data), "max": np.max(discharge_data), "min": np.min(discharge_data)},
+            {"code": "04_00095", "description": "Specific conductance, water, unfiltered, microsiemens per centimeter at 25 degrees Celsius", 
+             "index": 5, "data": conductance_data, "mean": np.mean(conductance_data), "max": np.max(conductance_data), "min": np.min(conductance_data)}
+        ]
+    }
+
+def teardown():
+    """ Print to standard error when all tests are finished """
+    
+    print >> sys.stderr, "TEARDOWN: nwispy_viewer tests" 
+
+def test_get_plot_filepath():
+
+    actual = [nwispy_viewer.get_plot_filepath(nwis_data = fixture["data"], parameter = parameter, save_path = "output") 
+              for parameter in fixture["data"]["parameters"]]
+
+    expected = [os.path.join("output", "USGS 03401385 - Discharge, cubic feet per second (Mean).png"),
+                os.path.join("output", "USGS 03401385 - Specific conductance.png")]
+
+    nose.tools.assert_equals(actual, expected)
+
+def test_submit_plots():
+
+    tempdir = tempfile.mkdtemp()
+    pool = multiprocessing.Pool(processes = 2)
+    try:
+        results = nwispy_viewer.submit_plots(pool = pool, nwis_data = fixture["data"], save_path = tempdir)
+        actual = [result.get() for result in results]
+
+        expected = [nwispy_viewer.get_plot_filepath(nwis_data = fixture["data"], parameter = parameter, save_path = tempdir) 
+                    for parameter in fixture["data"]["parameters"]]
+
+        nose.tools.assert_equals(actual, expected)
+        for filepath in expected:
+            nose.tools.assert_true(os.path.getsize(filepath) > 0)
+
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(tempdir)
+
+def test_decimate_series():
+
+    values = np.sin(np.linspace(0, 100, 10000))
+    values[2500] = 10.0
+    values[5000:5100] = np.nan
+    dates = np.arange(len(values))
+
+    actual_dates, actual_values = nwispy_viewer.decimate_series(dates = dates, values = values, max_points = 500)
+
+    # about max_points points, peaks and gaps kept, dates in order
+    nose.tools.assert_true(len(actual_values) <= 500 + 500 / 2)
+    nose.tools.assert_equals(np.nanmax(actual_values), 10.0)
+    nose.tools.assert_equals(np.nanmin(actual_values), np.nanmin(values))
+    nose.tools.assert_true(np.isnan(actual_values).any())
+    nose.tools.assert_true(np.all(np.diff(actual_dates) > 0))
+    np.testing.assert_equal(values[actual_dates], actual_values)
+
+def test_decimate_series_short():
+
+    dates = fixture["data"]["dates"]
+    values = fixture["data"]["parameters"][0]["data"]
+
+    actual_dates, actual_values = nwispy_viewer.decimate_series(dates = dates, values = values, max_points = 2400)
+
+    np.testing.assert_equal(actual_dates, dates)
+    np.testing.assert_equal(actual_values, values)
+
+def test_get_dashboard_filepath():
+
+    actual = nwispy_viewer.get_dashboard_filepath(nwis_data = fixture["data"], save_path = "output")
+
+    expected = os.path.join("output", "USGS 03401385 - daily - dashboard.png")
+
+    nose.tools.assert_equals(actual, expected)
+
+def test_render_dashboard():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        actual = nwispy_viewer.render_dashboard(nwis_data = fixture["data"], save_path = tempdir)
+
+        expected = nwispy_viewer.get_dashboard_filepath(nwis_data = fixture["data"], save_path = tempdir)
+
+        nose.tools.assert_equals(actual, expected)
+        nose.tools.assert_equals(os.listdir(tempdir), [os.path.basename(expected)])
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_render_parameter_fingerprint():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        data = dict(fixture["data"], source_hash = "3e86a5be68de633b4a2dbd6557e7e92ab5994ab1")
+        parameter = data["parameters"][0]
+
+        filepath = nwispy_viewer.render_parameter(nwis_data = data, parameter = parameter, save_path = tempdir)
+        nose.tools.assert_true(nwispy_viewer.is_plot_current(filepath = filepath, 
+                                                             fingerprint = nwispy_viewer.get_plot_fingerprint(nwis_data = data, parameters = [parameter], decimate = True)))
+
+        # same data and settings; plot is not rendered again
+        os.utime(filepath, (0, 0))
+        nwispy_viewer.render_parameter(nwis_data = data, parameter = parameter, save_path = tempdir)
+        nose.tools.assert_equals(os.path.getmtime(filepath), 0)
+
+        # different settings or data; plot is rendered again
+        nwispy_viewer.render_parameter(nwis_data = data, parameter = parameter, save_path = tempdir, decimate = False)
+        nose.tools.assert_not_equal(os.path.getmtime(filepath), 0)
+
+        os.utime(filepath, (0, 0))
+        data["source_hash"] = "da39a3ee5e6b4b0d3255bfef95601890afd80709"
+        nwispy_viewer.render_parameter(nwis_data = data, parameter = parameter, save_path = tempdir, decimate = False)
+        nose.tools.assert_not_equal(os.path.getmtime(filepath), 0)
+
+        # no source file; always rendered
+        nose.tools.assert_equals(nwispy_viewer.get_plot_fingerprint(nwis_data = fixture["data"], parameters = [parameter], decimate = True), None)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_plot_data_visible_fingerprint():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        data = dict(fixture["data"], source_hash = "3e86a5be68de633b4a2dbd6557e7e92ab5994ab1")
+        parameter = data["parameters"][0]
+        fingerprint = nwispy_viewer.get_plot_fingerprint(nwis_data = data, parameters = [parameter], decimate = True)
+
+        filepath = nwispy_viewer.render_parameter(nwis_data = data, parameter = parameter, save_path = tempdir)
+        nose.tools.assert_true(nwispy_viewer.is_plot_current(filepath = filepath, fingerprint = fingerprint))
+
+        # a shown plot is saved without decimation; the decimated plot is rendered again
+        nwispy_viewer.plot_data(nwis_data = data, is_visible = True, save_path = tempdir)
+        nose.tools.assert_false(nwispy_viewer.is_plot_current(filepath = filepath, fingerprint = fingerprint))
+        nose.tools.assert_true(nwispy_viewer.is_plot_current(filepath = filepath, 
+                                                             fingerprint = nwispy_viewer.get_plot_fingerprint(nwis_data = data, parameters = [parameter], 
+                                                                                                              decimate = False)))
+
+        os.utime(filepath, (0, 0))
+        nwispy_viewer.render_parameter(nwis_data = data, parameter = parameter, save_path = tempdir)
+        nose.tools.assert_not_equal(os.path.getmtime(filepath), 0)
+
+        # a figure saved without a fingerprint removes the fingerprint of the earlier plot
+        nwispy_viewer.plot_data(nwis_data = fixture["data"], is_visible = True, save_path = tempdir)
+        nose.tools.assert_false(os.path.isfile(filepath + ".fingerprint"))
+
+    finally:
+        nwispy_viewer.plt.close("all")
+        shutil.rmtree(tempdir)
+
+def test_render_preview():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        parameter = fixture["data"]["parameters"][0]
+        actual = nwispy_viewer.render_preview(nwis_data = fixture["data"], parameter = parameter, save_path = tempdir)
+
+        expected = os.path.join(tempdir, "USGS 03401385 - Discharge, cubic feet per second (Mean) - preview.png")
+
+        nose.tools.assert_equals(actual, expected)
+        nose.tools.assert_true(os.path.getsize(expected) > 0)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_create_contact_sheet():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        previews = [nwispy_viewer.render_preview(nwis_data = fixture["data"], parameter = parameter, save_path = tempdir) 
+                    for parameter in fixture["data"]["parameters"]]
+        sheet_path = os.path.join(tempdir, "sheet.png")
+
+        # two rows; one of two previews and one of a single preview
+        actual = nwispy_viewer.create_contact_sheet(filepaths = [previews, [], previews[:1]], sheet_path = sheet_path, padding = 2)
+
+        width, height = [int(size * nwispy_viewer.PLOT_DPI) for size in nwispy_viewer.PREVIEW_FIGSIZE]
+        expected = (2 * (height + 4), 2 * (width + 4))
+
+        nose.tools.assert_equals(actual, expected)
+        nose.tools.assert_true(os.path.getsize(sheet_path) > 0)
+
+    finally:
+        shutil.rmtree(tempdir)
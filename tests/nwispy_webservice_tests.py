@@ -2,12 +2,22 @@ import nose.tools
 from nose import with_setup
 
 import sys
+import os
+import shutil
+import tempfile
+import gzip
+import time
+import threading
+import BaseHTTPServer
+import urllib2
 import numpy as np
 import datetime
 from StringIO import StringIO
 
 # my module
 from nwispy import nwispy_webservice
+from nwispy import nwispy_mockservice
+from nwispy import nwispy_filereader
 
 
 
@@ -53,6 +63,60 @@ def setup():
         }
     ]
 
+    fixture["rdb window 1"] = "\n".join([
+        "# retrieved: 2014-03-11 08:40:40 EDT",
+        "# Data provided for site 03284000",
+        "#    DD parameter statistic   Description",
+        "#    06   00060     00003     Discharge, cubic feet per second (Mean)",
+        "agency_cd\tsite_no\tdatetime\t06_00060_00003\t06_00060_00003_cd",
+        "5s\t15s\t20d\t14n\t10s",
+        "USGS\t03284000\t2014-01-01\t171\tA",
+        "USGS\t03284000\t2014-01-02\t190\tA",
+        ""
+    ])
+
+    fixture["rdb window 2"] = "\n".join([
+        "# retrieved: 2014-03-11 08:40:41 EDT",
+        "# Data provided for site 03284000",
+        "#    DD parameter statistic   Description",
+        "#    06   00060     00003     Discharge, cubic feet per second (Mean)",
+        "#    07   00065     00003     Gage height, feet (Mean)",
+        "agency_cd\tsite_no\tdatetime\t06_00060_00003\t06_00060_00003_cd\t07_00065_00003\t07_00065_00003_cd",
+        "5s\t15s\t20d\t14n\t10s\t14n\t10s",
+        "USGS\t03284000\t2014-01-02\t195\tP\t2.1\tP",
+        "USGS\t03284000\t2014-01-03\t164\tP\t2.0\tP",
+        ""
+    ])
+
+    fixture["rdb multi site"] = "\n".join([
+        "# retrieved: 2014-03-11 08:40:40 EDT",
+        "#",
+        "# Data for the following 2 site(s) are contained in this file",
+        "#    USGS 03284000 KENTUCKY RIVER AT LOCK 10 NEAR WINCHESTER, KY",
+        "#    USGS 03290500 KENTUCKY RIVER AT LOCK 2 AT LOCKPORT, KY",
+        "# -----------------------------------------------------------------------------------",
+        "#",
+        "# Data provided for site 03284000",
+        "#    DD parameter statistic   Description",
+        "#    06   00060     00003     Discharge, cubic feet per second (Mean)",
+        "#    07   00065     00003     Gage height, feet (Mean)",
+        "#",
+        "agency_cd\tsite_no\tdatetime\t06_00060_00003\t06_00060_00003_cd\t07_00065_00003\t07_00065_00003_cd",
+        "5s\t15s\t20d\t14n\t10s\t14n\t10s",
+        "USGS\t03284000\t2014-01-01\t171\tA\t2.1\tA",
+        "USGS\t03284000\t2014-01-02\t190\tA\t2.2\tA",
+        "#",
+        "# Data provided for site 03290500",
+        "#    DD parameter statistic   Description",
+        "#    02   00060     00003     Discharge, cubic feet per second (Mean)",
+        "#",
+        "agency_cd\tsite_no\tdatetime\t02_00060_00003\t02_00060_00003_cd",
+        "5s\t15s\t20d\t14n\t10s",
+        "USGS\t03290500\t2014-01-01\t5000\tA",
+        "USGS\t03290500\t2014-01-02\t5100\tA",
+        ""
+    ])
+
 def teardown():
     """ Print to standard error when all tests are finished """
     
@@ -93,6 +157,50 @@ def test_read_webrequest_in():
     nose.tools.assert_equals(data["requests"][1]["end date"], expected2["end date"])  
     nose.tools.assert_equals(data["requests"][1]["parameters"], expected2["parameters"]) 
 
+def test_read_webrequest_in_errors():
+
+    fileobj = StringIO("\n".join([
+        "# data_type\tsite_num\tstart_date\tend_date\tparameters",
+        "dv\t03284000\t2014-01-01\t2014-03-10\t00060\t",
+        "dv\t03284000\t2014-01-01\t2014-03-10\t00060",
+        "dv\t03284000\t2014-13-01\t2014-03-10\t00060",
+        "xx\t03284000\t2014-01-01\t2014-03-10\t00060",
+        "iv\t03284000\t2014-03-10\t2014-01-01\t00060",
+        "iv\t03284000\t2014-01-01\t2014-01-10\t60",
+        "iv\t03284000\t2014-01-01\t2014-01-10",
+        "site\t03284000",
+        ""
+    ]))
+
+    data = nwispy_webservice.read_webrequest_in(fileobj)
+
+    nose.tools.assert_equals(len(data["requests"]), 2)
+    nose.tools.assert_equals(data["requests"][1]["data type"], "site")
+    nose.tools.assert_equals([error["line number"] for error in data["errors"]], [4, 5, 6, 7, 8])
+    nose.tools.assert_equals(data["column names"], ["data_type", "site_num", "start_date", "end_date", "parameters"])
+
+def test_merge_requests():
+
+    data_requests = [
+        {"data type": "dv", "site number": "03284000", "start date": "2014-01-01", "end date": "2014-03-10", "parameters": ["00060", "00065"]},
+        {"data type": "iv", "site number": "03284000", "start date": "2014-02-12", "end date": "2014-02-19", "parameters": ["00060"]},
+        {"data type": "dv", "site number": "03284000", "start date": "2014-03-01", "end date": "2014-04-01", "parameters": ["00060"]},
+        {"data type": "dv", "site number": "03284000", "start date": "2014-03-11", "end date": "2014-03-20", "parameters": ["00065"]},
+        {"data type": "dv", "site number": "03284000", "start date": "2014-06-01", "end date": "2014-06-30", "parameters": ["00060"]}
+    ]
+
+    expected = [
+        ("dv", "2014-01-01", "2014-04-01", ["00060"]),
+        ("dv", "2014-06-01", "2014-06-30", ["00060"]),
+        ("dv", "2014-01-01", "2014-03-20", ["00065"]),
+        ("iv", "2014-02-12", "2014-02-19", ["00060"])
+    ]
+
+    actual = [(request["data type"], request["start date"], request["end date"], request["parameters"]) 
+              for request in nwispy_webservice.merge_requests(data_requests = data_requests)]
+
+    nose.tools.assert_equals(actual, expected)
+
 def test_endcode_url():
 
     expected_url = ["parameterCD=00060&endDt=2014-01-15&startDt=2014-01-01&site=03284000&format=rdb",
@@ -108,3 +216,630 @@ def test_endcode_url():
     nose.tools.assert_equals(actual_url[1], expected_url[1])
     nose.tools.assert_equals(actual_url[2], expected_url[2])
     nose.tools.assert_equals(actual_url[3], expected_url[3])
+
+def test_stream_to_file():
+
+    content = "\n".join(["USGS\t03284000\t2014-01-{0:02d}\t{0}\tP".format(i) for i in range(1, 31)])
+    
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03284000_dv.txt")
+        
+        download_info = nwispy_webservice.stream_to_file(stream = StringIO(content), filepath = filepath, chunk_size = 16)
+
+        with open(filepath, "rb") as f:
+            actual_content = f.read()
+
+        nose.tools.assert_equals(actual_content, content)
+        nose.tools.assert_equals(download_info["filepath"], filepath)
+        nose.tools.assert_equals(download_info["bytes"], len(content))
+        nose.tools.assert_true(download_info["duration"] >= 0)
+        nose.tools.assert_false(os.path.exists(filepath + ".part"))
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_stream_to_file_decompress():
+
+    content = "\n".join(["USGS\t03284000\t2014-01-{0:02d}\t{0}\tP".format(i) for i in range(1, 31)])
+
+    compressed = StringIO()
+    with gzip.GzipFile(fileobj = compressed, mode = "wb") as f:
+        f.write(content)
+    
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03284000_dv.txt")
+        
+        download_info = nwispy_webservice.stream_to_file(stream = StringIO(compressed.getvalue()), filepath = filepath, chunk_size = 16, decompress = True)
+
+        with open(filepath, "rb") as f:
+            actual_content = f.read()
+
+        nose.tools.assert_equals(actual_content, content)
+        nose.tools.assert_equals(download_info["bytes"], len(compressed.getvalue()))
+        nose.tools.assert_equals(download_info["bytes written"], len(content))
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_read_lines():
+
+    content = "\n".join(["USGS\t03284000\t2014-01-{0:02d}\t{0}\tP".format(i) for i in range(1, 31)])
+
+    compressed = StringIO()
+    with gzip.GzipFile(fileobj = compressed, mode = "wb") as f:
+        f.write(content)
+    
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03284000_dv.txt")
+        
+        lines = list(nwispy_webservice.read_lines(stream = StringIO(compressed.getvalue()), chunk_size = 16, decompress = True, tee_filepath = filepath))
+
+        with open(filepath, "rb") as f:
+            actual_content = f.read()
+
+        nose.tools.assert_equals(lines, StringIO(content).readlines())
+        nose.tools.assert_equals(actual_content, content)
+        nose.tools.assert_false(os.path.exists(filepath + ".part"))
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_get_cache_key():
+
+    key_dv = nwispy_webservice.get_cache_key(user_parameters_url = "parameterCD=00060&endDt=2014-01-15&startDt=2014-01-01&site=03284000&format=rdb", data_type = "dv")
+    key_iv = nwispy_webservice.get_cache_key(user_parameters_url = "parameterCD=00060&endDt=2014-01-15&startDt=2014-01-01&site=03284000&format=rdb", data_type = "iv")
+    key_dv_again = nwispy_webservice.get_cache_key(user_parameters_url = "parameterCD=00060&endDt=2014-01-15&startDt=2014-01-01&site=03284000&format=rdb", data_type = "dv")
+
+    nose.tools.assert_equals(key_dv, key_dv_again)
+    nose.tools.assert_not_equals(key_dv, key_iv)
+
+def test_download_file_cache_hit():
+
+    content = "USGS\t03284000\t2014-01-01\t171\tP\n"
+    request_url = nwispy_webservice.encode_url(fixture["data requests"][0])
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache = nwispy_webservice.open_cache(directory = os.path.join(tempdir, "cache"), ttl = 3600)
+        key = nwispy_webservice.get_cache_key(user_parameters_url = request_url, data_type = "dv")
+        
+        with open(nwispy_webservice.get_cache_body_path(cache = cache, key = key), "wb") as f:
+            f.write(content)
+
+        nwispy_webservice.write_cache_entry(cache = cache, key = key, cache_entry = {"url": request_url, "data type": "dv", "etag": None, 
+                                                                                     "last modified": None, "time": time.time(), "compressed": False})
+
+        # a fresh cache entry without validators is served without contacting the web service
+        download_info = nwispy_webservice.download_file(user_parameters_url = request_url, data_type = "dv", filename = "03284000_dv.txt", 
+                                                        file_destination = tempdir, cache = cache)
+
+        with open(os.path.join(tempdir, "03284000_dv.txt"), "rb") as f:
+            actual_content = f.read()
+
+        nose.tools.assert_equals(actual_content, content)
+        nose.tools.assert_true(download_info["cached"])
+        nose.tools.assert_equals(cache["hits"], 1)
+        nose.tools.assert_equals(cache["misses"], 0)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_download_file_cache_revalidate():
+
+    server = nwispy_mockservice.start_server()
+
+    request_url = nwispy_webservice.encode_url(fixture["data requests"][0])
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        # a stale cache entry with an ETag is revalidated; a 304 is served from the cache, with and without resume
+        for resume in [False, True]:
+            cache = nwispy_webservice.open_cache(directory = os.path.join(tempdir, "cache-{}".format(resume)), ttl = 0)
+            stats = dict(server.stats)
+
+            download_info = nwispy_webservice.download_file(user_parameters_url = request_url, data_type = "dv", filename = "first.txt", 
+                                                            file_destination = tempdir, cache = cache, resume = resume, base_url = server.base_url)
+            nose.tools.assert_false(download_info["cached"])
+
+            download_info = nwispy_webservice.download_file(user_parameters_url = request_url, data_type = "dv", filename = "second.txt", 
+                                                            file_destination = tempdir, cache = cache, resume = resume, base_url = server.base_url)
+            nose.tools.assert_true(download_info["cached"])
+
+            with open(os.path.join(tempdir, "first.txt"), "rb") as f:
+                expected = f.read()
+            with open(os.path.join(tempdir, "second.txt"), "rb") as f:
+                actual = f.read()
+
+            nose.tools.assert_equals(actual, expected)
+            nose.tools.assert_equals(cache["hits"], 1)
+            nose.tools.assert_equals(cache["misses"], 1)
+            nose.tools.assert_equals(server.stats["requests"] - stats["requests"], 2)
+            nose.tools.assert_equals(server.stats["not modified"] - stats["not modified"], 1)
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+def test_plan_windows_water_year():
+
+    expected = [("1999-01-01", "1999-09-30"), ("1999-10-01", "2000-09-30"), ("2000-10-01", "2001-03-17")]
+
+    actual = nwispy_webservice.plan_windows(start_date = "1999-01-01", end_date = "2001-03-17", window = "wy")
+
+    nose.tools.assert_equals(actual, expected)
+
+def test_plan_windows_days():
+
+    expected = [("2014-01-01", "2014-01-30"), ("2014-01-31", "2014-03-01"), ("2014-03-02", "2014-03-02")]
+
+    actual = nwispy_webservice.plan_windows(start_date = "2014-01-01", end_date = "2014-03-02", window = "30")
+
+    nose.tools.assert_equals(actual, expected)
+
+def test_plan_windows_single_day():
+
+    nose.tools.assert_equals(nwispy_webservice.plan_windows(start_date = "2014-1-5", end_date = "2014-1-5", window = "wy"), [("2014-01-05", "2014-01-05")])
+
+def test_plan_windows_invalid():
+
+    # a window that does not advance would never end
+    for window in [0, "-5", "month"]:
+        nose.tools.assert_raises(ValueError, nwispy_webservice.plan_windows, start_date = "2014-01-01", end_date = "2014-03-02", window = window)
+
+def test_read_rdb_blocks():
+
+    blocks = nwispy_webservice.read_rdb_blocks(StringIO(fixture["rdb window 1"] + fixture["rdb window 2"]))
+
+    nose.tools.assert_equals(len(blocks), 2)
+    nose.tools.assert_equals(len(blocks[0]["comments"]), 4)
+    nose.tools.assert_equals(blocks[0]["column names"][3], "06_00060_00003")
+    nose.tools.assert_equals(blocks[1]["column formats"][-1], "10s")
+    nose.tools.assert_equals(blocks[1]["rows"][1], ["USGS", "03284000", "2014-01-03", "164", "P", "2.0", "P"])
+
+def test_merge_rdb_files():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepaths = [os.path.join(tempdir, "window1.rdb"), os.path.join(tempdir, "window2.rdb")]
+        for filepath, name in zip(filepaths, ["rdb window 1", "rdb window 2"]):
+            with open(filepath, "w") as f:
+                f.write(fixture[name])
+
+        outputfile = os.path.join(tempdir, "03284000_dv.txt")
+        nwispy_webservice.merge_rdb_files(filepaths = filepaths, outputfile = outputfile)
+
+        with open(outputfile, "r") as f:
+            blocks = nwispy_webservice.read_rdb_blocks(f)
+
+        nose.tools.assert_equals(len(blocks), 1)
+        nose.tools.assert_equals(blocks[0]["column names"], ["agency_cd", "site_no", "datetime", "06_00060_00003", "06_00060_00003_cd", "07_00065_00003", "07_00065_00003_cd"])
+        nose.tools.assert_equals(blocks[0]["rows"], [["USGS", "03284000", "2014-01-01", "171", "A", "", ""], 
+                                                     ["USGS", "03284000", "2014-01-02", "195", "P", "2.1", "P"],
+                                                     ["USGS", "03284000", "2014-01-03", "164", "P", "2.0", "P"]])
+        nose.tools.assert_equals(len([line for line in blocks[0]["comments"] if "Discharge" in line]), 1)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_plan_coalesced_requests():
+
+    data_requests = [
+        {"data type": "dv", "site number": "03284000", "start date": "2014-01-01", "end date": "2014-01-15", "parameters": ["00060"]},
+        {"data type": "dv", "site number": "03290500", "start date": "2014-01-01", "end date": "2014-01-15", "parameters": ["00060", "00065"]},
+        {"data type": "iv", "site number": "03290500", "start date": "2014-01-01", "end date": "2014-01-15", "parameters": ["00060"]},
+        {"data type": "dv", "site number": "03298500", "start date": "2014-01-01", "end date": "2014-01-15", "parameters": ["00060"]},
+        {"data type": "site", "site number": "03298500", "start date": "", "end date": "", "parameters": ""}
+    ]
+
+    request_groups = nwispy_webservice.plan_coalesced_requests(data_requests = data_requests)
+
+    nose.tools.assert_equals(len(request_groups), 3)
+    nose.tools.assert_equals(request_groups[0]["site number"], "03284000,03290500,03298500")
+    nose.tools.assert_equals(request_groups[0]["parameters"], ["00060", "00065"])
+    nose.tools.assert_equals(request_groups[0]["requests"], [data_requests[0], data_requests[1], data_requests[3]])
+    nose.tools.assert_equals(request_groups[1]["requests"], [data_requests[2]])
+    nose.tools.assert_equals(request_groups[2]["requests"], [data_requests[4]])
+
+def test_plan_coalesced_requests_limits():
+
+    data_requests = [
+        {"data type": "dv", "site number": "03284000", "start date": "2014-01-01", "end date": "2014-01-10", "parameters": ["00060"]},
+        {"data type": "dv", "site number": "03290500", "start date": "2014-01-01", "end date": "2014-01-10", "parameters": ["00060"]},
+        {"data type": "dv", "site number": "03298500", "start date": "2014-01-01", "end date": "2014-01-10", "parameters": ["00060"]}
+    ]
+
+    # 10 days x 1 parameter per site; a limit of 20 values allows 2 sites per call
+    request_groups = nwispy_webservice.plan_coalesced_requests(data_requests = data_requests, max_values = 20)
+
+    nose.tools.assert_equals([request_group["site number"] for request_group in request_groups], ["03284000,03290500", "03298500"])
+
+    # a url limit shorter than a single site url leaves every request on its own
+    request_groups = nwispy_webservice.plan_coalesced_requests(data_requests = data_requests, max_url_length = 10)
+
+    nose.tools.assert_equals(len(request_groups), 3)
+
+def test_split_rdb_file():
+
+    data_requests = [
+        {"data type": "dv", "site number": "03290500", "start date": "2014-01-01", "end date": "2014-01-02", "parameters": ["00060"]},
+        {"data type": "dv", "site number": "03284000", "start date": "2014-01-01", "end date": "2014-01-02", "parameters": ["00065"]},
+        {"data type": "dv", "site number": "03298500", "start date": "2014-01-01", "end date": "2014-01-02", "parameters": ["00060"]}
+    ]
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "coalesced.rdb")
+        with open(filepath, "w") as f:
+            f.write(fixture["rdb multi site"])
+
+        outputfiles = [os.path.join(tempdir, "{}.txt".format(i)) for i in range(3)]
+        filepaths = nwispy_webservice.split_rdb_file(filepath = filepath, data_requests = data_requests, outputfiles = outputfiles)
+
+        nose.tools.assert_equals(filepaths, [outputfiles[0], outputfiles[1], None])
+
+        with open(outputfiles[0], "r") as f:
+            blocks = nwispy_webservice.read_rdb_blocks(f)
+
+        nose.tools.assert_equals(len(blocks), 1)
+        nose.tools.assert_equals(blocks[0]["column names"], ["agency_cd", "site_no", "datetime", "02_00060_00003", "02_00060_00003_cd"])
+        nose.tools.assert_equals(blocks[0]["rows"][1], ["USGS", "03290500", "2014-01-02", "5100", "A"])
+        nose.tools.assert_false(any("03284000" in line for line in blocks[0]["comments"]))
+
+        with open(outputfiles[1], "r") as f:
+            blocks = nwispy_webservice.read_rdb_blocks(f)
+
+        nose.tools.assert_equals(blocks[0]["column names"], ["agency_cd", "site_no", "datetime", "07_00065_00003", "07_00065_00003_cd"])
+        nose.tools.assert_equals(blocks[0]["rows"][0], ["USGS", "03284000", "2014-01-01", "2.1", "A"])
+        nose.tools.assert_false(any("Discharge" in line for line in blocks[0]["comments"]))
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_get_last_dates():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03284000_dv.txt")
+        with open(filepath, "w") as f:
+            f.write(fixture["rdb window 1"] + fixture["rdb window 2"].replace("\t2.0\tP", "\t\t"))
+
+        last_dates = nwispy_webservice.get_last_dates(filepath = filepath)
+
+        nose.tools.assert_equals(last_dates, {"00060": "2014-01-03", "00065": "2014-01-02"})
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_plan_sync_request():
+
+    data_request = {"data type": "dv", "site number": "03284000", "start date": "2013-12-01", "end date": "2014-01-31", "parameters": ["00060"]}
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03284000_dv.txt")
+
+        # no local file; request everything
+        nose.tools.assert_equals(nwispy_webservice.plan_sync_request(data_request = data_request, filepath = filepath), data_request)
+
+        with open(filepath, "w") as f:
+            f.write(fixture["rdb window 2"])
+
+        # request the tail starting at the last local date minus the overlap
+        sync_request = nwispy_webservice.plan_sync_request(data_request = data_request, filepath = filepath, overlap = 2)
+
+        nose.tools.assert_equals(sync_request["start date"], "2014-01-01")
+        nose.tools.assert_equals(sync_request["end date"], "2014-01-31")
+        nose.tools.assert_equals(sync_request["parameters"], ["00060"])
+
+        # the request is already covered by the local file
+        data_request["end date"] = "2014-01-02"
+        nose.tools.assert_equals(nwispy_webservice.plan_sync_request(data_request = data_request, filepath = filepath, overlap = 0), None)
+
+        # a parameter without local values needs the full date range
+        data_request["parameters"] = ["00060", "00010"]
+        nose.tools.assert_equals(nwispy_webservice.plan_sync_request(data_request = data_request, filepath = filepath)["start date"], "2013-12-01")
+
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_sync_file_parameters():
+
+    server = nwispy_mockservice.start_server()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "03287500_dv.txt")
+
+        # request rows of two parameters of the same site share the sync file; the second sync of 00060 has nothing new
+        for parameter in ["00060", "00010", "00060"]:
+            data_request = {"data type": "dv", "site number": "03287500", "start date": "2014-01-01", "end date": "2014-01-10", "parameters": [parameter]}
+            nwispy_webservice.sync_file(data_request = data_request, filepath = filepath, overlap = 2, base_url = server.base_url)
+
+        data = nwispy_filereader.read_file(filepath)
+
+        nose.tools.assert_equals(len(data["dates"]), 10)
+        nose.tools.assert_equals(sorted(parameter["code"].split("_")[1] for parameter in data["parameters"]), ["00010", "00060"])
+        for parameter in data["parameters"]:
+            nose.tools.assert_false(np.isnan(parameter["data"]).any())
+
+        # the header only holds the retrieved line of the latest download
+        with open(filepath, "r") as f:
+            nose.tools.assert_equals(len([line for line in f if line.startswith("# retrieved:")]), 1)
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+class _StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Stand-in for the NWIS web service; throttles (429) then fails (503) the first two calls of each request """
+
+    calls = {}
+
+    def do_POST(self):
+        query = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        _StandInHandler.calls[query] = _StandInHandler.calls.get(query, 0) + 1
+
+        if "site=99999999" in query or _StandInHandler.calls[query] == 2:
+            self.send_response(503)
+            self.end_headers()
+        elif _StandInHandler.calls[query] == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+        else:
+            body = fixture["rdb window 1"]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def test_run_tasks():
+
+    _StandInHandler.calls = {}
+    server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), _StandInHandler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    base_url = "http://127.0.0.1:{}/nwis/".format(server.server_address[1])
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        rate_limiter = nwispy_webservice.create_rate_limiter(rate = 100)
+        
+        tasks = []
+        for site in ["03284000", "03290500", "03298500", "99999999"]:
+            request = dict(fixture["data requests"][0], **{"site number": site})
+            tasks.append({"name": site, 
+                          "function": nwispy_webservice.download_file, 
+                          "kwargs": {"user_parameters_url": nwispy_webservice.encode_url(request), "data_type": "dv", 
+                                     "filename": site + "_dv.txt", "file_destination": tempdir, "rate_limiter": rate_limiter, 
+                                     "base_url": base_url}})
+
+        report = nwispy_webservice.run_tasks(tasks = tasks, jobs = 2, retries = 3, backoff = 0.01)
+
+        nose.tools.assert_equals(len(report["latencies"]), len(tasks))
+        nose.tools.assert_equals(sorted(report["succeeded"]), ["03284000", "03290500", "03298500"])
+        nose.tools.assert_equals(len(report["failed"]), 1)
+        nose.tools.assert_equals(report["failed"][0]["name"], "99999999")
+        nose.tools.assert_equals(report["failed"][0]["attempts"], 4)
+        nose.tools.assert_equals(report["attempts"], 3 * 3 + 4)
+        nose.tools.assert_true(os.path.exists(os.path.join(tempdir, "03290500_dv.txt")))
+        nose.tools.assert_false(os.path.exists(os.path.join(tempdir, "99999999_dv.txt")))
+
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tempdir)
+
+def test_run_tasks_not_retryable():
+
+    def not_found():
+        raise nwispy_webservice.urllib2.HTTPError("http://127.0.0.1/nwis/dv/", 404, "Not Found", None, None)
+
+    report = nwispy_webservice.run_tasks(tasks = [{"name": "not found", "function": not_found, "kwargs": {}}], retries = 3, backoff = 0.01)
+
+    nose.tools.assert_equals(report["failed"][0]["attempts"], 1)
+
+def test_run_tasks_windows_retries():
+
+    server = nwispy_mockservice.start_server(error_rate = 1.0, error_code = 503)
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        request = {"data type": "dv", "site number": "03284000", "start date": "2014-01-01", "end date": "2014-01-20", "parameters": ["00060"]}
+        task = {"name": "split", "function": nwispy_webservice.download_windows, "retries": 0,
+                "kwargs": {"data_request": request, "filename": "03284000_dv.txt", "file_destination": tempdir, "window": 10, 
+                           "retries": 2, "backoff": 0.01, "base_url": server.base_url}}
+
+        start_time = time.time()
+        report = nwispy_webservice.run_tasks(tasks = [task], retries = 3, backoff = 0.01)
+
+        # each of the 2 windows is attempted retries + 1 times and the task is not retried
+        nose.tools.assert_equals(report["failed"][0]["attempts"], 1)
+        nose.tools.assert_equals(server.stats["requests"], 2 * 3)
+        nose.tools.assert_true(time.time() - start_time < nwispy_webservice.BACKOFF)
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+def test_acquire_token():
+
+    rate_limiter = nwispy_webservice.create_rate_limiter(rate = 50, burst = 1)
+
+    start_time = time.time()
+    for i in range(11):
+        nwispy_webservice.acquire_token(rate_limiter = rate_limiter)
+    duration = time.time() - start_time
+
+    # the first token is in the bucket; the other 10 arrive at 50 per second
+    nose.tools.assert_true(duration >= 0.19)
+
+def test_write_webrequest():
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tempdir, "requests-failed.txt")
+        
+        nwispy_webservice.write_webrequest(filepath = filepath, data_requests = fixture["data requests"][0:3])
+        data = nwispy_webservice.read_webrequest(filepath = filepath, merge = False)
+
+        nose.tools.assert_equals(data["requests"], fixture["data requests"][0:3])
+
+    finally:
+        shutil.rmtree(tempdir)
+
+class _RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Stand-in for the NWIS web service that supports Range requests and drops the first transfer halfway """
+
+    ranges = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        body = fixture["rdb window 1"]
+
+        byte_range = self.headers.getheader("Range")
+        _RangeHandler.ranges.append(byte_range)
+
+        if byte_range:
+            start = int(byte_range.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(body) - 1, len(body)))
+            self.send_header("Content-Length", str(len(body) - start))
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(body[start:])
+        else:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(body[:len(body) / 2])
+
+    def log_message(self, *args):
+        pass
+
+def test_download_file_resume():
+
+    _RangeHandler.ranges = []
+    server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), _RangeHandler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    base_url = "http://127.0.0.1:{}/nwis/".format(server.server_address[1])
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        request_url = nwispy_webservice.encode_url(fixture["data requests"][0])
+        body = fixture["rdb window 1"]
+
+        # the first transfer is interrupted; the bytes received are kept
+        nose.tools.assert_raises(IOError, nwispy_webservice.download_file, user_parameters_url = request_url, data_type = "dv", 
+                                 filename = "first.txt", file_destination = tempdir, resume = True, base_url = base_url)
+
+        nose.tools.assert_false(os.path.exists(os.path.join(tempdir, "first.txt")))
+
+        # the second transfer only requests the missing bytes
+        download_info = nwispy_webservice.download_file(user_parameters_url = request_url, data_type = "dv", 
+                                                        filename = "second.txt", file_destination = tempdir, resume = True, base_url = base_url)
+
+        with open(os.path.join(tempdir, "second.txt"), "rb") as f:
+            actual_content = f.read()
+
+        nose.tools.assert_equals(actual_content, body)
+        nose.tools.assert_equals(_RangeHandler.ranges, [None, "bytes={}-".format(len(body) / 2)])
+        nose.tools.assert_equals(download_info["resumed from"], len(body) / 2)
+        nose.tools.assert_equals(download_info["bytes"], len(body) - len(body) / 2)
+        nose.tools.assert_false(os.path.exists(os.path.join(tempdir, "partial")))
+
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tempdir)
+
+def test_mockservice_download_file():
+
+    server = nwispy_mockservice.start_server(values_per_day = {"dv": 1, "iv": 4})
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        for request in fixture["data requests"][1:3]:
+            download_info = nwispy_webservice.download_file(user_parameters_url = nwispy_webservice.encode_url(request), data_type = request["data type"], 
+                                                            filename = request["data type"] + ".txt", file_destination = tempdir, base_url = server.base_url)
+
+            data = nwispy_filereader.read_file(download_info["filepath"])
+
+            nose.tools.assert_equals([parameter["code"].split("_")[1] for parameter in data["parameters"]], request["parameters"])
+            nose.tools.assert_equals(data["dates"][0], datetime.datetime.strptime(request["start date"], "%Y-%m-%d"))
+
+        nose.tools.assert_equals(len(data["dates"]), 8 * 4)
+        nose.tools.assert_equals(server.stats["requests"], 2)
+        nose.tools.assert_true(server.stats["bytes sent"] > 0)
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+def test_mockservice_get_etag():
+
+    data_request = nwispy_mockservice.parse_query(query = nwispy_webservice.encode_url(fixture["data requests"][0]))
+    body = nwispy_mockservice.create_rdb(data_request = data_request, data_type = "dv")
+    retrieved = next(line for line in body.splitlines() if line.startswith("# retrieved:"))
+
+    # the retrieved date changes with every request, the data does not
+    actual = nwispy_mockservice.get_etag(body = body.replace(retrieved, "# retrieved: 2014-03-20 22:28:47"))
+    expected = nwispy_mockservice.get_etag(body = body.replace(retrieved, "# retrieved: 2014-03-20 22:28:48"))
+
+    nose.tools.assert_equals(actual, expected)
+    nose.tools.assert_not_equals(actual, nwispy_mockservice.get_etag(body = body.replace("USGS\t", "USGS\t0", 1)))
+
+def test_mockservice_error_injection():
+
+    server = nwispy_mockservice.start_server(error_rate = 1.0, error_code = 503)
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        request = fixture["data requests"][0]
+        nose.tools.assert_raises(urllib2.HTTPError, nwispy_webservice.download_file, user_parameters_url = nwispy_webservice.encode_url(request), 
+                                 data_type = "dv", filename = "dv.txt", file_destination = tempdir, base_url = server.base_url)
+
+        nose.tools.assert_equals(server.stats["errors"], 1)
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)
+
+def test_get_site_metadata():
+
+    server = nwispy_mockservice.start_server()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache_file = os.path.join(tempdir, "cache", "sites.json")
+
+        sites = nwispy_webservice.get_site_metadata(site_numbers = ["03284000", "03290500", "99999999"], cache_file = cache_file, 
+                                                    batch_size = 2, base_url = server.base_url)
+
+        nose.tools.assert_equals(sorted(sites.keys()), ["03284000", "03290500"])
+        nose.tools.assert_equals(sites["03284000"]["name"], "SYNTHETIC STREAM AT MOCK SITE 03284000")
+        nose.tools.assert_equals(sites["03284000"]["time zone"], "EST")
+        nose.tools.assert_true(isinstance(sites["03284000"]["drainage area"], float))
+        nose.tools.assert_equals(server.stats["requests"], 2)
+
+        # cached sites are not downloaded again
+        sites = nwispy_webservice.get_site_metadata(site_numbers = ["03290500"], cache_file = cache_file, base_url = server.base_url)
+
+        nose.tools.assert_equals(sites.keys(), ["03290500"])
+        nose.tools.assert_equals(server.stats["requests"], 2)
+
+    finally:
+        nwispy_mockservice.stop_server(server)
+        shutil.rmtree(tempdir)